@@ -0,0 +1,91 @@
+"""Benchmark formatting a PMID citation directly against the pybtex BibTeX round trip.
+
+Uses the records of tests/data/apa_citations.json and tests/data/apa_citations_sampled.json, so it does not need
+the PubMed archive. With --sample N, it first replaces the sampled records by N records drawn at random from the
+citation store (see citation_store.py), with their pybtex citations.
+
+Usage: python benchmarks/apa.py [--repeat 200] [--sample 200] [--seed 0]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from apa import format_article  # noqa: E402
+from citation import bib_to_apa7_html, record_to_bib  # noqa: E402
+
+DATA_PATH = Path(__file__).parent.parent / "tests" / "data"
+GOLDEN_PATH = DATA_PATH / "apa_citations.json"
+SAMPLED_PATH = DATA_PATH / "apa_citations_sampled.json"
+
+
+def format_pybtex(pmid, record):
+    return bib_to_apa7_html(record_to_bib(pmid, record))
+
+
+def format_direct(pmid, record):
+    return format_article(pmid, record) or format_pybtex(pmid, record)
+
+
+def sample_citation_store(n: int, seed: int):
+    """Draw n records from the citation store, with their pybtex citation and whether they are rendered directly."""
+    from citation_store import get_citation_store
+
+    citation_store = get_citation_store()
+    if citation_store is None:
+        raise SystemExit("No citation store, build it with citation_store.py or set CITATION_STORE_PATH")
+    pmids = sorted(random.Random(seed).sample(list(citation_store.pmids), n))
+    samples = []
+    for pmid in pmids:
+        record = citation_store.get(pmid)
+        samples.append({
+            "pmid": pmid,
+            "source": "PubMed",
+            "record": record,
+            "direct": format_article(pmid, record) is not None,
+            "citation": format_pybtex(pmid, record),
+        })
+    return samples
+
+
+def time_formatter(formatter, records, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for pmid, record in records:
+            formatter(pmid, record)
+    return (time.perf_counter() - start) / (repeat * len(records))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--sample", type=int, help="sample this many records from the citation store")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.sample:
+        samples = sample_citation_store(args.sample, args.seed)
+        SAMPLED_PATH.write_text(json.dumps(samples, indent=2, ensure_ascii=False) + "\n")
+        print(f"Sampled {len(samples)} records, {sum(not s['direct'] for s in samples)} are left to pybtex")
+
+    golden = json.loads(GOLDEN_PATH.read_text())
+    records = [(int(pmid), sample["record"]) for pmid, sample in golden.items()]
+    # 0 stands for the PMID of sampled records that have none
+    records += [(sample["pmid"] or 0, sample["record"]) for sample in json.loads(SAMPLED_PATH.read_text())]
+    for pmid, record in records:
+        assert format_direct(pmid, record) == format_pybtex(pmid, record)
+    # load the pybtex plugins before timing
+    format_pybtex(*records[0])
+
+    pybtex_time = time_formatter(format_pybtex, records, args.repeat)
+    direct_time = time_formatter(format_direct, records, args.repeat)
+    print(f"pybtex: {pybtex_time * 1e6:.1f} us/citation")
+    print(f"direct: {direct_time * 1e6:.1f} us/citation ({pybtex_time / direct_time:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
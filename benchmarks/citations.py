@@ -0,0 +1,171 @@
+"""Benchmark rewriting the citations of long answers.
+
+Compares the single-pass rewriter used by postprocess_citation (get_citation_order and rewrite_citations) against
+the previous multi-pass rewriter below, which rescanned the answer with a regex substitution for every cited source.
+Bibliography formatting is excluded, both rewriters use the same inline citation map.
+
+Usage: python benchmarks/citations.py [--sources 40] [--repeat 20]
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from citation import get_citation_order, rewrite_citations, smart_inline_citation_format  # noqa: E402
+
+SENTENCE = "Patients with this disease commonly present with progressive muscle weakness and cardiomyopathy"
+CITATION_FORMATS = ["[{}]", "(Source {})", "Source {}", "[{}], [{}]", "(Sources {} and {})", "[{}-{}]"]
+
+
+def make_answer(sources: int, sentences: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(sentences):
+        citation_format = rng.choice(CITATION_FORMATS)
+        start = rng.randint(1, sources - 1)
+        numbers = [start, start + 1][: citation_format.count("{}")]
+        lines.append(f"{SENTENCE} {citation_format.format(*numbers)}.")
+    return " ".join(lines)
+
+
+# The previous multi-pass rewriter, kept here as the baseline of the benchmark
+
+
+def merge_adjacent_citations(content: str):
+    # test case
+    # GNE Myopathy is a rare genetic disorder characterized by progressive muscle weakness and atrophy, primarily affecting skeletal muscles. The condition is caused by mutations in the GNE gene, which encodes an enzyme involved in the synthesis of sialic acid, a crucial component of cell membranes and various glycoproteins [1-10], [8], [9], [10], [11], [12], [13], [14], [15], [16], [17], [18], [19], [20], [21], [22], [23], [24], [25], [26].\n\nThe symptoms of GNE Myopathy typically manifest during early childhood or adolescence and include muscle weakness, muscle atrophy, and abnormal electrical activity in muscles as detected by electromyography (EMG) tests [2], [3], [4], [5], [6]. Over time, the disease can lead to significant disability and impaired mobility.\n\nThe GNE gene has multiple allelic variants associated with GNE Myopathy, which are responsible for the different forms of the disorder observed in affected individuals [17], [18], [19], [20]. The specific variant determines the severity and progression of the disease, as well as the age of onset and other clinical features.\n\nIn summary, GNE Myopathy is a genetic disorder characterized by muscle weakness, atrophy, and electrical abnormalities in muscles due to mutations in the GNE gene. The condition affects skeletal muscles and can lead to significant disability over time.
+    content = re.sub(r"\], \[", ", ", content)
+    citations = re.findall(r"(\[[\d,\- ]+\])", content)
+    mapping = {}
+    for cite in citations:
+        numbers = get_numbers_complex(cite)
+        mapping[cite] = smart_inline_citation_format(numbers)
+    for x, y in mapping.items():
+        content = content.replace(x, y)
+    return content
+
+
+def get_numbers_complex(cite):
+    x = cite.removeprefix("[").removesuffix("]").split(",")
+    numbers = set()
+    for a in x:
+        if "-" in a:
+            start, end = map(int, a.split("-"))
+            numbers.update(range(start, end + 1))
+        try:
+            numbers.add(int(a))
+        except ValueError:
+            pass
+    numbers = list(numbers)
+    return numbers
+
+
+def expand_citations(content: str):
+    # (Sources 3, 8, and 9) -> (Source 3, Source 8, Source 9)
+    sources = re.findall(r"Sources (\d[\d,\- ]*), and (\d[\d,\- ]*)", content)
+    for source, and_source in sources:
+        numbers = get_numbers_complex(source)
+        numbers.extend(get_numbers_complex(and_source))
+        content = content.replace(f"Sources {source}, and {and_source}", ", ".join([f"Source {x}" for x in numbers]))
+     # (Sources 3, 8 and 9) -> (Source 3, Source 8, Source 9)
+    sources = re.findall(r"Sources (\d[\d,\- ]*) and (\d[\d,\- ]*)", content)
+    for source, and_source in sources:
+        numbers = get_numbers_complex(source)
+        numbers.extend(get_numbers_complex(and_source))
+        content = content.replace(f"Sources {source} and {and_source}", ", ".join([f"Source {x}" for x in numbers]))
+    # (Sources 9-12) -> (Source 9, Source 10, Source 11, Source 12)
+    sources = re.findall(r"Sources* (\d[\d,\- ]*)-([\d[\d,\- ]*)", content)
+    for start, end in sources:
+        end = get_numbers_complex(end)[-1]
+        numbers = list(range(int(start), end + 1))
+        if f"Sources {start}-{end}" in content:
+            content = content.replace(f"Sources {start}-{end}", ", ".join([f"Source {x}" for x in numbers]))
+        else:
+            content = content.replace(f"Source {start}-{end}", ", ".join([f"Source {x}" for x in numbers]))
+    # (Sources 5, 6, 7) -> (Source 5), (Source 6), (Source 7)
+    sources = re.findall(r"Sources (\d[\d,\- ]*)", content)
+    for source in sources:
+        numbers = get_numbers_complex(source)
+        if len(numbers) == 1:
+            content = content.replace(f"Sources {source}", f"Source {numbers[0]}")
+        else:
+            content = content.replace(f"Sources {source}", ", ".join([f"Source {x}" for x in numbers]))
+    # [3, 4, and 5] -> [3, 4, 5]
+    sources = re.findall(r"\[(\d[\d,\- ]*), and (\d[\d,\- ]*)\]", content)
+    for source, and_source in sources:
+        numbers = get_numbers_complex(source)
+        numbers.append(int(and_source))
+        content = content.replace(f"{source}, and {and_source}", ", ".join([f"[{x}]" for x in numbers]))
+    # [3, 4, 5] -> [3], [4], [5]
+    sources = re.findall(r"\[(\d[\d,\- ]+)\]", content)
+    for source in sources:
+        numbers = get_numbers_complex(source)
+        content = content.replace(source, ", ".join([f"[{x}]" for x in numbers]))
+    return content
+
+
+def normalize_citations(content):
+    content = re.sub(r"Source (\d+)", r"[\1]", content, flags=re.I)
+    content = re.sub(r"\(([\d, -]+)\)[., ]", r"[\1].", content)
+    content = re.sub(r"\(\[", "[", content)
+    content = re.sub(r"\]\)", "]", content)
+    content = re.sub(r"\[\[+", "[", content)
+    content = re.sub(r"\]\]+", "]", content)
+    return content
+
+
+def get_source_order(content):
+    source_order = re.findall(r"\[(\d+)\]", content)
+    source_order = [int(source) for source in source_order]
+    return source_order
+
+
+def get_inline_citation_map(source_order):
+    # bibliography numbers in order of first citation, as generate_bibliography assigns them
+    return {source_number: [i + 1] for i, source_number in enumerate(source_order)}
+
+
+def rewrite_multi_pass(content: str) -> str:
+    content = expand_citations(content)
+    content = normalize_citations(content)
+    inline_citation_map = get_inline_citation_map(list(dict.fromkeys(get_source_order(content))))
+    for source_number, bibliography_numbers in inline_citation_map.items():
+        content = re.sub(rf"\[{source_number}\]", smart_inline_citation_format(bibliography_numbers), content)
+        content = merge_adjacent_citations(content)
+    return content
+
+
+def rewrite_single_pass(content: str) -> str:
+    return rewrite_citations(content, get_inline_citation_map(get_citation_order(content)))
+
+
+def time_rewriter(rewriter, content: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rewriter(content)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sources", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for sentences in (10, 50, 200):
+        content = make_answer(args.sources, sentences)
+        multi_pass = time_rewriter(rewrite_multi_pass, content, args.repeat)
+        single_pass = time_rewriter(rewrite_single_pass, content, args.repeat)
+        print(
+            f"{sentences} sentences, {len(get_citation_order(content))} sources: "
+            f"multi-pass {multi_pass * 1e3:.2f} ms, single-pass {single_pass * 1e3:.2f} ms "
+            f"({multi_pass / single_pass:.1f}x faster)"
+        )
+
+
+if __name__ == "__main__":
+    main()
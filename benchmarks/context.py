@@ -0,0 +1,151 @@
+"""Benchmark the context built from the retrieved triples, by prompt tokens and by the citations of the answers.
+
+Compares the previous context, every retrieved triple on its own "Source N: subject predicate object" line, with
+the contexts packed by ContextPacker in each format, on the questions of eval/data/RD/test_questions.csv. The
+triples of each question are retrieved with the retriever pipeline, which needs Neo4j and the LLM (see
+pipelines.py), and saved to --triples, so that later runs, e.g. with another budget or tokenizer, do not need them.
+
+With --answer, each question is also answered by the LLM with each context, and the citations of the answers are
+checked: the share of answers that cite a source, the share of citations that map back to a triple of the context
+through citation.get_source_nodes, and the share of those whose sentence mentions a word of the cited triple.
+
+Usage: python benchmarks/context.py [--triples .files/context_triples.json] [--budget 2048] [--tokenizer NAME]
+                                    [--answer] [--llm llama3:8b-instruct-q5_K_M]
+"""
+import argparse
+import csv
+import json
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from chat_engine.context_packer import CONTEXT_FORMATS, ContextPacker  # noqa: E402
+from citation import CITATION_PATTERN, SOURCE_NUMBER_KEY, get_citation_numbers, get_source_nodes  # noqa: E402
+
+QUESTIONS_PATH = Path(__file__).parent.parent / "eval/data/RD/test_questions.csv"
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+WORD_PATTERN = re.compile(r"[a-z0-9]{4,}")
+
+
+def retrieve_triples(questions):
+    from pipelines import get_retriever_pipeline
+
+    retriever = get_retriever_pipeline()
+    return {
+        question: [{key: node.metadata[key] for key in ("subject", "predicate", "object", "citation")}
+                   for node in retriever.retrieve(question)]
+        for question in questions
+    }
+
+
+def to_nodes(triples):
+    return [SimpleNamespace(node=SimpleNamespace(metadata=dict(triple)), score=None) for triple in triples]
+
+
+def number_nodes(nodes):
+    """Number nodes as the chat engine does, with their metadata also on the node, as on NodeWithScore."""
+    numbered = []
+    for i, node in enumerate(nodes):
+        metadata = {**node.node.metadata, SOURCE_NUMBER_KEY: i + 1}
+        numbered.append(SimpleNamespace(node=SimpleNamespace(metadata=metadata), metadata=metadata, score=None))
+    return numbered
+
+
+def get_words(text):
+    return set(WORD_PATTERN.findall(text.lower()))
+
+
+def check_citations(answer, nodes):
+    """Count the citations of an answer, those that map back to a triple, and those supported by their sentence."""
+    response = SimpleNamespace(response=answer, source_nodes=nodes)
+    citations = valid = supported = 0
+    for sentence in SENTENCE_PATTERN.split(answer):
+        words = get_words(CITATION_PATTERN.sub("", sentence))
+        for match in CITATION_PATTERN.finditer(sentence):
+            for source_number in get_citation_numbers(match.group()):
+                citations += 1
+                for node in get_source_nodes(response, answer, {source_number}):
+                    valid += 1
+                    metadata = node.node.metadata
+                    supported += bool(words & get_words(f"{metadata['subject']} {metadata['object']}"))
+    return citations, valid, supported
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--triples", default=".files/context_triples.json")
+    parser.add_argument("--budget", type=int, default=2048)
+    parser.add_argument("--tokenizer", default="NousResearch/Meta-Llama-3-8B-Instruct")
+    parser.add_argument("--answer", action="store_true")
+    parser.add_argument("--llm", default="llama3:8b-instruct-q5_K_M")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+
+    def count_tokens(text):
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    triples_path = Path(args.triples)
+    if triples_path.exists():
+        triples = json.loads(triples_path.read_text())
+    else:
+        with open(QUESTIONS_PATH) as f:
+            questions = [row["question"] for row in csv.DictReader(f)]
+        triples = retrieve_triples(questions)
+        triples_path.parent.mkdir(parents=True, exist_ok=True)
+        triples_path.write_text(json.dumps(triples))
+
+    if args.answer:
+        from chat_engine.citation_condense_plus_context import DEFAULT_CONTEXT_PROMPT_TEMPLATE
+        from pipelines import get_llm
+
+        llm = get_llm(args.llm)
+
+    # None is the previous context, which kept every triple, including duplicates
+    packers = {"previous lines": None}
+    packers.update({f"{format}, {args.budget} tokens": ContextPacker(args.budget, count_tokens, format)
+                    for format in CONTEXT_FORMATS})
+    baseline = None
+    for name, packer in packers.items():
+        tokens = []
+        sources = []
+        answers = []
+        for question, question_triples in triples.items():
+            if packer is None:
+                nodes = number_nodes(to_nodes(question_triples))
+                context_str = ContextPacker(format="lines").pack(nodes)
+            else:
+                nodes = number_nodes(packer.select(to_nodes(question_triples)))
+                context_str = packer.pack(nodes)
+            tokens.append(count_tokens(context_str))
+            sources.append(len(nodes))
+            if args.answer:
+                prompt = DEFAULT_CONTEXT_PROMPT_TEMPLATE.format(context_str="\n" + context_str)
+                start = time.perf_counter()
+                answer = llm.complete(f"{prompt}\nQuestion: {question}\nAnswer: ").text
+                answers.append((time.perf_counter() - start, *check_citations(answer, nodes)))
+        total = sum(tokens)
+        baseline = baseline or total
+        print(
+            f"{name}: {total} context tokens in total ({total / baseline:.0%}), "
+            f"mean {statistics.mean(tokens):.0f}, max {max(tokens)}, mean {statistics.mean(sources):.1f} sources"
+        )
+        if answers:
+            latencies, citations, valid, supported = zip(*answers)
+            print(
+                f"    mean answer latency {statistics.mean(latencies):.2f} s, "
+                f"{sum(map(bool, citations)) / len(answers):.0%} of answers cite a source, "
+                f"{sum(valid) / max(sum(citations), 1):.0%} of citations map to a triple, "
+                f"{sum(supported) / max(sum(valid), 1):.0%} of those are supported by their sentence"
+            )
+
+
+if __name__ == "__main__":
+    main()
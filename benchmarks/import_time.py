@@ -0,0 +1,47 @@
+"""Benchmark the time to import textualize and citation.
+
+Compares importing the modules (GARD, the HPO ontology and the pybtex plugins are loaded lazily) against
+importing them and loading every resource, which is what importing them used to cost.
+
+Usage: python benchmarks/import_time.py [--repeat 5]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+
+STATEMENTS = {
+    "lazy": "import textualize, citation",
+    "eager": (
+        "import textualize, citation, resources; "
+        "resources.get_gard(); resources.get_ontology(); resources.get_apa_style(); resources.get_text_backend()"
+    ),
+}
+
+
+def time_statement(statement: str, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=SRC_DIR, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {name: statistics.median(time_statement(statement, args.repeat)) for name, statement in STATEMENTS.items()}
+    for name, median in results.items():
+        print(f"{name}: {median:.3f} s (median of {args.repeat})")
+    print(f"reduction: {results['eager'] - results['lazy']:.3f} s ({1 - results['lazy'] / results['eager']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Benchmark the row-wise textualize_* functions against the columnar textualize_*_df functions.
+
+Runs on synthetic rel maps (1,000 and 10,000 rows by default) shaped like the Neo4j results of
+CustomNeo4jGraphStore, and checks that both paths return the same rel maps.
+
+Usage: python benchmarks/textualization.py [--sizes 1000 10000] [--repeat 5]
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from textualize import (  # noqa: E402
+    HPO_NAMES,
+    textualize_organizations,
+    textualize_phenotypes,
+    textualize_prevelances,
+    textualize_pubtator3s,
+    textualize_rels
+)
+from textualize_columnar import (  # noqa: E402
+    textualize_organizations_df,
+    textualize_phenotypes_df,
+    textualize_prevalences_df,
+    textualize_pubtator3s_df,
+    textualize_rels_df
+)
+
+DISEASES = [
+    ("GRACILE SYNDROME|FELLMAN DISEASE|FELLMAN SYNDROME", "GARD:0000001|OMIM:603358|ORPHA:53693"),
+    ("DUCHENNE MUSCULAR DYSTROPHY|DMD", "GARD:0006291|OMIM:310200|ORPHA:98896"),
+    ("CAT EYE SYNDROME|CES", "GARD:0000026|OMIM:115470|ORPHA:195"),
+    ("PHENYLKETONURIA|PKU", "OMIM:261600|ORPHA:716"),
+]
+
+
+def maybe(rng: random.Random, value, p: float = 0.5):
+    return value if rng.random() < p else rng.choice(["", None])
+
+
+def make_phenotype(rng: random.Random, i: int):
+    hpo_ids = list(HPO_NAMES)
+    return {
+        "n__N_Name": rng.choice(DISEASES)[0],
+        "m__N_Name": maybe(rng, f"PHENOTYPE {i}|SYNONYM {i}", 0.95),
+        "r_Frequency": maybe(rng, f"HP:{rng.choice(hpo_ids):07d}"),
+        "r_Onset": maybe(rng, rng.choice([[rng.choice(hpo_ids)], f"HP:{rng.choice(hpo_ids):07d}"])),
+        "r_Reference": maybe(rng, rng.choice([f"[PMID:{i},Orphanet:{i}]", f"PMID:{i}", [f"OMIM:{i}"]]), 0.9),
+    }
+
+
+def make_prevalence(rng: random.Random, i: int):
+    return {
+        "m__N_Name": rng.choice(DISEASES)[0],
+        "n_PrevalenceClass": maybe(rng, "1-9 / 100 000", 0.9),
+        "n_PrevalenceGeographic": maybe(rng, "Finland"),
+        "n_PrevalenceQualification": maybe(rng, "Value and class"),
+        "n_PrevalenceValidationStatus": maybe(rng, "Validated"),
+        "n_Source": maybe(rng, f"{i}[PMID]_[EXPERT]", 0.9),
+        "n_ValMoy": maybe(rng, rng.choice([2.0, 4.14, 0.0])),
+    }
+
+
+def make_organization(rng: random.Random, i: int):
+    name, codes = rng.choice(DISEASES)
+    return {
+        "m__N_Name": name,
+        "m__I_CODE": codes,
+        "n_Address1": maybe(rng, f"{i} Main Street"),
+        "n_Address2": maybe(rng, f"Suite {i}", 0.2),
+        "n_City": maybe(rng, "Edmonton"),
+        "n_Country": maybe(rng, "Canada"),
+        "n_Email": maybe(rng, f"info{i}@example.org"),
+        "n_Fax": maybe(rng, "780-555-0100", 0.1),
+        "n_Name": maybe(rng, f"Organization {i}", 0.95),
+        "n_Phone": maybe(rng, "780-555-0199"),
+        "n_State": maybe(rng, "AB"),
+        "n_TollFree": maybe(rng, "1-800-555-0199", 0.2),
+        "n_URL": maybe(rng, f"https://example.org/{i}"),
+        "n_ZipCode": maybe(rng, " T6G 2R3  "),
+    }
+
+
+def make_rel(rng: random.Random, i: int):
+    return {
+        "n__N_Name": maybe(rng, rng.choice(DISEASES)[0], 0.9) or None,
+        "n__I_GENE": f"GENE{i % 50}",
+        "m__N_Name": maybe(rng, f"DISEASE {i}", 0.8),
+        "m__I_GENE": maybe(rng, f"GENE:{i}|HGNC:{i}", 0.3),
+        "r_citations": maybe(rng, f"[PMID:{i},Orphanet:{i}]"),
+        "r_interpretation": maybe(rng, "Pathogenic", 0.2),
+        "r_name": rng.choice(["has_allelic_variant", "mapped_to", ["disease_associated_with", "gene"]]),
+        "r_value": maybe(rng, f"UMLS:C{i:07d}"),
+    }
+
+
+def make_pubtator3(rng: random.Random, i: int):
+    return {
+        "n_Mentions": rng.choice(["|GRACILE|GRACILE syndrome", "|", "Fellman disease"]),
+        "m_Mentions": maybe(rng, f"|chemical {i}", 0.9) or "",
+        "r_PMID": "|".join(str(i + j) for j in range(rng.randint(1, 5))),
+        "r_type": rng.choice(["associate_PubTator3", "treat_PubTator3"]),
+    }
+
+
+CASES = {
+    "phenotype": (make_phenotype, textualize_phenotypes, textualize_phenotypes_df),
+    "prevalence": (make_prevalence, textualize_prevelances, textualize_prevalences_df),
+    "organization": (make_organization, textualize_organizations, textualize_organizations_df),
+    "rel": (make_rel, textualize_rels, textualize_rels_df),
+    "pubtator3": (make_pubtator3, textualize_pubtator3s, textualize_pubtator3s_df),
+}
+
+
+def make_records(kind: str, size: int, seed: int = 0):
+    rng = random.Random(seed)
+    make_record = CASES[kind][0]
+    return [make_record(rng, i) for i in range(size)]
+
+
+def benchmark(function, argument, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(argument)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'kind':<14}{'rows':>8}{'row-wise (ms)':>16}{'columnar (ms)':>16}{'speedup':>10}")
+    for size in args.sizes:
+        for kind, (_, textualize, textualize_df) in CASES.items():
+            records = make_records(kind, size)
+            df = pd.DataFrame(records, dtype=object)
+            row_time, rel_map = benchmark(textualize, records, args.repeat)
+            df_time, rel_map_df = benchmark(textualize_df, df, args.repeat)
+            assert rel_map == rel_map_df, f"{kind}: columnar rel map differs from the row-wise rel map"
+            print(f"{kind:<14}{size:>8}{row_time * 1000:>16.2f}{df_time * 1000:>16.2f}{row_time / df_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Persistent cache of answers by the meaning of the question and the sources it was answered from.
+
+Users often ask questions that were answered before, worded a little differently. The chat engine embeds the
+condensed standalone question and looks up the nearest cached question, in a FAISS index, among the answers in the
+user's language that were written from the same set of sources. The answer of a question above the similarity
+threshold is shown as it was, with its bibliography, without calling the LLM. As the sources are part of the key,
+an answer is not reused once the knowledge graph gives other sources for the question.
+
+The entries are stored in SQLite, with their embeddings, and the FAISS index is rebuilt from them when the cache is
+opened. Entries expire ttl seconds after they are written, and the least recently used entries are evicted above
+max_entries entries. Each process has its own index, so an entry written by another process is found after a
+restart.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, NamedTuple
+
+import faiss
+import numpy as np
+
+from citation import SOURCE_NUMBER_KEY
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import NodeWithScore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ANSWER_CACHE_PATH = "/data/rgd-chatbot/answer_cache.sqlite"
+# questions of e5 embeddings are rarely below 0.8 cosine similarity, even when they are unrelated
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 10000
+# the nearest questions considered, of any language or sources, for a lookup
+DEFAULT_SEARCH_K = 32
+SOURCE_PREFIX_PATTERN = re.compile(r"^Source \d+: ")
+
+
+def get_source_fingerprint(nodes: List[NodeWithScore]) -> str:
+    """A hash of a set of sources, that does not depend on their order or their source numbers."""
+    sources = set()
+    for node in nodes:
+        metadata = {key: value for key, value in node.node.metadata.items() if key != SOURCE_NUMBER_KEY}
+        text = SOURCE_PREFIX_PATTERN.sub("", node.node.get_content())
+        sources.add(json.dumps([metadata, text], sort_keys=True, default=str))
+    return hashlib.sha256("\n".join(sorted(sources)).encode()).hexdigest()
+
+
+class AnswerCacheKey(NamedTuple):
+    question: str
+    embedding: List[float]
+    source_fingerprint: str
+
+
+class CachedAnswer(NamedTuple):
+    id: int
+    question: str
+    # the answer of the LLM, in English, as written to the chat history
+    answer: str
+    # the answer as shown to the user, in their language
+    content: str
+    bibliography: str | None
+    similarity: float
+
+
+class AnswerCacheStats:
+    """Counts of the lookups of an answer cache, and of the entries it dropped."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / max(self.hits + self.misses, 1)
+
+    def as_dict(self) -> Dict[str, int | float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 3),
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+def normalize_embedding(embedding: List[float]) -> np.ndarray:
+    """The embedding as a unit vector, so that inner products are cosine similarities."""
+    vector = np.array([embedding], dtype=np.float32)
+    faiss.normalize_L2(vector)
+    return vector
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_ANSWER_CACHE_PATH,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        ttl: float | None = DEFAULT_TTL,
+        max_entries: int | None = DEFAULT_MAX_ENTRIES,
+        search_k: int = DEFAULT_SEARCH_K,
+    ) -> None:
+        """Cache answers in SQLite at path, for ttl seconds and up to max_entries entries, None disables a limit."""
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.search_k = search_k
+        self.stats = AnswerCacheStats()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._index: faiss.IndexIDMap | None = None
+        with self._lock:
+            # WAL lets the Chainlit workers read while another process writes
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    "id INTEGER PRIMARY KEY, language TEXT NOT NULL, source_fingerprint TEXT NOT NULL, "
+                    "question TEXT NOT NULL, embedding BLOB NOT NULL, answer TEXT NOT NULL, content TEXT NOT NULL, "
+                    "bibliography TEXT, created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+                )
+                self._connection.execute("CREATE INDEX IF NOT EXISTS answers_last_used_at ON answers (last_used_at)")
+            self._delete_expired()
+            for id, embedding in self._connection.execute("SELECT id, embedding FROM answers"):
+                self._add_to_index(id, np.frombuffer(embedding, dtype=np.float32).reshape(1, -1))
+
+    def _add_to_index(self, id: int, vector: np.ndarray) -> None:
+        if self._index is None:
+            self._index = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+        self._index.add_with_ids(vector, np.array([id], dtype=np.int64))
+
+    def _delete(self, ids: List[int]) -> None:
+        if not ids:
+            return
+        with self._connection:
+            self._connection.executemany("DELETE FROM answers WHERE id = ?", ((id,) for id in ids))
+        if self._index is not None:
+            self._index.remove_ids(np.array(ids, dtype=np.int64))
+
+    def _delete_expired(self) -> None:
+        if self.ttl is None:
+            return
+        ids = [id for id, in self._connection.execute(
+            "SELECT id FROM answers WHERE created_at < ?", (time.time() - self.ttl,)
+        )]
+        self._delete(ids)
+        self.stats.expired += len(ids)
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries above max_entries."""
+        if self.max_entries is None:
+            return
+        count = self._connection.execute("SELECT count(*) FROM answers").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        ids = [id for id, in self._connection.execute(
+            "SELECT id FROM answers ORDER BY last_used_at LIMIT ?", (count - self.max_entries,)
+        )]
+        self._delete(ids)
+        self.stats.evicted += len(ids)
+
+    def get(self, key: AnswerCacheKey, language: str = "en") -> CachedAnswer | None:
+        """The answer in language of the nearest question above the similarity threshold with the same sources."""
+        vector = normalize_embedding(key.embedding)
+        with self._lock:
+            cached_answer = None
+            if self._index is not None and self._index.ntotal and self._index.d == vector.shape[1]:
+                similarities, ids = self._index.search(vector, min(self.search_k, self._index.ntotal))
+                cached_answer = self._get_nearest(similarities[0], ids[0], key.source_fingerprint, language)
+            if cached_answer is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+        if cached_answer is not None:
+            logger.info(
+                f"Answer cache hit for {key.question!r}: {cached_answer.question!r} "
+                f"({cached_answer.similarity:.3f} similarity), {self.stats.as_dict()}"
+            )
+        return cached_answer
+
+    def _get_nearest(
+        self, similarities: np.ndarray, ids: np.ndarray, source_fingerprint: str, language: str
+    ) -> CachedAnswer | None:
+        expired = []
+        cached_answer = None
+        for similarity, id in zip(similarities.tolist(), ids.tolist()):
+            # the results are sorted by similarity, and padded with -1 ids
+            if id == -1 or similarity < self.similarity_threshold:
+                break
+            row = self._connection.execute(
+                "SELECT question, answer, content, bibliography, created_at FROM answers "
+                "WHERE id = ? AND language = ? AND source_fingerprint = ?",
+                (id, language, source_fingerprint),
+            ).fetchone()
+            if row is None:
+                continue
+            question, answer, content, bibliography, created_at = row
+            if self.ttl is not None and created_at < time.time() - self.ttl:
+                expired.append(id)
+                continue
+            cached_answer = CachedAnswer(id, question, answer, content, bibliography, similarity)
+            with self._connection:
+                self._connection.execute("UPDATE answers SET last_used_at = ? WHERE id = ?", (time.time(), id))
+            break
+        self._delete(expired)
+        self.stats.expired += len(expired)
+        return cached_answer
+
+    def put(
+        self, key: AnswerCacheKey, answer: str, content: str, bibliography: str | None, language: str = "en"
+    ) -> int:
+        """Cache the answer of a question, as shown to the user in language, and return the id of its entry."""
+        vector = normalize_embedding(key.embedding)
+        now = time.time()
+        with self._lock:
+            if self._index is not None and self._index.d != vector.shape[1]:
+                # the embedding model changed, so the cached questions cannot be compared anymore
+                logger.warning("Embedding dimension changed, clearing the answer cache")
+                with self._connection:
+                    self._connection.execute("DELETE FROM answers")
+                self._index = None
+            with self._connection:
+                id = self._connection.execute(
+                    "INSERT INTO answers (language, source_fingerprint, question, embedding, answer, content, "
+                    "bibliography, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (language, key.source_fingerprint, key.question, vector.tobytes(), answer, content,
+                     bibliography, now, now),
+                ).lastrowid
+            self._add_to_index(id, vector)
+            self._delete_expired()
+            self._evict()
+        return id
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM answers").fetchone()[0]
+
+
+@cache
+def get_answer_cache() -> AnswerCache | None:
+    """The answer cache at ANSWER_CACHE_PATH, or None if ANSWER_CACHE_PATH is empty or the cache cannot be opened.
+
+    The result is cached either way, so that a cache that cannot be opened, e.g. on a read-only disk, is not retried
+    for every session. Without the cache, every question is answered by the LLM.
+    """
+    path = os.environ.get("ANSWER_CACHE_PATH", DEFAULT_ANSWER_CACHE_PATH)
+    if not path:
+        return None
+    try:
+        return AnswerCache(
+            path,
+            similarity_threshold=float(
+                os.environ.get("ANSWER_CACHE_SIMILARITY_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD)
+            ),
+            ttl=float(os.environ.get("ANSWER_CACHE_TTL", DEFAULT_TTL)),
+            max_entries=int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        )
+    except (OSError, sqlite3.Error):
+        logger.warning(f"Could not open the answer cache at {path}, answering without it", exc_info=True)
+        return None
@@ -0,0 +1,75 @@
+"""Direct APA rendering of PubMed article citations.
+
+Renders the same text as the pybtex "apa" style with the text backend (citation.bib_to_apa7_html), without
+building a BibTeX string, reparsing it and running it through the pybtex templates. Only plain text is rendered
+directly: fields with characters that BibTeX or LaTeX interpret return None so that the caller can use pybtex.
+"""
+import re
+from typing import Dict, List
+
+LATEX_SPECIAL = re.compile(r"[\\{}%~]|--|''|``|!`|\?`|,,|<<|>>")
+AND = re.compile(r"\s+and\s+", re.IGNORECASE)
+DELIMITER = re.compile(r"([\s\-])")
+TERMINATORS = (".", "?", "!")
+# the APA style lists the first 6 authors, an ellipsis and the last author when there are more than 7
+MAX_AUTHORS = 7
+
+
+def is_plain(text: str) -> bool:
+    return LATEX_SPECIAL.search(text) is None
+
+
+def add_period(text: str) -> str:
+    if text and not text.endswith(TERMINATORS):
+        return text + "."
+    return text
+
+
+def abbreviate(name: str) -> str:
+    return "".join(part[0] + "." if part.isalpha() else part for part in DELIMITER.split(name))
+
+
+def format_name(name: str) -> str | None:
+    """Format a "Last, First Middle" name as "Last, F. M.", or return None if pybtex would parse it differently."""
+    parts = name.split(",")
+    last = parts[0].split()
+    if not last or len(parts) > 2 or (len(parts) == 1 and len(last) > 1):
+        return None
+    first = parts[1].split() if len(parts) == 2 else []
+    if first:
+        return f"{' '.join(last)}, {' '.join(abbreviate(name) for name in first)}"
+    return " ".join(last)
+
+
+def format_authors(names: List[str]) -> str:
+    if len(names) > MAX_AUTHORS:
+        return ", ".join(names[:6]) + ", … " + names[-1]
+    if len(names) > 1:
+        return ", ".join(names[:-1]) + ", & " + names[-1]
+    return names[0]
+
+
+def format_article(pmid: int, record: Dict[str, str]) -> str | None:
+    """Render a citation_store record as an APA article citation, or return None if it needs pybtex."""
+    author = record["author"] or "Anonymous"
+    year = " ".join(record["year"].split())
+    month = " ".join(record["month"].split())
+    title = " ".join(record["title"].split())
+    journal = " ".join(record["journal"].split())
+    doi = " ".join(record["doi"].split())
+    if not (year and title and journal and all(map(is_plain, (author, year, month, title, journal, doi)))):
+        return None
+    names = [format_name(name) for name in AND.split(author.strip())]
+    if None in names:
+        return None
+
+    # the month and DOI fields are always present in the BibTeX entry, so pybtex renders their separators
+    # even when they are empty
+    parts = [
+        add_period(format_authors(names)),
+        f"({year} , {month}).",
+        add_period(title[:1].upper() + title[1:].lower()),
+        add_period(journal),
+        f"URL: https://pubmed.ncbi.nlm.nih.gov/{pmid}/, doi:{doi}",
+    ]
+    return " ".join(parts)
@@ -9,7 +9,7 @@ from llama_index.core.callbacks import CallbackManager
 from llama_index.core.chat_engine.types import BaseChatEngine
 
 from callbacks import CustomLlamaIndexCallbackHandler
-from citation import postprocess_citation
+from citation import StreamingCitationRewriter, postprocess_citation
 from lingua_iso_codes import IsoCode639_1
 from pipelines import get_pipeline
 from translation import BaseTranslator, detect_language, get_language_detector, get_translator, translate
@@ -72,6 +72,16 @@ async def on_chat_start(accepted: bool = False):
     cl.user_session.set("detector", detector)
 
 
+@cl.on_chat_end
+async def on_chat_end():
+    chat_engine = cl.user_session.get("chat_engine")
+    if condense_stats := getattr(chat_engine, "condense_stats", None):
+        logging.info(f"Condense LLM calls saved in session: {condense_stats.as_dict()}")
+    if answer_cache := getattr(chat_engine, "answer_cache", None):
+        # the answer cache is shared by the sessions of the process, so are its stats
+        logging.info(f"Answer cache of all sessions in this process: {answer_cache.stats.as_dict()}")
+
+
 async def set_chat_settings(translator):
     initial_language_value = "Detect language"
     languages_to_iso_codes = translator.get_supported_languages(as_dict=True)
@@ -94,17 +104,30 @@ async def set_chat_settings(translator):
     ).send()
 
 
-def chat(chat_engine: BaseChatEngine, content: str, profile: bool = False):
+def chat(chat_engine: BaseChatEngine, content: str, language: str = "en", profile: bool = False):
     if profile:
         pr = cProfile.Profile()
         pr.enable()
-    response = chat_engine.chat(content)
+    response = chat_engine.chat(content, language=language)
     if profile:
         pr.disable()
         pr.dump_stats("profile.prof")
     return response
 
 
+async def stream_response(response, response_message: cl.Message, start: float):
+    """Stream the tokens of a response with their citations rewritten, and return its content and bibliography."""
+    rewriter = StreamingCitationRewriter(response.source_nodes)
+    async for token in response.async_response_gen():
+        if text := await rewriter.afeed(token):
+            if not response_message.streaming:
+                logging.info(f"Time to first token: {time.time() - start:.2f} seconds")
+            await response_message.stream_token(text)
+    if text := await rewriter.afinish():
+        await response_message.stream_token(text)
+    return rewriter.content, rewriter.bibliography
+
+
 @cl.on_message
 async def on_message(message: cl.Message):
     start = time.time()
@@ -123,13 +146,28 @@ async def on_message(message: cl.Message):
         chat_engine: BaseChatEngine = await cl.user_session.get("chat_engine_coroutine")
         cl.user_session.set("chat_engine", chat_engine)
 
-    response = await cl.make_async(chat)(chat_engine, content, profile=False)
-    response_message = cl.Message(content="")
-
-    content, bibliography = postprocess_citation(response)
-
-    if language != "en" and language is not None:
-        content = await translate(translator, content, source="en", target=language)
+    if language == "en" or language is None:
+        # stream English answers as they are generated, with their citations rewritten as they are completed
+        response_message = cl.Message(content="")
+        response = await chat_engine.astream_chat(content, language="en")
+        if response.cached_answer:
+            content, bibliography = response.cached_answer.content, response.cached_answer.bibliography
+        else:
+            content, bibliography = await stream_response(response, response_message, start)
+            # answers without citations are not cached, the prompt asks for at least one
+            if bibliography:
+                await cl.make_async(chat_engine.cache_answer)(response, content, bibliography, language="en")
+    else:
+        # answers are translated as a whole, so they cannot be streamed
+        response = await cl.make_async(chat)(chat_engine, content, language=language, profile=False)
+        response_message = cl.Message(content="")
+        if response.cached_answer:
+            content, bibliography = response.cached_answer.content, response.cached_answer.bibliography
+        else:
+            content, bibliography = await cl.make_async(postprocess_citation)(response)
+            content = await translate(translator, content, source="en", target=language)
+            if bibliography:
+                await cl.make_async(chat_engine.cache_answer)(response, content, bibliography, language=language)
 
     if bibliography:
         content += bibliography
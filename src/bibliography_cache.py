@@ -0,0 +1,77 @@
+"""Persistent cache of formatted APA citations by PMID.
+
+Formatting a PMID citation reads and parses a gzipped PubMed XML file and formats it with pybtex, so the
+result is stored in SQLite and shared across processes and restarts. The cache is filled lazily by
+citation.generate_full_pmid_citation, or in bulk by prewarm_bibliography_cache.py.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from functools import cache
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BIBLIOGRAPHY_CACHE_PATH = "/data/rgd-chatbot/bibliography_cache.sqlite"
+
+
+class BibliographyCache:
+    def __init__(self, path: str | Path = DEFAULT_BIBLIOGRAPHY_CACHE_PATH) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL lets the Chainlit workers read while another process writes
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS citations (pmid INTEGER PRIMARY KEY, citation TEXT NOT NULL)"
+                )
+
+    def get(self, pmid: int | str) -> str | None:
+        with self._lock:
+            row = self._connection.execute("SELECT citation FROM citations WHERE pmid = ?", (int(pmid),)).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, pmids: Iterable[int | str]) -> Dict[int, str]:
+        pmids = [int(pmid) for pmid in pmids]
+        citations = {}
+        with self._lock:
+            # stay below SQLite's limit on the number of variables in a query
+            for i in range(0, len(pmids), 500):
+                batch = pmids[i:i + 500]
+                rows = self._connection.execute(
+                    f"SELECT pmid, citation FROM citations WHERE pmid IN ({','.join('?' * len(batch))})", batch
+                )
+                citations.update(rows)
+        return citations
+
+    def put(self, pmid: int | str, citation: str) -> None:
+        self.put_many([(pmid, citation)])
+
+    def put_many(self, citations: Iterable[Tuple[int | str, str]]) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO citations (pmid, citation) VALUES (?, ?)",
+                ((int(pmid), citation) for pmid, citation in citations),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM citations").fetchone()[0]
+
+
+@cache
+def get_bibliography_cache() -> BibliographyCache | None:
+    """The bibliography cache at BIBLIOGRAPHY_CACHE_PATH, or None if it cannot be opened, e.g. on a read-only disk.
+
+    The result is cached either way, so that a cache that cannot be opened is not retried for every citation.
+    """
+    path = os.environ.get("BIBLIOGRAPHY_CACHE_PATH", DEFAULT_BIBLIOGRAPHY_CACHE_PATH)
+    try:
+        return BibliographyCache(path)
+    except (OSError, sqlite3.Error):
+        logger.warning(f"Could not open the bibliography cache at {path}, formatting citations uncached", exc_info=True)
+        return None
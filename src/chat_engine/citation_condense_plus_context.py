@@ -1,9 +1,13 @@
 import asyncio
 import logging
-from threading import Thread
-from typing import List, Optional, Tuple
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, List, Optional, Set, Tuple
 
-from llama_index.core.base.llms.types import ChatMessage
+from llama_index.core import Settings
+from llama_index.core.base.llms.generic_utils import messages_to_history_str
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
 from llama_index.core.callbacks import CallbackManager, trace_method
 from llama_index.core.chat_engine import CondensePlusContextChatEngine
 from llama_index.core.chat_engine.types import AgentChatResponse, StreamingAgentChatResponse
@@ -13,9 +17,17 @@ from llama_index.core.llms.llm import LLM
 from llama_index.core.memory import BaseMemory
 from llama_index.core.postprocessor.types import BaseNodePostprocessor
 from llama_index.core.prompts.base import PromptTemplate
-from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+from llama_index.core.schema import NodeWithScore, TextNode
+from llama_index.core.tools import ToolOutput
 from llama_index.core.utilities.token_counting import TokenCounter
 
+from answer_cache import AnswerCache, AnswerCacheKey, CachedAnswer, get_source_fingerprint
+from chat_engine.condense_policy import CondensePolicy, CondenseStats
+from chat_engine.context_packer import DEFAULT_CONTEXT_FORMAT, DEFAULT_CONTEXT_WINDOW_SHARE, ContextPacker
+from chat_engine.source_history import SourceHistory
+from chat_engine.summarizing_memory import SummarizingChatMemory
+from citation import CITATION_PATTERN, SOURCE_NUMBER_KEY
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_CONTEXT_PROMPT_TEMPLATE = """
@@ -45,6 +57,34 @@ DEFAULT_CONDENSE_PROMPT_TEMPLATE = """
   Standalone question:"""
 
 
+# Shared by all sessions, writes the responses of stream_chat to the chat history as they are streamed. A writer
+# runs until its response is complete, so responses streamed beyond this many at once wait for a writer.
+# astream_chat writes on the event loop instead.
+HISTORY_WRITER_WORKERS = 32
+history_writer_executor = ThreadPoolExecutor(max_workers=HISTORY_WRITER_WORKERS, thread_name_prefix="chat_history")
+
+
+@dataclass
+class CitationChatResponse(AgentChatResponse):
+    """Chat response, with the cached answer it was read from, or the key to cache its answer with."""
+
+    cached_answer: Optional[CachedAnswer] = None
+    answer_cache_key: Optional[AnswerCacheKey] = None
+
+
+@dataclass
+class StreamingCitationChatResponse(StreamingAgentChatResponse):
+    """Streaming chat response, with a future that is done once the response is written to the chat history.
+
+    A response read from the answer cache has its cached_answer set, and nothing to stream.
+    """
+
+    # a concurrent.futures.Future for stream_chat, an asyncio.Task for astream_chat
+    history_written: Optional[Future | asyncio.Future] = None
+    cached_answer: Optional[CachedAnswer] = None
+    answer_cache_key: Optional[AnswerCacheKey] = None
+
+
 class CitationCondensePlusContextChatEngine(CondensePlusContextChatEngine):
     """Condensed Conversation & Context Chat Engine.
 
@@ -65,6 +105,10 @@ class CitationCondensePlusContextChatEngine(CondensePlusContextChatEngine):
         node_postprocessors: Optional[List[BaseNodePostprocessor]] = None,
         callback_manager: Optional[CallbackManager] = None,
         verbose: bool = False,
+        condense_policy: Optional[CondensePolicy] = None,
+        source_history: Optional[SourceHistory] = None,
+        context_packer: Optional[ContextPacker] = None,
+        answer_cache: Optional[AnswerCache] = None,
     ):
         self._retriever = retriever
         self._llm = llm
@@ -74,6 +118,7 @@ class CitationCondensePlusContextChatEngine(CondensePlusContextChatEngine):
         self._condense_prompt_template = PromptTemplate(condense_prompt_str)
         self._system_prompt = system_prompt
         self._skip_condense = skip_condense
+        self._condense_policy = condense_policy or CondensePolicy()
         self._node_postprocessors = node_postprocessors or []
         self.callback_manager = callback_manager or CallbackManager([])
         for node_postprocessor in self._node_postprocessors:
@@ -81,8 +126,98 @@ class CitationCondensePlusContextChatEngine(CondensePlusContextChatEngine):
 
         self._token_counter = TokenCounter()
         self._verbose = verbose
-        self._nodes = []
+        self._source_history = source_history or SourceHistory()
+        # the event loop only keeps weak references to tasks
+        self._history_tasks: Set[asyncio.Task] = set()
+        self._context_packer = context_packer or ContextPacker(
+            token_budget=int(llm.metadata.context_window * DEFAULT_CONTEXT_WINDOW_SHARE),
+            count_tokens=self._token_counter.get_string_tokens,
+            format=os.environ.get("CONTEXT_FORMAT", DEFAULT_CONTEXT_FORMAT),
+        )
+        self._answer_cache = answer_cache
+
+    @classmethod
+    def from_defaults(
+        cls,
+        retriever: BaseRetriever,
+        llm: Optional[LLM] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        **kwargs: Any,
+    ) -> "CitationCondensePlusContextChatEngine":
+        """Initialize a CitationCondensePlusContextChatEngine from default parameters."""
+        # CondensePlusContextChatEngine.from_defaults drops the arguments it does not know
+        chat_engine = super().from_defaults(retriever, llm=llm, **kwargs)
+        chat_engine._answer_cache = answer_cache
+        return chat_engine
+
+    @property
+    def condense_stats(self) -> CondenseStats:
+        return self._condense_policy.stats
 
+    @property
+    def answer_cache(self) -> Optional[AnswerCache]:
+        return self._answer_cache
+
+    def _get_answer_cache_key(self, context_source: ToolOutput, context_nodes: List[NodeWithScore]) -> AnswerCacheKey:
+        question = context_source.raw_input["message"]
+        embedding = Settings.embed_model.get_query_embedding(question)
+        return AnswerCacheKey(question, embedding, get_source_fingerprint(context_nodes))
+
+    async def _aget_answer_cache_key(
+        self, context_source: ToolOutput, context_nodes: List[NodeWithScore]
+    ) -> AnswerCacheKey:
+        question = context_source.raw_input["message"]
+        embedding = await Settings.embed_model.aget_query_embedding(question)
+        return AnswerCacheKey(question, embedding, get_source_fingerprint(context_nodes))
+
+    def _put_cached_answer(self, cached_answer: CachedAnswer) -> None:
+        """Write a cached answer to the chat history, without citations, as its sources are those of another turn."""
+        content = CITATION_PATTERN.sub("", cached_answer.answer)
+        self._memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=content))
+        self._summarize_history()
+
+    def cache_answer(
+        self,
+        response: CitationChatResponse | StreamingCitationChatResponse,
+        content: str,
+        bibliography: Optional[str],
+        language: str = "en",
+    ) -> None:
+        """Cache the answer of a response as shown to the user, in their language, with its bibliography."""
+        if self._answer_cache is None or response.answer_cache_key is None:
+            return
+        self._answer_cache.put(response.answer_cache_key, response.response, content, bibliography, language)
+
+    def _summarize_history(self) -> None:
+        """Update the summary of the chat history in the background, once a response is in the history."""
+        if isinstance(self._memory, SummarizingChatMemory):
+            self._memory.schedule_summary()
+
+    def _condense_question(self, chat_history: List[ChatMessage], latest_message: str) -> str:
+        """Condense a conversation history and latest user message to a standalone question."""
+        if self._skip_condense:
+            return latest_message
+        chat_history_str = messages_to_history_str(chat_history)
+        condensed_question = self._condense_policy.condense(chat_history_str, latest_message)
+        if condensed_question is None:
+            condensed_question = self._llm.predict(
+                self._condense_prompt_template, question=latest_message, chat_history=chat_history_str
+            )
+            self._condense_policy.put(chat_history_str, latest_message, condensed_question)
+        return condensed_question
+
+    async def _acondense_question(self, chat_history: List[ChatMessage], latest_message: str) -> str:
+        """Condense a conversation history and latest user message to a standalone question."""
+        if self._skip_condense:
+            return latest_message
+        chat_history_str = messages_to_history_str(chat_history)
+        condensed_question = self._condense_policy.condense(chat_history_str, latest_message)
+        if condensed_question is None:
+            condensed_question = await self._llm.apredict(
+                self._condense_prompt_template, question=latest_message, chat_history=chat_history_str
+            )
+            self._condense_policy.put(chat_history_str, latest_message, condensed_question)
+        return condensed_question
 
     def _create_citation_nodes(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
         """Modify retrieved nodes to be granular sources."""
@@ -92,109 +227,179 @@ class CitationCondensePlusContextChatEngine(CondensePlusContextChatEngine):
             new_node = NodeWithScore(
                 node=TextNode.parse_obj(node.node), score=node.score
             )
-            new_node.node.text = f"Source {len(self._nodes) + 1}: {node.text}"
+            source_number = self._source_history.next_source_number()
+            new_node.node.text = f"Source {source_number}: {node.text}"
+            # so that the citation postprocessor does not have to parse the number back out of the text
+            new_node.node.metadata = {**node.node.metadata, SOURCE_NUMBER_KEY: source_number}
+            new_node.node.excluded_llm_metadata_keys = [*new_node.node.excluded_llm_metadata_keys, SOURCE_NUMBER_KEY]
+            new_node.node.excluded_embed_metadata_keys = [
+                *new_node.node.excluded_embed_metadata_keys, SOURCE_NUMBER_KEY
+            ]
             new_nodes.append(new_node)
-            self._nodes.append(new_node)
         return new_nodes
 
-    def _retrieve_context(self, message: str) -> Tuple[str, List[NodeWithScore]]:
-        """Build context for a message from retriever."""
-        nodes = self._retriever.retrieve(message)
-        nodes = self._create_citation_nodes(nodes)
+    def _build_context(self, message: str, nodes: List[NodeWithScore]) -> Tuple[str, List[NodeWithScore]]:
+        """Number the retrieved nodes that fit in the context and write them as the context string."""
         for postprocessor in self._node_postprocessors:
             nodes = postprocessor.postprocess_nodes(nodes, query_bundle=QueryBundle(message))
-
-        context_str = "\n" + "\n\n".join([n.node.get_content(metadata_mode=MetadataMode.LLM).strip() for n in nodes])
+        # the nodes are numbered once they are packed, so that the numbers given to the LLM are consecutive
+        nodes = self._create_citation_nodes(self._context_packer.select(nodes))
+        self._source_history.add_window(nodes)
+        context_str = "\n" + self._context_packer.pack(nodes)
         return context_str, nodes
 
+    def _retrieve_context(self, message: str) -> Tuple[str, List[NodeWithScore]]:
+        """Build context for a message from retriever."""
+        nodes = self._retriever.retrieve(message)
+        return self._build_context(message, nodes)
+
     async def _aretrieve_context(self, message: str) -> Tuple[str, List[NodeWithScore]]:
         """Build context for a message from retriever."""
         nodes = await self._retriever.aretrieve(message)
-        nodes = self._create_citation_nodes(nodes)
-        context_str = "\n" + "\n\n".join([n.node.get_content(metadata_mode=MetadataMode.LLM).strip() for n in nodes])
-        return context_str, nodes
+        return self._build_context(message, nodes)
+
+    def _cached_streaming_response(
+        self,
+        cached_answer: CachedAnswer,
+        context_source: ToolOutput,
+        history_written: Future | asyncio.Future,
+    ) -> StreamingCitationChatResponse:
+        chat_response = StreamingCitationChatResponse(
+            response=cached_answer.content,
+            sources=[context_source],
+            source_nodes=self._source_history.nodes,
+            history_written=history_written,
+            cached_answer=cached_answer,
+        )
+        chat_response._is_done = True
+        return chat_response
 
     @trace_method("chat")
     def chat(
-        self, message: str, chat_history: Optional[List[ChatMessage]] = None
-    ) -> AgentChatResponse:
+        self, message: str, chat_history: Optional[List[ChatMessage]] = None, language: str = "en"
+    ) -> CitationChatResponse:
         chat_messages, context_source, context_nodes = self._run_c3(
             message, chat_history
         )
+        answer_cache_key = None
+        if self._answer_cache is not None:
+            answer_cache_key = self._get_answer_cache_key(context_source, context_nodes)
+            if cached_answer := self._answer_cache.get(answer_cache_key, language):
+                self._put_cached_answer(cached_answer)
+                return CitationChatResponse(
+                    response=cached_answer.content,
+                    sources=[context_source],
+                    source_nodes=self._source_history.nodes,
+                    cached_answer=cached_answer,
+                )
 
         # pass the context, system prompt and user message as chat to LLM to generate a response
         chat_response = self._llm.chat(chat_messages)
         assistant_message = chat_response.message
         self._memory.put(assistant_message)
+        self._summarize_history()
 
-        return AgentChatResponse(
+        return CitationChatResponse(
             response=str(assistant_message.content),
             sources=[context_source],
-            source_nodes=self._nodes,
+            source_nodes=self._source_history.nodes,
+            answer_cache_key=answer_cache_key,
         )
 
     @trace_method("chat")
     def stream_chat(
-        self, message: str, chat_history: Optional[List[ChatMessage]] = None
-    ) -> StreamingAgentChatResponse:
+        self, message: str, chat_history: Optional[List[ChatMessage]] = None, language: str = "en"
+    ) -> StreamingCitationChatResponse:
         chat_messages, context_source, context_nodes = self._run_c3(
             message, chat_history
         )
+        answer_cache_key = None
+        if self._answer_cache is not None:
+            answer_cache_key = self._get_answer_cache_key(context_source, context_nodes)
+            if cached_answer := self._answer_cache.get(answer_cache_key, language):
+                self._put_cached_answer(cached_answer)
+                history_written = Future()
+                history_written.set_result(None)
+                return self._cached_streaming_response(cached_answer, context_source, history_written)
 
         # pass the context, system prompt and user message as chat to LLM to generate a response
-        chat_response = StreamingAgentChatResponse(
+        chat_response = StreamingCitationChatResponse(
             chat_stream=self._llm.stream_chat(chat_messages),
             sources=[context_source],
-            source_nodes=self._nodes,
+            source_nodes=self._source_history.nodes,
+            answer_cache_key=answer_cache_key,
         )
-        thread = Thread(
-            target=chat_response.write_response_to_history, args=(self._memory,)
+        chat_response.history_written = history_writer_executor.submit(
+            chat_response.write_response_to_history, self._memory, on_stream_end_fn=self._summarize_history
         )
-        thread.start()
 
         return chat_response
 
     @trace_method("chat")
     async def achat(
-        self, message: str, chat_history: Optional[List[ChatMessage]] = None
-    ) -> AgentChatResponse:
+        self, message: str, chat_history: Optional[List[ChatMessage]] = None, language: str = "en"
+    ) -> CitationChatResponse:
         chat_messages, context_source, context_nodes = await self._arun_c3(
             message, chat_history
         )
+        answer_cache_key = None
+        if self._answer_cache is not None:
+            answer_cache_key = await self._aget_answer_cache_key(context_source, context_nodes)
+            if cached_answer := self._answer_cache.get(answer_cache_key, language):
+                self._put_cached_answer(cached_answer)
+                return CitationChatResponse(
+                    response=cached_answer.content,
+                    sources=[context_source],
+                    source_nodes=self._source_history.nodes,
+                    cached_answer=cached_answer,
+                )
 
         # pass the context, system prompt and user message as chat to LLM to generate a response
         chat_response = await self._llm.achat(chat_messages)
         assistant_message = chat_response.message
         self._memory.put(assistant_message)
+        self._summarize_history()
 
-        return AgentChatResponse(
+        return CitationChatResponse(
             response=str(assistant_message.content),
             sources=[context_source],
-            source_nodes=self._nodes,
+            source_nodes=self._source_history.nodes,
+            answer_cache_key=answer_cache_key,
         )
 
     @trace_method("chat")
     async def astream_chat(
-        self, message: str, chat_history: Optional[List[ChatMessage]] = None
-    ) -> StreamingAgentChatResponse:
+        self, message: str, chat_history: Optional[List[ChatMessage]] = None, language: str = "en"
+    ) -> StreamingCitationChatResponse:
         chat_messages, context_source, context_nodes = await self._arun_c3(
             message, chat_history
         )
+        answer_cache_key = None
+        if self._answer_cache is not None:
+            answer_cache_key = await self._aget_answer_cache_key(context_source, context_nodes)
+            if cached_answer := self._answer_cache.get(answer_cache_key, language):
+                self._put_cached_answer(cached_answer)
+                history_written = asyncio.get_running_loop().create_future()
+                history_written.set_result(None)
+                return self._cached_streaming_response(cached_answer, context_source, history_written)
 
         # pass the context, system prompt and user message as chat to LLM to generate a response
-        chat_response = StreamingAgentChatResponse(
+        chat_response = StreamingCitationChatResponse(
             achat_stream=await self._llm.astream_chat(chat_messages),
             sources=[context_source],
-            source_nodes=self._nodes,
+            source_nodes=self._source_history.nodes,
+            answer_cache_key=answer_cache_key,
         )
-        thread = Thread(
-            target=lambda x: asyncio.run(chat_response.awrite_response_to_history(x)),
-            args=(self._memory,),
+        # write the response on this event loop, its tokens are queued for async_response_gen on this loop
+        task = asyncio.create_task(
+            chat_response.awrite_response_to_history(self._memory, on_stream_end_fn=self._summarize_history)
         )
-        thread.start()
+        self._history_tasks.add(task)
+        task.add_done_callback(self._history_tasks.discard)
+        chat_response.history_written = task
 
         return chat_response
 
     def reset(self) -> None:
-        self._nodes = []
+        self._source_history.reset()
         super().reset()
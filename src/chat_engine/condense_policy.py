@@ -0,0 +1,112 @@
+"""Policy deciding when the condense step of CitationCondensePlusContextChatEngine needs an LLM call.
+
+Condensing a follow up question into a standalone question costs an LLM round trip before retrieval can start.
+It is not needed when there is no history to condense, or when the question already names what it is about and
+does not refer back to the conversation, and the same history and question are always condensed the same way.
+"""
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# words that refer back to the conversation, e.g. "What are its symptoms?" or "How about in children?"
+REFERENCE_PATTERN = re.compile(
+    r"\b(?:it|its|it's|itself|this|that|these|those|they|them|their|theirs|he|him|his|she|her|hers"
+    r"|former|latter|above|same|previous|other|another|else|more"
+    r"|(?:the|this|that) (?:disease|disorder|syndrome|condition|illness|gene|one))\b"
+    r"|\b(?:what|how) about\b|^\s*(?:and|also|so|then|why|how come)\b",
+    re.IGNORECASE,
+)
+# A cheap check for a named disease or gene, which favors missing a name over taking a word for one, as a follow up
+# question taken for a standalone one is retrieved without its subject, while a missed name only costs the condense
+# LLM call. Disease words alone, as in "What is the prognosis?", and acronyms such as MRI or US are not names: a name
+# is a disease noun after a capitalized word that does not start the question, e.g. "Marfan syndrome" or "Duchenne
+# muscular dystrophy", or a gene symbol, which has a digit, e.g. "BRCA1" or "COL4A5".
+DISEASE_NAME_PATTERN = re.compile(
+    r"(?<=\s)(?!(?:What|Which|How|Why|When|Where|Who|Is|Are|Does|Do|Can|Could|Should|The|A|An|And|Or)\b)"
+    r"[A-Z][a-z]+(?:'s)?(?:[\s\-]+[a-z]+)?\s+(?:disease|diseases|disorder|disorders|syndrome|syndromes|deficiency"
+    r"|dystrophy|myopathy|ataxia|atrophy|anemia|cancer|palsy|fever|sclerosis|dysplasia|agenesis)\b"
+)
+GENE_SYMBOL_PATTERN = re.compile(r"\b[A-Z]{2,}[A-Z0-9]*\d[A-Z0-9]*\b")
+
+
+def is_standalone_question(message: str) -> bool:
+    """Whether a question names a disease or gene and does not refer back to the conversation."""
+    if REFERENCE_PATTERN.search(message):
+        return False
+    return bool(DISEASE_NAME_PATTERN.search(message) or GENE_SYMBOL_PATTERN.search(message))
+
+
+class CondenseStats:
+    """Counts of the condense steps of a chat session, by how the question was condensed."""
+
+    def __init__(self) -> None:
+        self.no_history = 0
+        self.standalone = 0
+        self.cached = 0
+        self.llm_calls = 0
+
+    @property
+    def saved(self) -> int:
+        """LLM round trips saved by the policy."""
+        return self.no_history + self.standalone + self.cached
+
+    @property
+    def total(self) -> int:
+        return self.saved + self.llm_calls
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "no_history": self.no_history,
+            "standalone": self.standalone,
+            "cached": self.cached,
+            "llm_calls": self.llm_calls,
+            "saved": self.saved,
+        }
+
+
+class CondensePolicy:
+    def __init__(
+        self, is_standalone: Callable[[str], bool] | None = is_standalone_question, cache_size: int = 128
+    ) -> None:
+        self.is_standalone = is_standalone
+        self.cache_size = cache_size
+        self.stats = CondenseStats()
+        # condensed questions by (hash of the chat history, message)
+        self._cache: OrderedDict[Tuple[str, str], str] = OrderedDict()
+
+    @staticmethod
+    def _key(history: str, message: str) -> Tuple[str, str]:
+        return hashlib.sha256(history.encode()).hexdigest(), message
+
+    def condense(self, history: str, message: str) -> str | None:
+        """Return the standalone question without an LLM call, or None if the LLM needs to condense it.
+
+        history is the chat history as given to the condense prompt, empty if there is none.
+        """
+        if not history.strip():
+            self.stats.no_history += 1
+            reason, condensed = "no history", message
+        elif self.is_standalone is not None and self.is_standalone(message):
+            self.stats.standalone += 1
+            reason, condensed = "standalone question", message
+        elif (key := self._key(history, message)) in self._cache:
+            self._cache.move_to_end(key)
+            self.stats.cached += 1
+            reason, condensed = "cached", self._cache[key]
+        else:
+            self.stats.llm_calls += 1
+            return None
+        logger.info(f"Skipped condensing ({reason}), {self.stats.saved} of {self.stats.total} LLM calls saved")
+        return condensed
+
+    def put(self, history: str, message: str, condensed: str) -> None:
+        """Cache the question condensed by the LLM."""
+        key = self._key(history, message)
+        self._cache[key] = condensed
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,151 @@
+"""Packing of the retrieved triples into the context prompt.
+
+The retriever returns the top k triples regardless of their length, and many of them are near duplicates, e.g. the
+same organization or prevalence with different formatting or citations. ContextPacker drops near duplicates,
+merging their citations into the triple that is kept, then keeps the best ranked triples that fit in a token
+budget. The triples are written grouped, so that the text they share is written once instead of on every line,
+either by subject ("subject" format):
+
+    Marfan syndrome:
+    Source 1: has phenotype Arachnodactyly
+    Source 2: has phenotype Ectopia lentis
+
+or by subject and predicate ("predicate" format):
+
+    Marfan syndrome has phenotype:
+    Source 1: Arachnodactyly
+    Source 2: Ectopia lentis
+
+Every line keeps its source number, which citation.get_source_nodes maps back to the triple of the line.
+"""
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
+
+from citation import SOURCE_NUMBER_KEY
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import NodeWithScore
+
+# "lines" is one "Source N: subject predicate object" line per triple
+CONTEXT_FORMATS = ("lines", "subject", "predicate")
+DEFAULT_CONTEXT_FORMAT = "subject"
+# the share of the LLM context window given to the sources when no token budget is set
+DEFAULT_CONTEXT_WINDOW_SHARE = 0.5
+# stands for the source number when measuring lines before the nodes are numbered
+SOURCE_NUMBER_PLACEHOLDER = 100
+NORMALIZE_PATTERN = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase text and collapse punctuation and whitespace, so that near-identical texts compare equal."""
+    return NORMALIZE_PATTERN.sub(" ", text.lower()).strip()
+
+
+def get_triple(node: NodeWithScore) -> Tuple[str, str, str] | None:
+    metadata = node.node.metadata
+    if "subject" not in metadata:
+        return None
+    return metadata["subject"], metadata["predicate"], metadata["object"]
+
+
+def dedup_nodes(nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+    """Drop triples that are near-identical to a better ranked triple, keeping the citations of both."""
+    kept: Dict[Tuple[str, ...] | int, NodeWithScore] = {}
+    for i, node in enumerate(nodes):
+        triple = get_triple(node)
+        key = tuple(map(normalize_text, triple)) if triple is not None else i
+        if key not in kept:
+            kept[key] = node
+            continue
+        node_with_citations = kept[key]
+        citation = list(dict.fromkeys(node_with_citations.node.metadata["citation"] + node.node.metadata["citation"]))
+        node_with_citations.node.metadata = {**node_with_citations.node.metadata, "citation": citation}
+    return list(kept.values())
+
+
+def format_text(node: NodeWithScore) -> str:
+    """The text of a node that is not a triple, as the LLM sees it."""
+    from llama_index.core.schema import MetadataMode
+
+    return node.node.get_content(metadata_mode=MetadataMode.LLM).strip()
+
+
+def get_group(node: NodeWithScore, format: str) -> str | None:
+    """The header of the group of a node, or None if the node is written on its own."""
+    triple = get_triple(node)
+    if triple is None or format == "lines":
+        return None
+    subject, predicate, _ = triple
+    if format == "predicate":
+        return f"{subject} {predicate}:"
+    return f"{subject}:"
+
+
+def format_line(node: NodeWithScore, source_number: int, format: str) -> str:
+    """The line of a triple, without the text of its group."""
+    subject, predicate, obj = get_triple(node)
+    if format == "predicate":
+        return f"Source {source_number}: {obj}".strip()
+    if format == "subject":
+        return f"Source {source_number}: {predicate} {obj}".strip()
+    return f"Source {source_number}: {subject} {predicate} {obj}".strip()
+
+
+class ContextPacker:
+    def __init__(
+        self,
+        token_budget: int | None = None,
+        count_tokens: Callable[[str], int] = len,
+        format: str = DEFAULT_CONTEXT_FORMAT,
+    ) -> None:
+        """Pack sources into token_budget tokens as measured by count_tokens, without a limit if it is None."""
+        if format not in CONTEXT_FORMATS:
+            raise ValueError(f"Unsupported context format {format!r}, expected one of {CONTEXT_FORMATS}")
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens
+        self.format = format
+
+    def select(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        """Drop near duplicates, then keep the best ranked nodes that fit in the token budget, in rank order."""
+        nodes = dedup_nodes(nodes)
+        if self.token_budget is None:
+            return nodes
+        selected = []
+        groups = set()
+        tokens = 0
+        for node in nodes:
+            group = get_group(node, self.format)
+            # lines are separated by a newline within a group, and groups by a blank line
+            if get_triple(node) is None:
+                line = f"Source {SOURCE_NUMBER_PLACEHOLDER}: {format_text(node)}"
+            else:
+                line = format_line(node, SOURCE_NUMBER_PLACEHOLDER, self.format)
+            cost = self.count_tokens(line + "\n\n")
+            if group is not None and group not in groups:
+                cost += self.count_tokens(group + "\n")
+            if tokens + cost > self.token_budget:
+                # a shorter node further down may still fit
+                continue
+            tokens += cost
+            selected.append(node)
+            if group is not None:
+                groups.add(group)
+        return selected
+
+    def pack(self, nodes: List[NodeWithScore]) -> str:
+        """Write numbered nodes as the context string, grouped in order of their first node."""
+        groups: Dict[str | int, List[str]] = {}
+        for i, node in enumerate(nodes):
+            group = get_group(node, self.format)
+            if get_triple(node) is None:
+                # the text of the node already starts with its source number
+                line = format_text(node)
+            else:
+                line = format_line(node, node.node.metadata[SOURCE_NUMBER_KEY], self.format)
+            groups.setdefault(group if group is not None else i, []).append(line)
+        return "\n\n".join(
+            "\n".join([group, *lines]) if isinstance(group, str) else lines[0]
+            for group, lines in groups.items()
+        )
@@ -0,0 +1,59 @@
+"""Sources cited by the answers of a chat session.
+
+Each turn gives the LLM a window of sources, numbered after the sources of the previous turns, so that "Source N"
+in an answer still refers to the same source in later turns. Answers mostly cite the sources of their own turn,
+and sometimes those of the previous turns that are still in the chat history, so only the windows of the last few
+turns are kept, instead of every source of the session.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import TYPE_CHECKING, Deque, List
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import NodeWithScore
+
+DEFAULT_SOURCE_HISTORY_TURNS = 3
+DEFAULT_SOURCE_HISTORY_NODES = 200
+
+
+class SourceHistory:
+    def __init__(
+        self,
+        max_turns: int | None = DEFAULT_SOURCE_HISTORY_TURNS,
+        max_nodes: int | None = DEFAULT_SOURCE_HISTORY_NODES,
+    ) -> None:
+        """Keep the sources of the last max_turns turns, and drop the oldest turns above max_nodes sources.
+
+        The sources of the current turn are always kept. None disables a limit.
+        """
+        self.max_turns = max_turns
+        self.max_nodes = max_nodes
+        self._windows: Deque[List[NodeWithScore]] = deque()
+        self._num_nodes = 0
+        self._next_source_number = 1
+
+    def next_source_number(self) -> int:
+        source_number = self._next_source_number
+        self._next_source_number += 1
+        return source_number
+
+    def add_window(self, nodes: List[NodeWithScore]) -> None:
+        """Add the sources given to the LLM in a turn."""
+        self._windows.append(list(nodes))
+        self._num_nodes += len(nodes)
+        while len(self._windows) > 1 and (
+            (self.max_turns is not None and len(self._windows) > self.max_turns)
+            or (self.max_nodes is not None and self._num_nodes > self.max_nodes)
+        ):
+            self._num_nodes -= len(self._windows.popleft())
+
+    @property
+    def nodes(self) -> List[NodeWithScore]:
+        """The sources that answers can cite, oldest first."""
+        return [node for window in self._windows for node in window]
+
+    def reset(self) -> None:
+        self._windows.clear()
+        self._num_nodes = 0
+        self._next_source_number = 1
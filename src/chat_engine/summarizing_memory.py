@@ -0,0 +1,193 @@
+"""Chat memory that keeps the last turns verbatim and a rolling summary of the older turns.
+
+ChatMemoryBuffer gives the condense prompt and the chat call the whole history, up to its token limit, so the
+prompts of long sessions grow until they hit the limit. SummarizingChatMemory keeps the last verbatim_turns turns
+as they are and folds the older turns into a summary. The summary is updated in the background once a response
+is complete (see schedule_summary), so it never delays an answer: until it is updated, the turns that are not
+summarized yet are given verbatim.
+
+The summary is given as a user message, acknowledged by an assistant message, before the verbatim turns. The chat
+engine already sends the system prompt and context as a system message, and the chat templates of Llama and
+Mistral models reject a second system message, or one that is not first.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from llama_index.core.base.llms.generic_utils import messages_to_history_str
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms.llm import LLM
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.memory.types import DEFAULT_CHAT_STORE_KEY
+from llama_index.core.prompts.base import PromptTemplate
+from llama_index.core.storage.chat_store import BaseChatStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERBATIM_TURNS = 2
+DEFAULT_SUMMARY_PROMPT = PromptTemplate(
+    "Update the summary of a conversation between a user and an AI assistant about rare diseases with the new "
+    "messages below. Keep the diseases, genes and other subjects the user asked about and the main facts of the "
+    "answers, and leave out source citations. Answer with the updated summary only, in at most 200 words.\n\n"
+    "Summary:\n{summary}\n\n"
+    "New messages:\n{chat_history}\n\n"
+    "Updated summary:"
+)
+SUMMARY_MESSAGE_PREFIX = "Summary of the earlier conversation: "
+SUMMARY_ACKNOWLEDGEMENT = "Thank you, I will keep the earlier conversation in mind."
+
+# Shared by all sessions, for summaries of chat engines that are not used from an event loop.
+SUMMARY_WORKERS = 2
+summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="memory_summary")
+
+
+class SummarizingChatMemory(ChatMemoryBuffer):
+    llm: Optional[LLM] = Field(default=None, exclude=True)
+    verbatim_turns: int = Field(default=DEFAULT_VERBATIM_TURNS, ge=1)
+    summary_prompt: PromptTemplate = Field(default=DEFAULT_SUMMARY_PROMPT, exclude=True)
+    summary: str = ""
+    # the number of messages of the chat store, from the start, that are folded into the summary
+    summarized_count: int = 0
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _summarizing: bool = PrivateAttr(default=False)
+    # incremented when the history is replaced, so that a summary of the previous history is discarded
+    _generation: int = PrivateAttr(default=0)
+    # the background summary, referenced so that its task is not garbage collected
+    _summary_task: asyncio.Task | Future | None = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SummarizingChatMemory"
+
+    @classmethod
+    def from_defaults(
+        cls,
+        chat_history: Optional[List[ChatMessage]] = None,
+        llm: Optional[LLM] = None,
+        chat_store: Optional[BaseChatStore] = None,
+        chat_store_key: str = DEFAULT_CHAT_STORE_KEY,
+        token_limit: Optional[int] = None,
+        tokenizer_fn: Optional[Callable[[str], List]] = None,
+        verbatim_turns: int = DEFAULT_VERBATIM_TURNS,
+    ) -> "SummarizingChatMemory":
+        """Create a summarizing chat memory, that summarizes with the LLM."""
+        memory = super().from_defaults(
+            chat_history=chat_history,
+            llm=llm,
+            chat_store=chat_store,
+            chat_store_key=chat_store_key,
+            token_limit=token_limit,
+            tokenizer_fn=tokenizer_fn,
+        )
+        memory.llm = llm
+        memory.verbatim_turns = verbatim_turns
+        return memory
+
+    def get(self, initial_token_count: int = 0, **kwargs: Any) -> List[ChatMessage]:
+        """Get the summary as a user and assistant message, then the unsummarized messages, within the token limit."""
+        with self._lock:
+            summary, summarized_count = self.summary, self.summarized_count
+        messages = self.get_all()[summarized_count:]
+        summary_messages = []
+        if summary:
+            summary_messages = [
+                ChatMessage(role=MessageRole.USER, content=SUMMARY_MESSAGE_PREFIX + summary),
+                ChatMessage(role=MessageRole.ASSISTANT, content=SUMMARY_ACKNOWLEDGEMENT),
+            ]
+            initial_token_count += self._token_count_for_messages(summary_messages)
+        if initial_token_count > self.token_limit:
+            raise ValueError("Initial token count exceeds token limit")
+
+        # drop the oldest messages that do not fit, as ChatMemoryBuffer.get does
+        while messages and self._token_count_for_messages(messages) + initial_token_count > self.token_limit:
+            messages = messages[1:]
+            # the history cannot start with an assistant or tool message
+            while messages and messages[0].role in (MessageRole.ASSISTANT, MessageRole.TOOL):
+                messages = messages[1:]
+        return summary_messages + messages
+
+    def set(self, messages: List[ChatMessage]) -> None:
+        with self._lock:
+            self.summary = ""
+            self.summarized_count = 0
+            self._generation += 1
+        super().set(messages)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.summary = ""
+            self.summarized_count = 0
+            self._generation += 1
+        super().reset()
+
+    def _get_summary_end(self, messages: List[ChatMessage]) -> int:
+        """The index of the first message of the last verbatim_turns turns."""
+        user_indices = [i for i, message in enumerate(messages) if message.role == MessageRole.USER]
+        if len(user_indices) <= self.verbatim_turns:
+            return 0
+        return user_indices[-self.verbatim_turns]
+
+    def _start_summary(self) -> Tuple[int, int, str, str] | None:
+        """Claim the turns to summarize, or return None if there are none or they are already being summarized."""
+        with self._lock:
+            if self._summarizing or self.llm is None:
+                return None
+            messages = self.get_all()
+            end = self._get_summary_end(messages)
+            if end <= self.summarized_count:
+                return None
+            self._summarizing = True
+            chat_history = messages_to_history_str(messages[self.summarized_count:end])
+            return self._generation, end, self.summary, chat_history
+
+    def _finish_summary(self, generation: int, end: int, summary: str | None) -> None:
+        with self._lock:
+            self._summarizing = False
+            # the history may have been reset or replaced while summarizing
+            if summary is not None and generation == self._generation:
+                self.summary = summary.strip()
+                self.summarized_count = end
+                logger.debug(f"Summarized the first {end} messages of the chat history")
+
+    def summarize(self) -> None:
+        """Fold the turns before the last verbatim_turns turns into the summary."""
+        if (start := self._start_summary()) is None:
+            return
+        generation, end, summary, chat_history = start
+        new_summary = None
+        try:
+            new_summary = self.llm.predict(self.summary_prompt, summary=summary or "(empty)", chat_history=chat_history)
+        except Exception:
+            logger.exception("Summarizing the chat history failed")
+        finally:
+            self._finish_summary(generation, end, new_summary)
+
+    async def asummarize(self) -> None:
+        """Fold the turns before the last verbatim_turns turns into the summary."""
+        if (start := self._start_summary()) is None:
+            return
+        generation, end, summary, chat_history = start
+        new_summary = None
+        try:
+            new_summary = await self.llm.apredict(
+                self.summary_prompt, summary=summary or "(empty)", chat_history=chat_history
+            )
+        except Exception:
+            logger.exception("Summarizing the chat history failed")
+        finally:
+            # also when cancelled, so that later summaries are not blocked
+            self._finish_summary(generation, end, new_summary)
+
+    def schedule_summary(self) -> asyncio.Task | Future:
+        """Summarize in the background, on the running event loop if there is one, or on a worker thread."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._summary_task = summary_executor.submit(self.summarize)
+        else:
+            self._summary_task = loop.create_task(self.asummarize())
+        return self._summary_task
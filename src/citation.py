@@ -1,85 +1,104 @@
+from __future__ import annotations
+
+import asyncio
 import gzip
 import logging
 import re
+import sqlite3
 import xml.etree.ElementTree as ET
 from collections import defaultdict
-from typing import List
-from uuid import uuid4
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple
+
+from apa import format_article
+from bibliography_cache import get_bibliography_cache
+from citation_store import get_citation_store, parse_article
+from resources import get_apa_style, get_gard, get_text_backend
+from source_graph import get_source_graph_store
 
-import pydot
-from gard import GARD
-from llama_index.core.base.response.schema import RESPONSE_TYPE
-from llama_index.core.schema import NodeWithScore
-from metapub import PubMedFetcher
-from pybtex.database import parse_string
-from pybtex.plugin import find_plugin
+if TYPE_CHECKING:
+    from llama_index.core.base.response.schema import RESPONSE_TYPE
+    from llama_index.core.schema import NodeWithScore
 
 logger = logging.getLogger(__name__)
-gard = GARD()
 
+# Shared by all sessions, so that concurrent answers do not each start their own threads.
+# Formatting a PMID citation is mostly file and gzip I/O (on a cache miss), which releases the GIL.
+CITATION_FORMATTING_WORKERS = 8
+citation_executor = ThreadPoolExecutor(max_workers=CITATION_FORMATTING_WORKERS, thread_name_prefix="citation")
+
+# metadata key of the "Source N" number given to each node by CitationCondensePlusContextChatEngine
+SOURCE_NUMBER_KEY = "source_number"
 
-def onlineFullCitation(pmid: str, citation: str):
+
+async def onlineFullCitation(pmid: str, citation: str):
     """
-    Search PMC by PMID. Get article title, authors,
-    journal and abstract. (max 3 req per second w/out API, 10 with)
+    Search PubMed by PMID. Get article title, authors,
+    journal and year. Requests are rate limited to 3 per second
+    without an NCBI API key and 10 with one (see pubmed.py).
     Args:
         pmid(str): PMID to create citation for
         citation(str): original citation str
     Returns:
         citation(str): formatted citation
     """
-    full_citation = ""
-    fetch = PubMedFetcher()
+    from pubmed import get_pubmed_client, parse_summary
+
     try:
-        article = fetch.article_by_pmid(pmid)
-    except:
+        xml = await get_pubmed_client().fetch_article(pmid)
+    except Exception:
+        logger.exception(f"Could not fetch PMID {pmid}")
+        xml = None
+    if xml is None:
         return f"[{citation}](https://pubmed.ncbi.nlm.nih.gov/{pmid})"
+    article = parse_summary(xml)
     # extract metadata
-    full_citation += article.title
-    full_citation += f"\nJOURNAL: {article.journal}, {article.year}\nAUTHORS: {', '.join(article.authors)}\n"
+    full_citation = article["title"]
+    full_citation += f"\nJOURNAL: {article['journal']}, {article['year']}\nAUTHORS: {', '.join(article['authors'])}\n"
     # add link
     full_citation += f"https://pubmed.ncbi.nlm.nih.gov/{pmid}\n"
     return full_citation
 
 
 def bib_to_apa7_html(bibtex):
-    bibliography = parse_string(bibtex, "bibtex")
-    formatted_bib = APA.format_bibliography(bibliography)
-    return "\n".join(entry.text.render(TEXT) for entry in formatted_bib)
-
-
-def find_text(element, tag):
-    e = element.find(tag)
-    if e is not None:
-        return e.text
-    return ""
-
+    from pybtex.database import parse_string
 
-APA = find_plugin("pybtex.style.formatting", "apa")()
-TEXT = find_plugin("pybtex.backends", "text")()
+    bibliography = parse_string(bibtex, "bibtex")
+    formatted_bib = get_apa_style().format_bibliography(bibliography)
+    text = get_text_backend()
+    return "\n".join(entry.text.render(text) for entry in formatted_bib)
 
 
-def pmid_to_bib(pmid):
+def pmid_to_record(pmid):
+    """Get the citation fields of a PMID, from the citation store if it was built, otherwise from the archive."""
     pmid = int(pmid)
+    citation_store = get_citation_store()
+    if citation_store is not None and (record := citation_store.get(pmid)) is not None:
+        return record
     padded_pmid = f"{pmid:08d}"
     with gzip.open(
         f"/data/Archive/pubmed/Archive/{padded_pmid[:2]}/{padded_pmid[2:4]}/{padded_pmid[4:6]}/{pmid}.xml.gz"
     ) as f:
         xml = f.read()
     root = ET.fromstring(xml)
-    authors = []
-    for a in root.findall(".//Author"):
-        lastname = find_text(a, ".//LastName")
-        forename = find_text(a, ".//ForeName")
-        authors.append(f"{lastname}, {forename}")
-    author = " and ".join(authors)
+    return parse_article(root)
+
+
+def pmid_to_bib(pmid):
+    pmid = int(pmid)
+    return record_to_bib(pmid, pmid_to_record(pmid))
+
+
+def record_to_bib(pmid, record):
+    author = record["author"]
     if author == "":
         author = "Anonymous"
-    title = find_text(root, ".//ArticleTitle")
-    journal = find_text(root, ".//Journal/Title")
-    year = find_text(root, ".//PubDate/Year")
-    month = find_text(root, ".//PubDate/Month")
-    doi = find_text(root, ".//ArticleId[@IdType='doi']")
+    title = record["title"]
+    journal = record["journal"]
+    year = record["year"]
+    month = record["month"]
+    doi = record["doi"]
     url = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
 
     bibtex = f"""
@@ -96,9 +115,37 @@ def pmid_to_bib(pmid):
     return bibtex
 
 
+def format_pmid_citation(pmid):
+    pmid = int(pmid)
+    record = pmid_to_record(pmid)
+    citation = format_article(pmid, record)
+    if citation is None:
+        # LaTeX markup or unusual names, which only pybtex formats correctly
+        citation = bib_to_apa7_html(record_to_bib(pmid, record))
+    return citation
+
+
 def generate_full_pmid_citation(pmid):
-    bibtex = pmid_to_bib(pmid)
-    citation = bib_to_apa7_html(bibtex)
+    return _generate_full_pmid_citation(int(pmid))
+
+
+@lru_cache(maxsize=4096)
+def _generate_full_pmid_citation(pmid: int):
+    # the bibliography cache only saves formatting, so its errors fall back to formatting the citation
+    bibliography_cache = get_bibliography_cache()
+    if bibliography_cache is None:
+        return format_pmid_citation(pmid)
+    try:
+        citation = bibliography_cache.get(pmid)
+    except sqlite3.Error:
+        logger.warning(f"Could not read PMID {pmid} from the bibliography cache", exc_info=True)
+        citation = None
+    if citation is None:
+        citation = format_pmid_citation(pmid)
+        try:
+            bibliography_cache.put(pmid, citation)
+        except sqlite3.Error:
+            logger.warning(f"Could not write PMID {pmid} to the bibliography cache", exc_info=True)
     return citation
 
 
@@ -127,16 +174,18 @@ def format_citation(citation: str):
         # return f"[{citation}](https://uts.nlm.nih.gov/metathesaurus.html#?searchString={umls_identifier})"
     elif citation.startswith("GARD:"):
         gard_identifier = citation.removeprefix("GARD:")
-        return f"[{citation}]({gard.get_url(gard_identifier)})"
+        return f"[{citation}]({get_gard().get_url(gard_identifier)})"
     else:
         return citation
 
 
 def format_citations2(citations: List[str]):
-    citations_formatted = []
-    for citation in citations:
-        citations_formatted.append(format_citation(citation))
-    return citations_formatted
+    """Format citations concurrently, in the same order as the input."""
+    unique_citations = list(dict.fromkeys(citations))
+    if len(unique_citations) <= 1:
+        return [format_citation(citation) for citation in citations]
+    formatted = dict(zip(unique_citations, citation_executor.map(format_citation, unique_citations)))
+    return [formatted[citation] for citation in citations]
 
 
 async def get_formatted_sources(source_nodes: List[NodeWithScore]):
@@ -149,9 +198,7 @@ async def get_formatted_sources(source_nodes: List[NodeWithScore]):
     sources_dict = {}
 
     for node in source_nodes:
-        # get source number
-        text = node.text
-        source_number = int(text.split(":")[0].removeprefix("Source "))
+        source_number = get_source_number(node)
         # get list of formatted source URLs
         citations = format_citations2(node.metadata["citation"])
         # add URLs and source number to dict
@@ -195,12 +242,13 @@ def generate_bibliography(source_nodes: List[NodeWithScore], source_order: List[
     # deduplicate sources
     source_map = {}
     for node in source_nodes:
-        source_number = int(node.text.split(":")[0].removeprefix("Source "))
+        source_number = get_source_number(node)
         candidate_citations = node.metadata["citation"]
         citation = candidate_citations[0]
         print(f"Source {source_number}: {citation}")
         if source_number not in source_map:
-            source_map[source_number] = format_citation(citation)
+            source_map[source_number] = citation
+    source_map = dict(zip(source_map, format_citations2(list(source_map.values()))))
 
     inline_citation_map = defaultdict(list)
     citation_bibliography_number = {}
@@ -218,13 +266,25 @@ def generate_bibliography(source_nodes: List[NodeWithScore], source_order: List[
     return references, inline_citation_map
 
 
+def get_source_number(node: NodeWithScore) -> int:
+    source_number = node.metadata.get(SOURCE_NUMBER_KEY)
+    if source_number is None:
+        # nodes created before the source number was stored in their metadata
+        source_number = int(node.text.split(":")[0].removeprefix("Source "))
+    return source_number
+
+
+def index_source_nodes(source_nodes: List[NodeWithScore]) -> Dict[int, NodeWithScore]:
+    """Map source numbers to their nodes, keeping the first node of each number."""
+    source_index = {}
+    for node in source_nodes:
+        source_index.setdefault(get_source_number(node), node)
+    return source_index
+
+
 def get_source_nodes(response: RESPONSE_TYPE, content: str, sources: set[int]):
-    source_nodes = []
-    for source_node in response.source_nodes:
-        source = int(source_node.text.split(":")[0].removeprefix("Source "))
-        if source in sources:
-            source_nodes.append(source_node)
-    return source_nodes
+    source_index = index_source_nodes(response.source_nodes)
+    return [source_index[source] for source in sorted(sources) if source in source_index]
 
 
 def get_sources(content: str):
@@ -235,18 +295,19 @@ def get_sources(content: str):
     return sources
 
 
-def get_source_graph(source_nodes: List[NodeWithScore]):
-    graph = pydot.Dot("source_graph", graph_type="digraph")
+def get_source_graph_edges(source_nodes: List[NodeWithScore]) -> List[Tuple[str, str, str]]:
+    return [(node.metadata["subject"], node.metadata["predicate"], node.metadata["object"]) for node in source_nodes]
 
-    for node in source_nodes:
-        subj = node.metadata["subject"]
-        obj = node.metadata["object"]
-        predicate = node.metadata["predicate"]
-        graph.add_edge(pydot.Edge(subj, obj, label=predicate))
 
-    filename = f".files/{uuid4()}.png"
-    graph.write_png(filename)
-    return filename
+def get_source_graph(source_nodes: List[NodeWithScore], format: str = "png") -> str:
+    """Render the graph of the source triples, returning the file path. format is "png" or "svg"."""
+    return get_source_graph_store().submit(get_source_graph_edges(source_nodes), format=format).result()
+
+
+async def aget_source_graph(source_nodes: List[NodeWithScore], format: str = "png") -> str:
+    """Render the graph of the source triples without blocking the event loop."""
+    future = get_source_graph_store().submit(get_source_graph_edges(source_nodes), format=format)
+    return await asyncio.wrap_future(future)
 
 
 def smart_inline_citation_format(numbers: list[int]):
@@ -275,87 +336,6 @@ def smart_inline_citation_format(numbers: list[int]):
     return f"[{cites}]"
 
 
-def merge_adjacent_citations(content: str):
-    # test case
-    # GNE Myopathy is a rare genetic disorder characterized by progressive muscle weakness and atrophy, primarily affecting skeletal muscles. The condition is caused by mutations in the GNE gene, which encodes an enzyme involved in the synthesis of sialic acid, a crucial component of cell membranes and various glycoproteins [1-10], [8], [9], [10], [11], [12], [13], [14], [15], [16], [17], [18], [19], [20], [21], [22], [23], [24], [25], [26].\n\nThe symptoms of GNE Myopathy typically manifest during early childhood or adolescence and include muscle weakness, muscle atrophy, and abnormal electrical activity in muscles as detected by electromyography (EMG) tests [2], [3], [4], [5], [6]. Over time, the disease can lead to significant disability and impaired mobility.\n\nThe GNE gene has multiple allelic variants associated with GNE Myopathy, which are responsible for the different forms of the disorder observed in affected individuals [17], [18], [19], [20]. The specific variant determines the severity and progression of the disease, as well as the age of onset and other clinical features.\n\nIn summary, GNE Myopathy is a genetic disorder characterized by muscle weakness, atrophy, and electrical abnormalities in muscles due to mutations in the GNE gene. The condition affects skeletal muscles and can lead to significant disability over time.
-    content = re.sub(r"\], \[", ", ", content)
-    citations = re.findall(r"(\[[\d,\- ]+\])", content)
-    mapping = {}
-    for cite in citations:
-        numbers = get_numbers_complex(cite)
-        mapping[cite] = smart_inline_citation_format(numbers)
-    for x, y in mapping.items():
-        content = content.replace(x, y)
-    return content
-
-
-def get_numbers_complex(cite):
-    x = cite.removeprefix("[").removesuffix("]").split(",")
-    numbers = set()
-    for a in x:
-        if "-" in a:
-            start, end = map(int, a.split("-"))
-            numbers.update(range(start, end + 1))
-        try:
-            numbers.add(int(a))
-        except ValueError:
-            pass
-    numbers = list(numbers)
-    return numbers
-
-
-def get_numbers(source):
-    numbers = source.split(",")
-    numbers = map(str.strip, numbers)
-    numbers = filter(None, numbers)
-    numbers = [int(x) for x in numbers]
-    return numbers
-
-
-def expand_citations(content: str):
-    # (Sources 3, 8, and 9) -> (Source 3, Source 8, Source 9)
-    sources = re.findall(r"Sources (\d[\d,\- ]*), and (\d[\d,\- ]*)", content)
-    for source, and_source in sources:
-        numbers = get_numbers_complex(source)
-        numbers.extend(get_numbers_complex(and_source))
-        content = content.replace(f"Sources {source}, and {and_source}", ", ".join([f"Source {x}" for x in numbers]))
-     # (Sources 3, 8 and 9) -> (Source 3, Source 8, Source 9)
-    sources = re.findall(r"Sources (\d[\d,\- ]*) and (\d[\d,\- ]*)", content)
-    for source, and_source in sources:
-        numbers = get_numbers_complex(source)
-        numbers.extend(get_numbers_complex(and_source))
-        content = content.replace(f"Sources {source} and {and_source}", ", ".join([f"Source {x}" for x in numbers]))
-    # (Sources 9-12) -> (Source 9, Source 10, Source 11, Source 12)
-    sources = re.findall(r"Sources* (\d[\d,\- ]*)-([\d[\d,\- ]*)", content)
-    for start, end in sources:
-        end = get_numbers_complex(end)[-1]
-        numbers = list(range(int(start), end + 1))
-        if f"Sources {start}-{end}" in content:
-            content = content.replace(f"Sources {start}-{end}", ", ".join([f"Source {x}" for x in numbers]))
-        else:
-            content = content.replace(f"Source {start}-{end}", ", ".join([f"Source {x}" for x in numbers]))
-    # (Sources 5, 6, 7) -> (Source 5), (Source 6), (Source 7)
-    sources = re.findall(r"Sources (\d[\d,\- ]*)", content)
-    for source in sources:
-        numbers = get_numbers_complex(source)
-        if len(numbers) == 1:
-            content = content.replace(f"Sources {source}", f"Source {numbers[0]}")
-        else:
-            content = content.replace(f"Sources {source}", ", ".join([f"Source {x}" for x in numbers]))
-    # [3, 4, and 5] -> [3, 4, 5]
-    sources = re.findall(r"\[(\d[\d,\- ]*), and (\d[\d,\- ]*)\]", content)
-    for source, and_source in sources:
-        numbers = get_numbers_complex(source)
-        numbers.append(int(and_source))
-        content = content.replace(f"{source}, and {and_source}", ", ".join([f"[{x}]" for x in numbers]))
-    # [3, 4, 5] -> [3], [4], [5]
-    sources = re.findall(r"\[(\d[\d,\- ]+)\]", content)
-    for source in sources:
-        numbers = get_numbers_complex(source)
-        content = content.replace(source, ", ".join([f"[{x}]" for x in numbers]))
-    return content
-
-
 def postprocess_citation(response):
     content = response.response
     print("LLM Output:")
@@ -364,33 +344,18 @@ def postprocess_citation(response):
     content = content.split("Sources:")[0].strip()
     content = content.split("\n\nSource:")[0].strip()
     content = content.split("References:")[0].strip()
-    content = expand_citations(content)
-    content = normalize_citations(content)
-
 
-    print("Normalized Citations:")
-    print(content)
-
-    source_order = get_source_order(content)
+    source_order = get_citation_order(content)
     print('Source Order:', source_order)
 
-    source_nodes =  get_source_nodes(response, content, source_order)
+    source_nodes = get_source_nodes(response, content, set(source_order))
     print("Source Nodes: ", len(source_nodes))
 
-    # remove extraneous hallucinated sources
-    # if source_order:
-    #     for i in range(len(source_nodes) + 1, max(source_order) + 1):
-    #         content = re.sub(rf"\W*\[{i}\],", "", content)
-    #         content = re.sub(rf"\W*\[{i}\]", "", content)
-
     bibliography = None
+    inline_citation_map = {}
     if source_nodes:
-        source_order = get_source_order(content)
-        print('Source Order:', source_order)
         bibliography, inline_citation_map = generate_bibliography(source_nodes, source_order)
-        for source_number, biblography_numbers in inline_citation_map.items():
-            content = re.sub(rf"\[{source_number}\]", smart_inline_citation_format(biblography_numbers), content)
-            content = merge_adjacent_citations(content)
+    content = rewrite_citations(content, inline_citation_map)
 
     print('With Citations:')
     print(content)
@@ -399,17 +364,197 @@ def postprocess_citation(response):
     return content, bibliography
 
 
-def normalize_citations(content):
-    content = re.sub(r"Source (\d+)", r"[\1]", content, flags=re.I)
-    content = re.sub(r"\(([\d, -]+)\)[., ]", r"[\1].", content)
-    content = re.sub(r"\(\[", "[", content)
-    content = re.sub(r"\]\)", "]", content)
-    content = re.sub(r"\[\[+", "[", content)
-    content = re.sub(r"\]\]+", "]", content)
-    return content
+# Citation markers written by the LLM: [3], [3, 4, and 5], [3-5], [Source 3], Source 3, Sources 3, 8, and 9,
+# and runs of these separated by ", ", optionally in parentheses: (Source 3, Source 8).
+CITATION_NUMBERS = r"\d+(?:\s*(?:,\s*and|,|and|-)\s*\d+)*"
+CITATION_ITEM = rf"\[\s*(?:Sources?\s+)?{CITATION_NUMBERS}\s*\]|Sources\s+{CITATION_NUMBERS}|Source\s+\d+(?:\s*-\s*\d+)?"
+CITATION_RUN = rf"(?:{CITATION_ITEM})(?:,\s(?:{CITATION_ITEM}))*"
+CITATION_PATTERN = re.compile(
+    rf"\(\s*({CITATION_RUN})\s*\)|({CITATION_RUN})|\((\d+(?:\s*[,-]\s*\d+)*)\)(?=[., ]|$)", re.IGNORECASE
+)
+CITATION_NUMBER_PATTERN = re.compile(r"(\d+)(?:\s*-\s*(\d+))?")
+
 
+def get_citation_numbers(citation: str) -> List[int]:
+    """Source numbers of a citation marker, in order, with ranges expanded."""
+    numbers = []
+    for start, end in CITATION_NUMBER_PATTERN.findall(citation):
+        if end:
+            numbers.extend(range(int(start), int(end) + 1))
+        else:
+            numbers.append(int(start))
+    return numbers
+
+
+def get_citation_order(content: str) -> List[int]:
+    """Source numbers cited in content, in order of first citation."""
+    source_order = {}
+    for match in CITATION_PATTERN.finditer(content):
+        source_order.update(dict.fromkeys(get_citation_numbers(match.group())))
+    return list(source_order)
+
+
+def format_inline_citation(source_numbers: List[int], inline_citation_map: dict[int, List[int]]) -> str:
+    numbers = set()
+    for source_number in source_numbers:
+        numbers.update(inline_citation_map.get(source_number, [source_number]))
+    return smart_inline_citation_format(list(numbers))
+
+
+def rewrite_citations(content: str, inline_citation_map: dict[int, List[int]]) -> str:
+    """Replace the source numbers of citation markers with bibliography numbers, in a single pass.
+
+    Each run of adjacent markers becomes one citation, e.g. "(Source 3, Source 8)" -> "[1-2]". Sources that are not
+    in the bibliography keep their number.
+    """
+    return CITATION_PATTERN.sub(
+        lambda match: format_inline_citation(get_citation_numbers(match.group()), inline_citation_map), content
+    )
+
+
+# Where postprocess_citation cuts off the answer, before a list of sources repeated by the LLM
+ANSWER_END_MARKERS = ("Sources:", "\n\nSource:", "References:")
+# The end of a text that could still become the start of a citation marker, e.g. "[3, 4" or "(Sour". This accepts
+# more than CITATION_PATTERN's prefixes, so it may hold back text longer than needed, but never cuts a marker.
+CITATION_PREFIX_PATTERN = re.compile(
+    r"(?:[\[(]|(?=s))(?:sources?|and|\d|[\s,\-\[\]()])*(?:s(?:o(?:u(?:r(?:ce?)?)?)?)?|an?)?\Z", re.IGNORECASE
+)
+
+
+class StreamingCitationRewriter:
+    """Rewrite citations of an answer as it is streamed, with the same result as postprocess_citation.
+
+    Text is released as soon as it cannot be part of a citation marker that is still being generated, with its
+    citations rewritten to bibliography numbers, which are assigned in order of first citation as they are seen.
+    """
 
-def get_source_order(content):
-    source_order = re.findall(r"\[(\d+)\]", content)
-    source_order = [int(source) for source in source_order]
-    return source_order
+    def __init__(self, source_nodes: List[NodeWithScore]) -> None:
+        self._source_index = index_source_nodes(source_nodes)
+        self._inline_citation_map: dict[int, List[int]] = {}
+        self._bibliography_numbers: dict[str, int] = {}
+        self._references = ""
+        # the formatted citations of the cited sources, by source number
+        self._citations: dict[int, Future] = {}
+        self._buffer = ""
+        self._started = False
+        self._ended = False
+        self.content = ""
+
+    @property
+    def bibliography(self) -> str | None:
+        if not self._bibliography_numbers:
+            return None
+        return "\n\n### Sources\n" + self._references
+
+    def feed(self, token: str) -> str:
+        """Add a token of the answer, returning the rewritten text that can be shown."""
+        return self._release(self._add(token))
+
+    async def afeed(self, token: str) -> str:
+        """Add a token of the answer, formatting the citations of the text to show without blocking the event loop."""
+        end = self._add(token)
+        await self._aformat_citations(end)
+        return self._release(end)
+
+    def finish(self) -> str:
+        """Release the rest of the answer, once the stream has ended."""
+        return self._release(self._add_rest())
+
+    async def afinish(self) -> str:
+        """Release the rest of the answer, once the stream has ended, without blocking the event loop."""
+        end = self._add_rest()
+        await self._aformat_citations(end)
+        return self._release(end)
+
+    def _add(self, token: str) -> int:
+        """Add a token to the buffer, returning the end of the text that can be released."""
+        if self._ended:
+            return 0
+        self._buffer += token
+        if not self._started:
+            # the answer is stripped
+            self._buffer = self._buffer.lstrip()
+            self._started = bool(self._buffer)
+        end = min((i for i in map(self._buffer.find, ANSWER_END_MARKERS) if i != -1), default=-1)
+        if end != -1:
+            self._buffer = self._buffer[:end]
+            self._ended = True
+            return 0
+
+        # hold back trailing whitespace, the start of an end marker and the start of a citation marker
+        release = len(self._buffer)
+        for marker in ANSWER_END_MARKERS:
+            for length in range(len(marker) - 1, 0, -1):
+                if self._buffer.endswith(marker[:length]):
+                    release = min(release, len(self._buffer) - length)
+                    break
+        if match := CITATION_PREFIX_PATTERN.search(self._buffer):
+            release = min(release, match.start())
+        # whitespace before held text is stripped if that text turns out to be an end marker
+        release = len(self._buffer[:release].rstrip())
+        if release < len(self._buffer):
+            # a citation at the end of the released text may only match because the text ends there
+            for match in CITATION_PATTERN.finditer(self._buffer[:release]):
+                if match.end() == release:
+                    release = match.start()
+        return release
+
+    def _add_rest(self) -> int:
+        """End the answer, returning the end of the text that can be released."""
+        self._ended = True
+        self._buffer = self._buffer.rstrip()
+        return len(self._buffer)
+
+    def _get_citations(self, end: int) -> Iterator[re.Match]:
+        """The citation markers of the buffer that end before end."""
+        for match in CITATION_PATTERN.finditer(self._buffer):
+            if match.end() > end:
+                break
+            yield match
+
+    def _format_citation(self, source_number: int) -> Future:
+        """Format the citation of a source on citation_executor, once."""
+        if source_number not in self._citations:
+            citation = self._source_index[source_number].metadata["citation"][0]
+            self._citations[source_number] = citation_executor.submit(format_citation, citation)
+        return self._citations[source_number]
+
+    async def _aformat_citations(self, end: int) -> None:
+        """Format the citations of the sources cited before end, as formatting may read files and SQLite."""
+        futures = [
+            asyncio.wrap_future(self._format_citation(source_number))
+            for match in self._get_citations(end)
+            for source_number in get_citation_numbers(match.group())
+            if source_number in self._source_index and source_number not in self._inline_citation_map
+        ]
+        if futures:
+            await asyncio.gather(*futures)
+
+    def _release(self, end: int) -> str:
+        text = []
+        position = 0
+        for match in CITATION_PATTERN.finditer(self._buffer):
+            if match.end() > end:
+                # never release part of a marker
+                end = min(end, match.start())
+                break
+            source_numbers = get_citation_numbers(match.group())
+            for source_number in source_numbers:
+                self._cite(source_number)
+            text.append(self._buffer[position:match.start()])
+            text.append(format_inline_citation(source_numbers, self._inline_citation_map))
+            position = match.end()
+        text.append(self._buffer[position:end])
+        self._buffer = self._buffer[end:]
+        text = "".join(text)
+        self.content += text
+        return text
+
+    def _cite(self, source_number: int) -> None:
+        if source_number in self._inline_citation_map or source_number not in self._source_index:
+            return
+        citation = self._format_citation(source_number).result()
+        if citation not in self._bibliography_numbers:
+            self._bibliography_numbers[citation] = len(self._bibliography_numbers) + 1
+            self._references += f"[{self._bibliography_numbers[citation]}] {citation}\n"
+        self._inline_citation_map[source_number] = [self._bibliography_numbers[citation]]
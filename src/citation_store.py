@@ -0,0 +1,206 @@
+"""Compact, memory-mapped store of the PubMed metadata needed to cite each PMID.
+
+The PubMed archive has one gzipped XML file per PMID, so citing a PMID costs a file open, a gzip read and an
+XML parse, which is slow on network storage. build_citation_store streams the archive once with iterparse across
+a process pool and writes a single file that CitationStore memory-maps, so lookups never open a file.
+
+File layout (little-endian):
+    magic (8 bytes) | count (uint64)
+    pmids (uint32[count], sorted) | padding to 8 bytes
+    offsets (uint64[count]) | lengths (uint32[count]) | padding to 8 bytes
+    data: for each PMID, its FIELDS as UTF-8 joined by \\x1f
+
+Usage: python citation_store.py /data/Archive/pubmed/Archive /data/rgd-chatbot/citation_store.bin
+"""
+import argparse
+import gzip
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+from functools import cache
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CITATION_STORE_PATH = "/data/rgd-chatbot/citation_store.bin"
+MAGIC = b"RDCITE01"
+HEADER = struct.Struct("<8sQ")
+SEPARATOR = "\x1f"
+FIELDS = ("author", "title", "journal", "year", "month", "doi")
+
+
+def find_text(element, tag):
+    e = element.find(tag)
+    if e is not None:
+        return e.text
+    return ""
+
+
+def parse_article(article: ET.Element) -> Dict[str, str]:
+    """Extract the citation fields of a PubmedArticle element."""
+    authors = []
+    for a in article.findall(".//Author"):
+        lastname = find_text(a, ".//LastName")
+        forename = find_text(a, ".//ForeName")
+        authors.append(f"{lastname}, {forename}")
+    # str(None) is "None", as when the fields were formatted directly from the XML
+    return {
+        "author": " and ".join(authors),
+        "title": str(find_text(article, ".//ArticleTitle")),
+        "journal": str(find_text(article, ".//Journal/Title")),
+        "year": str(find_text(article, ".//PubDate/Year")),
+        "month": str(find_text(article, ".//PubDate/Month")),
+        "doi": str(find_text(article, ".//ArticleId[@IdType='doi']")),
+    }
+
+
+def parse_file(path: str) -> List[Tuple[int, Dict[str, str]]]:
+    """Parse an archive file, either a single article or a PubmedArticleSet."""
+    records = []
+    root = None
+    with gzip.open(path) as f:
+        for _, element in ET.iterparse(f, events=("end",)):
+            root = element
+            if element.tag == "PubmedArticle":
+                pmid = find_text(element, "./MedlineCitation/PMID") or Path(path).name.split(".")[0]
+                records.append((int(pmid), parse_article(element)))
+                element.clear()
+    if not records and root is not None and root.tag != "PubmedArticleSet":
+        # a single article that is not wrapped in a PubmedArticle element, identified by its file name
+        records.append((int(Path(path).name.split(".")[0]), parse_article(root)))
+    return records
+
+
+def encode(record: Dict[str, str]) -> bytes:
+    return SEPARATOR.join(record[field].replace(SEPARATOR, " ") for field in FIELDS).encode()
+
+
+def iter_archive(archive_dir: str | Path) -> Iterator[str]:
+    for dirpath, _, filenames in os.walk(archive_dir):
+        for filename in filenames:
+            if filename.endswith(".xml.gz"):
+                yield os.path.join(dirpath, filename)
+
+
+def pad(f, alignment: int = 8):
+    f.write(b"\0" * (-f.tell() % alignment))
+
+
+def build_citation_store(archive_dir: str | Path, path: str | Path, processes: int | None = None, chunksize: int = 256):
+    from tqdm import tqdm
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data_path = path.with_suffix(".data.tmp")
+    pmids = array("I")
+    offsets = array("Q")
+    lengths = array("I")
+    with open(data_path, "wb") as data, Pool(processes) as pool:
+        files = iter_archive(archive_dir)
+        for records in tqdm(pool.imap_unordered(parse_file, files, chunksize=chunksize), unit="files"):
+            for pmid, record in records:
+                encoded = encode(record)
+                pmids.append(pmid)
+                offsets.append(data.tell())
+                lengths.append(len(encoded))
+                data.write(encoded)
+
+    # sort by PMID, keeping the last record of duplicated PMIDs
+    order = sorted(range(len(pmids)), key=pmids.__getitem__)
+    order = [i for j, i in enumerate(order) if j + 1 == len(order) or pmids[order[j + 1]] != pmids[i]]
+
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(order)))
+        array("I", (pmids[i] for i in order)).tofile(f)
+        pad(f)
+        array("Q", (offsets[i] for i in order)).tofile(f)
+        array("I", (lengths[i] for i in order)).tofile(f)
+        pad(f)
+        with open(data_path, "rb") as data:
+            shutil.copyfileobj(data, f)
+    os.replace(tmp_path, path)
+    data_path.unlink()
+    return len(order)
+
+
+class CitationStore:
+    def __init__(self, path: str | Path = DEFAULT_CITATION_STORE_PATH) -> None:
+        if sys.byteorder != "little":
+            raise ValueError("CitationStore only supports little-endian hosts")
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a citation store")
+        view = memoryview(self._mmap)
+        start = HEADER.size
+        self._pmids = view[start:start + 4 * count].cast("I")
+        start += 4 * count
+        start += -start % 8
+        self._offsets = view[start:start + 8 * count].cast("Q")
+        start += 8 * count
+        self._lengths = view[start:start + 4 * count].cast("I")
+        start += 4 * count
+        self._data_start = start + -start % 8
+
+    def _index(self, pmid: int) -> int | None:
+        i = bisect_left(self._pmids, pmid)
+        if i < len(self._pmids) and self._pmids[i] == pmid:
+            return i
+        return None
+
+    def get(self, pmid: int | str) -> Dict[str, str] | None:
+        i = self._index(int(pmid))
+        if i is None:
+            return None
+        start = self._data_start + self._offsets[i]
+        data = self._mmap[start:start + self._lengths[i]]
+        return dict(zip(FIELDS, data.decode().split(SEPARATOR)))
+
+    @property
+    def pmids(self) -> Sequence[int]:
+        """The PMIDs of the store, sorted."""
+        return self._pmids
+
+    def __contains__(self, pmid: int | str) -> bool:
+        return self._index(int(pmid)) is not None
+
+    def __len__(self) -> int:
+        return len(self._pmids)
+
+
+@cache
+def get_citation_store() -> CitationStore | None:
+    path = os.environ.get("CITATION_STORE_PATH", DEFAULT_CITATION_STORE_PATH)
+    if not Path(path).exists():
+        return None
+    return CitationStore(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("archive_dir")
+    parser.add_argument("path", nargs="?", default=DEFAULT_CITATION_STORE_PATH)
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args()
+
+    start = time.time()
+    count = build_citation_store(args.archive_dir, args.path, processes=args.processes)
+    end = time.time()
+    logger.info(f"Building the citation store of {count} PMIDs took {timedelta(seconds=end - start)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,27 +1,244 @@
-from typing import Any, List
+import json
+import logging
+import mmap
+import os
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
 
+import torch
 from llama_index.core.bridge.pydantic import PrivateAttr
 from llama_index.core.embeddings import BaseEmbedding
 from llama_index.core.prompts import PromptTemplate
 from sentence_transformers import SentenceTransformer
+from sentence_transformers.util import get_device_name
+
+logger = logging.getLogger(__name__)
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+# the default token budget of a model batch, in texts at the maximum sequence length
+DEFAULT_TOKEN_BUDGET_TEXTS = 8
+
+
+def get_length_buckets(lengths: List[int], token_budget: int) -> List[List[int]]:
+    """Group text indices into batches of similar token length.
+
+    Indices are sorted by length so that short texts are not padded to the length of long ones,
+    and each batch holds as many texts as fit in token_budget (batch size * longest text).
+    """
+    buckets = []
+    bucket = []
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        # lengths are ascending, so the current text is the longest in the bucket
+        if bucket and (len(bucket) + 1) * max(lengths[index], 1) > token_budget:
+            buckets.append(bucket)
+            bucket = []
+        bucket.append(index)
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+
+def get_torch_dtype(torch_dtype: str | torch.dtype, device: torch.device) -> torch.dtype:
+    if isinstance(torch_dtype, str):
+        torch_dtype = getattr(torch, torch_dtype)
+    if torch_dtype == torch.float16 and device.type == "cpu":
+        # most float16 kernels are missing or slow on CPU, bfloat16 has the same memory footprint
+        logger.warning("float16 is not well supported on CPU, using bfloat16 instead")
+        torch_dtype = torch.bfloat16
+    return torch_dtype
+
+
+def get_tensors(model: torch.nn.Module) -> Dict[str, torch.Tensor]:
+    """The parameters and buffers of a model, including the buffers that are not in its state dict."""
+    tensors = dict(model.named_parameters(remove_duplicate=False))
+    tensors.update(model.named_buffers(remove_duplicate=False))
+    return tensors
+
+
+def save_shared_weights(model: torch.nn.Module, path: str | Path) -> None:
+    """Save the model's tensors as a safetensors file that can be memory-mapped by load_shared_weights.
+
+    Non-persistent buffers, e.g. position ids, are saved too, as a model built by empty_parameters has none.
+    """
+    from safetensors.torch import save_file
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    state_dict = {key: tensor.detach().cpu().contiguous().clone() for key, tensor in get_tensors(model).items()}
+    # write to a temporary file first so that concurrent workers never read a partial file
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    save_file(state_dict, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_shared_weights(path: str | Path) -> Dict[str, torch.Tensor]:
+    """Memory-map a safetensors file, without copying, so that processes loading it share pages.
+
+    The mapping is copy-on-write, tensors are only copied by the OS if they are modified.
+    """
+    with open(path, "rb") as f:
+        header_size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    data_offset = 8 + header_size
+    state_dict = {}
+    for key, info in header.items():
+        if key == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.tensor([], dtype=dtype).element_size()
+        if count:
+            tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_offset + start)
+        else:
+            tensor = torch.empty(0, dtype=dtype)
+        state_dict[key] = tensor.reshape(info["shape"])
+    return state_dict
+
+
+def assign_shared_weights(model: torch.nn.Module, state_dict: Dict[str, torch.Tensor]) -> None:
+    """Replace the tensors of a model with those of load_shared_weights, without copying them."""
+    missing = get_tensors(model).keys() - state_dict.keys()
+    if missing:
+        raise ValueError(f"The shared weights do not match the model, they are missing {sorted(missing)[:5]}")
+    for key, tensor in state_dict.items():
+        module_name, _, name = key.rpartition(".")
+        module = model.get_submodule(module_name)
+        if name in module._parameters:
+            module._parameters[name] = torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            module._buffers[name] = tensor
+
+
+def check_shared_weights_dtype(state_dict: Dict[str, torch.Tensor], torch_dtype: torch.dtype) -> None:
+    dtypes = {tensor.dtype for tensor in state_dict.values() if tensor.is_floating_point()}
+    if dtypes - {torch_dtype}:
+        raise ValueError(
+            f"The shared weights are {', '.join(sorted(map(str, dtypes)))} instead of {torch_dtype}, "
+            "delete the file to save it again with this dtype"
+        )
+
+
+@contextmanager
+def empty_parameters() -> Iterator[None]:
+    """Create the parameters of the modules initialized in this context on the meta device, without memory.
+
+    Loading a checkpoint into meta parameters is a no-op, so a model built in this context does not read its
+    weights, they are assigned from shared weights afterwards.
+    """
+    register_parameter = torch.nn.Module.register_parameter
+
+    def register_empty_parameter(module: torch.nn.Module, name: str, param: torch.nn.Parameter | None) -> None:
+        register_parameter(module, name, param)
+        if param is not None:
+            param = module._parameters[name]
+            module._parameters[name] = type(param)(param.to("meta"), requires_grad=param.requires_grad)
+
+    torch.nn.Module.register_parameter = register_empty_parameter
+    try:
+        with warnings.catch_warnings():
+            # transformers warns that copying the checkpoint into meta parameters is a no-op
+            warnings.filterwarnings("ignore", message=".*meta parameter.*")
+            yield
+    finally:
+        torch.nn.Module.register_parameter = register_parameter
+
+
+E5_QUERY_EMBED_PROMPT = PromptTemplate("query: {query}")
+E5_TEXT_EMBED_PROMPT = PromptTemplate("passage: {text}")
+
+
+class EmbeddingCache:
+    """LRU cache of embeddings, with a separate namespace per embedding type (query or text)."""
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self._namespaces: Dict[str, OrderedDict[str, List[float]]] = {}
+
+    def get(self, namespace: str, text: str) -> List[float] | None:
+        cache = self._namespaces.get(namespace)
+        if cache is None or text not in cache:
+            return None
+        cache.move_to_end(text)
+        return cache[text]
+
+    def put(self, namespace: str, text: str, embedding: List[float]) -> None:
+        cache = self._namespaces.setdefault(namespace, OrderedDict())
+        cache[text] = embedding
+        cache.move_to_end(text)
+        if len(cache) > self.max_size:
+            cache.popitem(last=False)
+
+    def clear(self) -> None:
+        self._namespaces.clear()
 
 
 class SentenceTransformerEmbeddings(BaseEmbedding):
     _model: SentenceTransformer = PrivateAttr()
     _embed_batch_size: int = PrivateAttr()
+    _embed_token_budget: int = PrivateAttr()
     _query_embed_prompt: PromptTemplate | None = PrivateAttr()
+    _text_embed_prompt: PromptTemplate | None = PrivateAttr()
+    _cache: EmbeddingCache | None = PrivateAttr()
 
     def __init__(
         self,
         model_name_or_path: str = 'intfloat/e5-large-v2',
         embed_batch_size: int = 1,
+        embed_token_budget: int | None = None,
         query_embed_prompt: PromptTemplate | None = None,
+        text_embed_prompt: PromptTemplate | None = None,
+        cache_size: int = 10000,
+        torch_dtype: str | torch.dtype | None = None,
+        shared_weights_path: str | None = None,
         **kwargs: Any,
     ) -> None:
-        self._model = SentenceTransformer(model_name_or_path, **kwargs)
+        # the device SentenceTransformer would pick, as the model is built on the meta device with shared weights
+        device = torch.device(kwargs.pop("device", None) or get_device_name())
+        if shared_weights_path and Path(shared_weights_path).exists():
+            # build the model without loading its weights, as they are replaced by the shared weights
+            with empty_parameters():
+                self._model = SentenceTransformer(model_name_or_path, device="meta", **kwargs)
+        else:
+            self._model = SentenceTransformer(model_name_or_path, device=str(device), **kwargs)
+            if torch_dtype:
+                self._model.to(get_torch_dtype(torch_dtype, device))
+            if shared_weights_path:
+                save_shared_weights(self._model, shared_weights_path)
+        if shared_weights_path:
+            # the shared weights are memory-mapped on the CPU
+            state_dict = load_shared_weights(shared_weights_path)
+            check_shared_weights_dtype(
+                state_dict, get_torch_dtype(torch_dtype, device) if torch_dtype else torch.float32
+            )
+            assign_shared_weights(self._model, state_dict)
+            if device.type != "cpu":
+                # each process has its own copy of the weights on an accelerator
+                self._model.to(device)
+        self._model.eval()
         self._embed_batch_size = embed_batch_size
+        # embed_batch_size texts are bucketed together, and each bucket is encoded as one batch that fits in the
+        # token budget, by default DEFAULT_TOKEN_BUDGET_TEXTS texts at the maximum sequence length
+        self._embed_token_budget = embed_token_budget or DEFAULT_TOKEN_BUDGET_TEXTS * self._model.max_seq_length
         self._query_embed_prompt = query_embed_prompt
-        super().__init__(**kwargs)
+        self._text_embed_prompt = text_embed_prompt
+        self._cache = EmbeddingCache(cache_size) if cache_size else None
+        super().__init__(embed_batch_size=embed_batch_size, **kwargs)
 
     @classmethod
     def class_name(cls) -> str:
@@ -36,7 +253,7 @@ class SentenceTransformerEmbeddings(BaseEmbedding):
     def _get_query_embedding(self, query: str) -> List[float]:
         if self._query_embed_prompt:
             query = self._query_embed_prompt.format(query=query)
-        embeddings = self._get_text_embeddings([query])
+        embeddings = self._get_cached_embeddings("query", [query])
         return embeddings[0]
 
     def _get_text_embedding(self, text: str) -> List[float]:
@@ -44,5 +261,49 @@ class SentenceTransformerEmbeddings(BaseEmbedding):
         return embeddings[0]
 
     def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
-        embeddings = self._model.encode(texts, normalize_embeddings=True, batch_size=self._embed_batch_size, show_progress_bar=False).tolist()
+        if self._text_embed_prompt:
+            texts = [self._text_embed_prompt.format(text=text) for text in texts]
+        return self._get_cached_embeddings("text", texts)
+
+    def _get_cached_embeddings(self, namespace: str, texts: List[str]) -> List[List[float]]:
+        if self._cache is None:
+            return self._embed(texts)
+        embeddings = [self._cache.get(namespace, text) for text in texts]
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            missing_embeddings = dict(zip(missing, self._embed(missing)))
+            for text, embedding in missing_embeddings.items():
+                self._cache.put(namespace, text, embedding)
+            embeddings = [
+                embedding if embedding is not None else missing_embeddings[text]
+                for text, embedding in zip(texts, embeddings)
+            ]
+        return embeddings
+
+    def _get_token_lengths(self, texts: List[str]) -> List[int]:
+        input_ids = self._model.tokenizer(
+            texts, add_special_tokens=True, truncation=True, max_length=self._model.max_seq_length
+        )["input_ids"]
+        return [len(ids) for ids in input_ids]
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self._model.encode(
+            texts,
+            normalize_embeddings=True,
+            batch_size=max(len(texts), 1),
+            show_progress_bar=False,
+            convert_to_tensor=True,
+        )
+        # half precision embeddings are returned as float32, numpy does not support bfloat16
+        return embeddings.float().cpu().tolist()
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if len(texts) <= 1:
+            return self._encode(texts)
+        embeddings: List[List[float] | None] = [None] * len(texts)
+        for bucket in get_length_buckets(self._get_token_lengths(texts), self._embed_token_budget):
+            bucket_embeddings = self._encode([texts[i] for i in bucket])
+            # restore the original order
+            for i, embedding in zip(bucket, bucket_embeddings):
+                embeddings[i] = embedding
         return embeddings
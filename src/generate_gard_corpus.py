@@ -3,10 +3,11 @@ from pathlib import Path
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
-from gard import GARD
 from tqdm.contrib.concurrent import thread_map
 
-gard = GARD()
+from resources import get_gard
+
+gard = get_gard()
 
 
 def get_text(gard_id):
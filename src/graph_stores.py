@@ -1,15 +1,32 @@
 from itertools import chain
 from typing import Any, Dict, List
 
+import pandas as pd
 from llama_index.graph_stores.neo4j import Neo4jGraphStore
 
 from textualize import (
+    KnowledgeTriple,
     textualize_organizations,
     textualize_phenotypes,
     textualize_prevelances,
     textualize_pubtator3s,
     textualize_rels
 )
+from textualize_columnar import (
+    textualize_organizations_df,
+    textualize_phenotypes_df,
+    textualize_prevalences_df,
+    textualize_pubtator3s_df,
+    textualize_rels_df
+)
+
+# Columns returned for each relationship type, shared with precompute_textualization.py
+REL_COLUMNS = "n._N_Name AS n__N_Name, n._I_GENE AS n__I_GENE, m._N_Name AS m__N_Name, m._I_GENE AS m__I_GENE, r.citations AS r_citations, r.interpretation AS r_interpretation, r.name AS r_name, r.value AS r_value"
+ORGANIZATION_COLUMNS = "m._N_Name AS m__N_Name, m._I_CODE AS m__I_CODE, n.Address1 AS n_Address1, n.Address2 AS n_Address2, n.City AS n_City, n.Country AS n_Country, n.Email AS n_Email, n.Fax as n_Fax, n.Name as n_Name, n.Phone as n_Phone, n.State as n_State, n.TollFree as n_TollFree, n.URL as n_URL, n.ZipCode as n_ZipCode"
+PHENOTYPE_COLUMNS = "n._N_Name AS n__N_Name, m._N_Name AS m__N_Name, r.Frequency AS r_Frequency, r.Onset AS r_Onset, r.Reference AS r_Reference"
+PREVALENCE_COLUMNS = "m._N_Name AS m__N_Name, n.PrevalenceClass AS n_PrevalenceClass, n.PrevalenceGeographic AS n_PrevalenceGeographic, n.PrevalenceQualification AS n_PrevalenceQualification, n.PrevalenceValidationStatus AS n_PrevalenceValidationStatus, n.Source AS n_Source, n.ValMoy AS n_ValMoy"
+# Text and citation written by precompute_textualization.py, null if not precomputed
+PRECOMPUTED_COLUMNS = "r._Text AS r__Text, r._Citation AS r__Citation"
 
 
 class CustomNeo4jGraphStore(Neo4jGraphStore):
@@ -21,6 +38,7 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
         database: str = "neo4j",
         node_label: str = "Entity",
         schema_cache_path: str = "schema_cache.txt",
+        columnar: bool = False,
         **kwargs: Any,
     ) -> None:
         try:
@@ -33,6 +51,8 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
         self.schema = ""
         self.structured_schema: Dict[str, Any] = {}
         self.schema_cache_path = schema_cache_path
+        # fetch results as DataFrames and textualize them with vectorized string operations
+        self.columnar = columnar
         # Verify connection
         try:
             self._driver.verify_connectivity()
@@ -67,7 +87,7 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
 
     def get_rel_map(
         self, subjs: List[str] | None = None, depth: int = 2, limit: int = 30
-    ) -> Dict[str, List[List[str]]]:
+    ) -> Dict[str, List[KnowledgeTriple]]:
         """Get flat rel map."""
         # The flat means for multi-hop relation path, we could get
         # knowledge like: subj -> rel -> obj -> rel -> obj -> rel -> obj.
@@ -80,17 +100,13 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
         # ...
         # +-------------+------------------------------------+
 
-        rel_map: Dict[str, List[List[str]]] = {}
+        rel_map: Dict[str, List[KnowledgeTriple]] = {}
         if subjs is None or len(subjs) == 0:
             # unlike simple graph_store, we don't do get_all here
             return rel_map
 
         subjs_upper = [subj.upper() for subj in subjs]
 
-        rel_map_rel = self.get_rel_map_rel(subjs_upper, depth, limit)
-        rel_map_organization = self.get_rel_map_organization(subjs_upper, limit)
-        rel_map_phenotype = self.get_rel_map_phenotype(subjs_upper, limit)
-        rel_map_prevalence = self.get_rel_map_prevalence(subjs_upper, limit)
         rel_map_rel = self.get_rel_map_rel(subjs_upper, depth, limit)
         rel_map_organization = self.get_rel_map_organization(subjs_upper, limit)
         rel_map_phenotype = self.get_rel_map_phenotype(subjs_upper, limit)
@@ -107,34 +123,42 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
 
     def get_rel_map_rel(
         self, subjs: List[str] | None = None, depth: int = 2, limit: int = 30
-    ) -> Dict[str, List[List[str]]]:
+    ) -> Dict[str, List[KnowledgeTriple]]:
         if subjs is None or len(subjs) == 0:
             return {}
         # TODO: restore depth functionality
         query = f"""MATCH p=(n:`{self.node_label}`)-[r:R_rel]->(m)
             {"WHERE apoc.coll.intersection(apoc.convert.toList(n.N_Name), $subjs)" if subjs else ""}
-            RETURN n._N_Name AS n__N_Name, n._I_GENE AS n__I_GENE, m._N_Name AS m__N_Name, m._I_GENE AS m__I_GENE, r.citations AS r_citations, r.interpretation AS r_interpretation, r.name AS r_name, r.value AS r_value
+            RETURN {REL_COLUMNS}, {PRECOMPUTED_COLUMNS}
             LIMIT {limit}
         """
 
+        if self.columnar:
+            rels = self.query_df(query, {"subjs": subjs})
+            return textualize_rels_df(rels) if len(rels) else {}
+
         rels = list(self.query(query, {"subjs": subjs}))
         if not rels:
             return {}
 
         return textualize_rels(rels)
 
-    def get_rel_map_organization(self, subjs: List[str] | None = None, limit: int = 30) -> Dict[str, List[List[str]]]:
+    def get_rel_map_organization(self, subjs: List[str] | None = None, limit: int = 30) -> Dict[str, List[KnowledgeTriple]]:
         if subjs is None or len(subjs) == 0:
             return {}
 
         subjs = [subj.upper() for subj in subjs]
 
         query = f"""
-            MATCH p=(m:`{self.node_label}`)<-[:ORGANIZATION]-(n)
+            MATCH p=(m:`{self.node_label}`)<-[r:ORGANIZATION]-(n)
             {"WHERE apoc.coll.intersection(apoc.convert.toList(m.N_Name), $subjs)" if subjs else ""}
-            RETURN m._N_Name AS m__N_Name, m._I_CODE AS m__I_CODE, n.Address1 AS n_Address1, n.Address2 AS n_Address2, n.City AS n_City, n.Country AS n_Country, n.Email AS n_Email, n.Fax as n_Fax, n.Name as n_Name, n.Phone as n_Phone, n.State as n_State, n.TollFree as n_TollFree, n.URL as n_URL, n.ZipCode as n_ZipCode
+            RETURN {ORGANIZATION_COLUMNS}, {PRECOMPUTED_COLUMNS}
             LIMIT {limit}
         """
+        if self.columnar:
+            organizations = self.query_df(query, {"subjs": subjs})
+            return textualize_organizations_df(organizations) if len(organizations) else {}
+
         organizations = list(self.query(query, {"subjs": subjs}))
 
         if not organizations:
@@ -142,7 +166,7 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
 
         return textualize_organizations(organizations)
 
-    def get_rel_map_phenotype(self, subjs: List[str] | None = None, limit: int = 30):
+    def get_rel_map_phenotype(self, subjs: List[str] | None = None, limit: int = 30) -> Dict[str, List[KnowledgeTriple]]:
         if subjs is None or len(subjs) == 0:
             return {}
 
@@ -151,9 +175,13 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
         query = f"""
             MATCH p=(n:`{self.node_label}`)-[r:R_hasPhenotype]->(m)
             {"WHERE apoc.coll.intersection(apoc.convert.toList(n.N_Name), $subjs)" if subjs else ""}
-            RETURN n._N_Name AS n__N_Name, m._N_Name AS m__N_Name, r.Frequency AS r_Frequency, r.Onset AS r_Onset, r.Reference AS r_Reference
+            RETURN {PHENOTYPE_COLUMNS}, {PRECOMPUTED_COLUMNS}
             LIMIT {limit}
         """
+        if self.columnar:
+            phenotypes = self.query_df(query, {"subjs": subjs})
+            return textualize_phenotypes_df(phenotypes) if len(phenotypes) else {}
+
         phenotypes = list(self.query(query, {"subjs": subjs}))
 
         if not phenotypes:
@@ -161,18 +189,22 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
 
         return textualize_phenotypes(phenotypes)
 
-    def get_rel_map_prevalence(self, subjs: List[str] | None = None, limit: int = 30) -> Dict[str, List[List[str]]]:
+    def get_rel_map_prevalence(self, subjs: List[str] | None = None, limit: int = 30) -> Dict[str, List[KnowledgeTriple]]:
         if subjs is None or len(subjs) == 0:
             return {}
 
         subjs = [subj.upper() for subj in subjs]
 
         query = f"""
-            MATCH p=(m:`{self.node_label}`)<-[r:PREVALENCE*1]-(n)
+            MATCH p=(m:`{self.node_label}`)<-[r:PREVALENCE]-(n)
             {"WHERE apoc.coll.intersection(apoc.convert.toList(m.N_Name), $subjs)" if subjs else ""}
-            RETURN m._N_Name AS m__N_Name, n.PrevalenceClass AS n_PrevalenceClass, n.PrevalenceGeographic AS n_PrevalenceGeographic, n.PrevalenceQualification AS n_PrevalenceQualification, n.PrevalenceValidationStatus AS n_PrevalenceValidationStatus, n.Source AS n_Source, n.ValMoy AS n_ValMoy
+            RETURN {PREVALENCE_COLUMNS}, {PRECOMPUTED_COLUMNS}
             LIMIT {limit}
         """
+        if self.columnar:
+            prevalences = self.query_df(query, {"subjs": subjs})
+            return textualize_prevalences_df(prevalences) if len(prevalences) else {}
+
         prevalences = list(self.query(query, {"subjs": subjs}))
 
         if not prevalences:
@@ -180,7 +212,7 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
 
         return textualize_prevelances(prevalences)
 
-    def get_rel_map_pubtator3(self, subjs: List[str] | None = None, limit: int = 30) -> Dict[str, List[List[str]]]:
+    def get_rel_map_pubtator3(self, subjs: List[str] | None = None, limit: int = 30) -> Dict[str, List[KnowledgeTriple]]:
         if subjs is None or len(subjs) == 0:
             return {}
 
@@ -188,7 +220,7 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
         # Remove duplicates
         subjs = [j for i, j in enumerate(subjs) if all(j not in k for k in subjs[i + 1:])]
 
-        pubtator3 = []
+        queries = []
         query = f"""
             MATCH p=(n:PubTator3:Disease)-[r:`associate_PubTator3`|`cause_PubTator3`|`compare_PubTator3`|`cotreat_PubTator3`|`drug_interact_PubTator3`|`inhibit_PubTator3`|`interact_PubTator3`|`negative_correlate_PubTator3`|`positive_correlate_PubTator3`|`prevent_PubTator3`|`stimulate_PubTator3`|`treat_PubTator3`]->(m:PubTator3)
             {f"WHERE apoc.coll.intersection(split(toUpper(n.Mentions), '|'), $subjs)" if subjs else ""}
@@ -196,8 +228,7 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
             ORDER BY size(r.PMID) DESC
             LIMIT 20
         """
-        result = list(self.query(query, {"subjs": subjs}))
-        pubtator3.extend(result)
+        queries.append(query)
         query = f"""
             MATCH p=(n:PubTator3)-[r:`associate_PubTator3`|`cause_PubTator3`|`compare_PubTator3`|`cotreat_PubTator3`|`drug_interact_PubTator3`|`inhibit_PubTator3`|`interact_PubTator3`|`negative_correlate_PubTator3`|`positive_correlate_PubTator3`|`prevent_PubTator3`|`stimulate_PubTator3`|`treat_PubTator3`]->(m:PubTator3:Disease)
             {f"WHERE apoc.coll.intersection(split(toUpper(m.Mentions), '|'), $subjs)" if subjs else ""}
@@ -205,14 +236,28 @@ class CustomNeo4jGraphStore(Neo4jGraphStore):
             ORDER BY size(r.PMID) DESC
             LIMIT 100
         """
-        result = list(self.query(query, {"subjs": subjs}))
-        pubtator3.extend(result)
+        queries.append(query)
+
+        if self.columnar:
+            pubtator3 = pd.concat([self.query_df(query, {"subjs": subjs}) for query in queries], ignore_index=True)
+            return textualize_pubtator3s_df(pubtator3) if len(pubtator3) else {}
+
+        pubtator3 = []
+        for query in queries:
+            result = list(self.query(query, {"subjs": subjs}))
+            pubtator3.extend(result)
 
         if not pubtator3:
             return {}
 
         return textualize_pubtator3s(pubtator3)
 
+    def query_df(self, query: str, param_map: Dict[str, Any] | None = None) -> pd.DataFrame:
+        with self._driver.session(database=self._database) as session:
+            result = session.run(query, param_map or {})
+            # unlike Result.to_df, object dtype keeps nulls as None and integers as int, like the row-wise path
+            return pd.DataFrame(result.values(), columns=result.keys(), dtype=object)
+
     def refresh_schema(self) -> None:
         """
         Refreshes the Neo4j graph schema information.
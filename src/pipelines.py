@@ -13,8 +13,10 @@ from llama_index.llms.ollama import Ollama
 from llama_index.llms.openai import OpenAI
 from llama_index.llms.openrouter import OpenRouter
 
+from answer_cache import get_answer_cache
 from chat_engine.citation_types import CitationChatMode
-from embeddings import SentenceTransformerEmbeddings
+from chat_engine.summarizing_memory import SummarizingChatMemory
+from embeddings import E5_QUERY_EMBED_PROMPT, E5_TEXT_EMBED_PROMPT, SentenceTransformerEmbeddings
 from graph_stores import CustomNeo4jGraphStore
 from query_engine import CustomCitationQueryEngine
 from retrievers import KG_RAG_KnowledgeGraphRAGRetriever
@@ -33,6 +35,11 @@ def get_graph_store():
 
 def get_retriever_pipeline(callback_manager: CallbackManager | None = None, llm_model_name: str = "llama3:8b-instruct-q5_K_M"):
     Settings.llm = get_llm(llm_model_name)
+    if tokenizer_name := os.environ.get("LLM_TOKENIZER"):
+        # count the tokens of the context prompt with the LLM's tokenizer, e.g. meta-llama/Meta-Llama-3-8B-Instruct
+        from transformers import AutoTokenizer
+
+        Settings.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name).encode
     Settings.embed_model, Settings.num_output = get_sentence_transformer_embed_model()
     Settings.callback_manager = callback_manager
 
@@ -84,6 +91,8 @@ def get_pipeline(callback_manager: CallbackManager | None = None, llm_model_name
     chat_engine = query_engine.as_chat_engine(
         chat_mode=CitationChatMode.CONDENSE_PLUS_CONTEXT,
         context_prompt=CUSTOM_CONTEXT_PROMPT_TEMPLATE,
+        memory=SummarizingChatMemory.from_defaults(llm=Settings.llm),
+        answer_cache=get_answer_cache(),
         verbose=True,
     )
     return chat_engine
@@ -99,11 +108,18 @@ def get_huggingface_embed_model(embed_model_name: str =  "mixedbread-ai/mxbai-em
     )
 
 
-def get_sentence_transformer_embed_model(embed_model_name: str = "intfloat/e5-base-v2", embed_batch_size: int = 8):
+def get_sentence_transformer_embed_model(embed_model_name: str = "intfloat/e5-base-v2", embed_batch_size: int = 256):
+    # e5 models are trained with "query: " and "passage: " prefixes
+    is_e5 = "e5-" in embed_model_name
     return (
         SentenceTransformerEmbeddings(
             model_name_or_path=embed_model_name,
             embed_batch_size=embed_batch_size,
+            query_embed_prompt=E5_QUERY_EMBED_PROMPT if is_e5 else None,
+            text_embed_prompt=E5_TEXT_EMBED_PROMPT if is_e5 else None,
+            # e.g. bfloat16, and a path on local disk so that workers on the same host share the weights
+            torch_dtype=os.environ.get("EMBED_TORCH_DTYPE"),
+            shared_weights_path=os.environ.get("EMBED_SHARED_WEIGHTS_PATH"),
         ),
         768,
     )
@@ -226,6 +242,7 @@ def get_query_engine(retriever: BaseRetriever):
 
 def get_retriever(
     storage_context: StorageContext,
+    similarity_top_k: int = 30,
 ):
     CUSTOM_QUERY_KEYWORD_EXTRACT_TEMPLATE_TMPL = (
         'What disease or diseases are mentioned in the question? Only respond in a comma separated format.\n'
@@ -243,7 +260,7 @@ def get_retriever(
         graph_traversal_depth=1,
         max_entities=5,
         max_synonyms=0,
-        similarity_top_k=30,
+        similarity_top_k=similarity_top_k,
         max_knowledge_sequence=1000,
         entity_extract_template=CUSTOM_QUERY_KEYWORD_EXTRACT_TEMPLATE_TMPL,
     )
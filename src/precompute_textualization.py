@@ -0,0 +1,106 @@
+"""Write the textualized description and citation of each relationship to the graph.
+
+CustomNeo4jGraphStore returns these as r__Text and r__Citation, and the textualize_* functions use them
+instead of rebuilding the same strings on every request. Relationships that have not been precomputed
+(e.g. added after this script was run) are still textualized in Python.
+"""
+import argparse
+import logging
+import time
+from datetime import timedelta
+
+from tqdm import tqdm
+
+from graph_stores import ORGANIZATION_COLUMNS, PHENOTYPE_COLUMNS, PREVALENCE_COLUMNS, REL_COLUMNS
+from pipelines import get_graph_store
+from textualize import (
+    cite_organization,
+    cite_phenotype,
+    cite_prevalence,
+    cite_rel,
+    textualize_organization,
+    textualize_phenotype,
+    textualize_prevalence,
+    textualize_rel
+)
+
+logger = logging.getLogger(__name__)
+
+# (match pattern, columns, textualize function, cite function)
+RELATIONSHIPS = {
+    "rel": ("(n:`{node_label}`)-[r:R_rel]->(m)", REL_COLUMNS, textualize_rel, cite_rel),
+    "organization": (
+        "(m:`{node_label}`)<-[r:ORGANIZATION]-(n)",
+        ORGANIZATION_COLUMNS,
+        textualize_organization,
+        cite_organization,
+    ),
+    "phenotype": (
+        "(n:`{node_label}`)-[r:R_hasPhenotype]->(m)",
+        PHENOTYPE_COLUMNS,
+        textualize_phenotype,
+        cite_phenotype,
+    ),
+    "prevalence": (
+        "(m:`{node_label}`)<-[r:PREVALENCE]-(n)",
+        PREVALENCE_COLUMNS,
+        textualize_prevalence,
+        cite_prevalence,
+    ),
+}
+
+
+def precompute(graph_store, name: str, batch_size: int = 10000, overwrite: bool = False):
+    pattern, columns, textualize, cite = RELATIONSHIPS[name]
+    pattern = pattern.format(node_label=graph_store.node_label)
+    if overwrite:
+        graph_store.query(f"MATCH {pattern} REMOVE r._Text, r._Citation")
+
+    total = graph_store.query(f"MATCH {pattern} WHERE r._Text IS NULL RETURN count(r) AS count")[0]["count"]
+    with tqdm(total=total, desc=name) as progress:
+        while True:
+            records = graph_store.query(
+                f"""
+                MATCH {pattern}
+                WHERE r._Text IS NULL
+                RETURN elementId(r) AS r_id, {columns}
+                LIMIT $batch_size
+                """,
+                {"batch_size": batch_size},
+            )
+            if not records:
+                break
+            rows = []
+            for record in records:
+                text = textualize(record)
+                # an empty text marks relationships without a description, so they are skipped at query time
+                rows.append({"id": record["r_id"], "text": text or "", "citation": cite(record) if text else ""})
+            graph_store.query(
+                """
+                UNWIND $rows AS row
+                MATCH ()-[r]->() WHERE elementId(r) = row.id
+                SET r._Text = row.text, r._Citation = row.citation
+                """,
+                {"rows": rows},
+            )
+            progress.update(len(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("relationships", nargs="*", choices=list(RELATIONSHIPS), default=list(RELATIONSHIPS))
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--overwrite", action="store_true", help="recompute relationships that were already precomputed")
+    args = parser.parse_args()
+
+    graph_store = get_graph_store()
+    for name in args.relationships:
+        start = time.time()
+        precompute(graph_store, name, batch_size=args.batch_size, overwrite=args.overwrite)
+        end = time.time()
+        logger.info(f"Precomputing {name} took {timedelta(seconds=end - start)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
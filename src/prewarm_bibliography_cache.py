@@ -0,0 +1,96 @@
+"""Fill the bibliography cache with the citations of the PMIDs referenced in the graph.
+
+Usage:
+    python prewarm_bibliography_cache.py                  # PMIDs referenced in the graph
+    python prewarm_bibliography_cache.py --no-pubtator3   # excluding the PubTator3 relationships
+    python prewarm_bibliography_cache.py --pmids pmids.txt
+"""
+import argparse
+import logging
+import re
+import time
+from datetime import timedelta
+from itertools import islice
+
+from tqdm.contrib.concurrent import process_map
+
+from bibliography_cache import get_bibliography_cache
+from citation import format_pmid_citation
+
+logger = logging.getLogger(__name__)
+
+PMID_PATTERN = re.compile(r"PMID:(\d+)")
+
+# Queries returning the citation strings of each relationship type, in the formats parsed by textualize.get_list
+CITATION_QUERIES = [
+    "MATCH ()-[r:R_rel]->() RETURN r.citations AS citations UNION ALL MATCH ()-[r:R_rel]->() RETURN r.value AS citations",
+    "MATCH ()-[r:R_hasPhenotype]->() RETURN r.Reference AS citations",
+    "MATCH ()<-[:PREVALENCE]-(n) RETURN n.Source AS citations",
+]
+PUBTATOR3_QUERY = "MATCH (:PubTator3)-[r]->(:PubTator3) WHERE r.PMID IS NOT NULL RETURN r.PMID AS pmids"
+
+
+def get_graph_pmids(graph_store, pubtator3: bool = True):
+    pmids = set()
+    for query in CITATION_QUERIES:
+        for record in graph_store.query(query):
+            citations = record["citations"]
+            if isinstance(citations, list):
+                citations = ",".join(citations)
+            if citations:
+                pmids.update(map(int, PMID_PATTERN.findall(citations)))
+    if pubtator3:
+        for record in graph_store.query(PUBTATOR3_QUERY):
+            pmids.update(int(pmid) for pmid in record["pmids"].split("|") if pmid)
+    return pmids
+
+
+def format_pmid(pmid: int):
+    try:
+        return pmid, format_pmid_citation(pmid)
+    except FileNotFoundError:
+        return pmid, None
+
+
+def prewarm(pmids, max_workers: int | None = None, batch_size: int = 10000):
+    bibliography_cache = get_bibliography_cache()
+    if bibliography_cache is None:
+        raise RuntimeError("Could not open the bibliography cache, see the warning above")
+    pmids = iter(sorted(pmids))
+    missing_files = 0
+    while batch := list(islice(pmids, batch_size)):
+        cached = bibliography_cache.get_many(batch)
+        batch = [pmid for pmid in batch if pmid not in cached]
+        if not batch:
+            continue
+        results = process_map(format_pmid, batch, max_workers=max_workers, chunksize=64, leave=False)
+        bibliography_cache.put_many((pmid, citation) for pmid, citation in results if citation is not None)
+        missing_files += sum(citation is None for _, citation in results)
+    if missing_files:
+        logger.warning(f"Could not find files for {missing_files} PMIDs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pmids", help="file with one PMID per line, instead of the PMIDs in the graph")
+    parser.add_argument("--no-pubtator3", action="store_true", help="skip the PMIDs of PubTator3 relationships")
+    parser.add_argument("--max-workers", type=int)
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.pmids:
+        with open(args.pmids) as f:
+            pmids = {int(line.strip().removeprefix("PMID:")) for line in f if line.strip()}
+    else:
+        from pipelines import get_graph_store
+
+        pmids = get_graph_pmids(get_graph_store(), pubtator3=not args.no_pubtator3)
+    logger.info(f"Prewarming {len(pmids)} PMIDs")
+    prewarm(pmids, max_workers=args.max_workers)
+    end = time.time()
+    logger.info(f"Prewarming the bibliography cache took {timedelta(seconds=end - start)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
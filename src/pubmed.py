@@ -0,0 +1,249 @@
+"""Async, rate-limited PubMed client used for citations of PMIDs missing from the local archive.
+
+Articles are fetched through a pluggable backend: EutilsBackend queries NCBI E-utilities (or a local server
+with the same API, via EUTILS_BASE_URL), FileBackend reads PubMed XML files from a directory, for tests and
+offline deployments. AsyncPubMedClient rate limits requests to the backend with a token bucket, coalesces
+concurrent requests for the same PMID into one, and caches the fetched XML in SQLite with PubMedCache.
+"""
+import asyncio
+import gzip
+import logging
+import os
+import sqlite3
+import threading
+import xml.etree.ElementTree as ET
+from functools import cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from citation_store import find_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EUTILS_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+DEFAULT_PUBMED_CACHE_PATH = "/data/rgd-chatbot/pubmed_cache.sqlite"
+# NCBI allows 3 requests per second without an API key and 10 with one
+EUTILS_REQUESTS_PER_SECOND = 3
+EUTILS_REQUESTS_PER_SECOND_WITH_API_KEY = 10
+# PMIDs per efetch request, NCBI recommends using POST above 200
+EUTILS_BATCH_SIZE = 200
+
+
+class TokenBucket:
+    """Allow on average `rate` acquisitions per second, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int = 1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at: float | None = None
+        self._lock: asyncio.Lock | None = None
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # waiters are served in order, each sleeping until the next token is available
+        async with self._lock:
+            now = loop.time()
+            if self._updated_at is not None:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._tokens = 1.0
+                self._updated_at = loop.time()
+            self._tokens -= 1
+
+
+def split_articles(xml: str | bytes) -> Dict[int, str]:
+    """Split a PubmedArticleSet into the XML of each PubmedArticle, by PMID."""
+    root = ET.fromstring(xml)
+    articles = [root] if root.tag == "PubmedArticle" else root.iter("PubmedArticle")
+    return {
+        int(find_text(article, "./MedlineCitation/PMID")): ET.tostring(article, encoding="unicode")
+        for article in articles
+    }
+
+
+class PubMedBackend:
+    """Fetches the PubmedArticle XML of PMIDs. PMIDs that are not found are left out of the result."""
+
+    # None if requests to the backend do not need to be rate limited
+    requests_per_second: float | None = None
+    batch_size: int = EUTILS_BATCH_SIZE
+
+    async def fetch(self, pmids: List[int]) -> Dict[int, str]:
+        raise NotImplementedError
+
+
+class EutilsBackend(PubMedBackend):
+    def __init__(self, api_key: str | None = None, base_url: str = DEFAULT_EUTILS_BASE_URL, timeout: float = 30.0):
+        import httpx
+
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.requests_per_second = (
+            EUTILS_REQUESTS_PER_SECOND_WITH_API_KEY if api_key else EUTILS_REQUESTS_PER_SECOND
+        )
+        self._client = httpx.AsyncClient(timeout=timeout)
+
+    async def fetch(self, pmids: List[int]) -> Dict[int, str]:
+        data = {"db": "pubmed", "id": ",".join(map(str, pmids)), "retmode": "xml"}
+        if self.api_key:
+            data["api_key"] = self.api_key
+        response = await self._client.post(f"{self.base_url}/efetch.fcgi", data=data)
+        response.raise_for_status()
+        return split_articles(response.content)
+
+
+class FileBackend(PubMedBackend):
+    """Reads {pmid}.xml or {pmid}.xml.gz files from a directory."""
+
+    def __init__(self, directory: str | Path) -> None:
+        self.directory = Path(directory)
+
+    def _read(self, pmid: int) -> str | None:
+        path = self.directory / f"{pmid}.xml"
+        if path.exists():
+            return path.read_text()
+        if path.with_suffix(".xml.gz").exists():
+            with gzip.open(path.with_suffix(".xml.gz"), "rt") as f:
+                return f.read()
+        return None
+
+    async def fetch(self, pmids: List[int]) -> Dict[int, str]:
+        articles = {}
+        for pmid in pmids:
+            xml = await asyncio.to_thread(self._read, pmid)
+            if xml is not None:
+                articles.update(split_articles(xml))
+        return articles
+
+
+class PubMedCache:
+    """Persistent cache of the PubmedArticle XML of PMIDs, in SQLite."""
+
+    def __init__(self, path: str | Path = DEFAULT_PUBMED_CACHE_PATH) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL lets the Chainlit workers read while another process writes
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS articles (pmid INTEGER PRIMARY KEY, xml TEXT NOT NULL)"
+                )
+
+    def get_many(self, pmids: Iterable[int | str]) -> Dict[int, str]:
+        pmids = [int(pmid) for pmid in pmids]
+        articles = {}
+        with self._lock:
+            # stay below SQLite's limit on the number of variables in a query
+            for i in range(0, len(pmids), 500):
+                batch = pmids[i:i + 500]
+                rows = self._connection.execute(
+                    f"SELECT pmid, xml FROM articles WHERE pmid IN ({','.join('?' * len(batch))})", batch
+                )
+                articles.update(rows)
+        return articles
+
+    def put_many(self, articles: Iterable[Tuple[int | str, str]]) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO articles (pmid, xml) VALUES (?, ?)",
+                ((int(pmid), xml) for pmid, xml in articles),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM articles").fetchone()[0]
+
+
+class AsyncPubMedClient:
+    def __init__(self, backend: PubMedBackend, cache: PubMedCache | None = None) -> None:
+        self.backend = backend
+        self.cache = cache
+        self._limiter = TokenBucket(backend.requests_per_second) if backend.requests_per_second else None
+        # PMIDs being fetched, so that concurrent requests for the same PMID wait for the same response
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    async def fetch_article(self, pmid: int | str) -> str | None:
+        """Get the PubmedArticle XML of a PMID, or None if it was not found."""
+        return (await self.fetch_articles([pmid])).get(int(pmid))
+
+    async def fetch_articles(self, pmids: Iterable[int | str]) -> Dict[int, str]:
+        pmids = list(dict.fromkeys(int(pmid) for pmid in pmids))
+        articles = self.cache.get_many(pmids) if self.cache is not None else {}
+        missing = [pmid for pmid in pmids if pmid not in articles and pmid not in self._pending]
+        loop = asyncio.get_running_loop()
+        for pmid in missing:
+            self._pending[pmid] = loop.create_future()
+        futures = {pmid: self._pending[pmid] for pmid in pmids if pmid not in articles}
+        if missing:
+            await self._fetch_missing(missing)
+        for pmid, future in futures.items():
+            article = await asyncio.shield(future)
+            if article is not None:
+                articles[pmid] = article
+        return articles
+
+    async def _fetch_missing(self, pmids: List[int]) -> None:
+        try:
+            for i in range(0, len(pmids), self.backend.batch_size):
+                batch = pmids[i:i + self.backend.batch_size]
+                if self._limiter is not None:
+                    await self._limiter.acquire()
+                articles = await self.backend.fetch(batch)
+                if self.cache is not None and articles:
+                    self.cache.put_many(articles.items())
+                for pmid in batch:
+                    self._pending.pop(pmid).set_result(articles.get(pmid))
+        except BaseException as e:
+            for pmid in pmids:
+                future = self._pending.pop(pmid, None)
+                if future is None:
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # mark the exception as retrieved, it is raised to the caller here
+                    future.exception()
+            raise
+
+
+def parse_summary(xml: str) -> Dict[str, str | List[str]]:
+    """Extract the fields used by citation.onlineFullCitation from PubmedArticle XML."""
+    article = ET.fromstring(xml)
+    return {
+        "title": find_text(article, ".//ArticleTitle") or "",
+        "journal": (
+            find_text(article, ".//MedlineJournalInfo/MedlineTA") or find_text(article, ".//Journal/Title") or ""
+        ),
+        "year": find_text(article, ".//PubDate/Year") or find_text(article, ".//PubDate/MedlineDate") or "",
+        "authors": [
+            f"{find_text(author, './LastName')} {find_text(author, './Initials')}".strip()
+            for author in article.iter("Author")
+            if author.find("./LastName") is not None
+        ],
+    }
+
+
+@cache
+def get_pubmed_client() -> AsyncPubMedClient:
+    if fixture_dir := os.environ.get("PUBMED_FIXTURE_DIR"):
+        backend = FileBackend(fixture_dir)
+    else:
+        backend = EutilsBackend(
+            api_key=os.environ.get("NCBI_API_KEY"),
+            base_url=os.environ.get("EUTILS_BASE_URL", DEFAULT_EUTILS_BASE_URL),
+        )
+    cache_path = os.environ.get("PUBMED_CACHE_PATH", DEFAULT_PUBMED_CACHE_PATH)
+    try:
+        pubmed_cache = PubMedCache(cache_path)
+    except (OSError, sqlite3.Error):
+        logger.warning(f"Could not open the PubMed cache at {cache_path}, fetching articles uncached", exc_info=True)
+        pubmed_cache = None
+    return AsyncPubMedClient(backend, cache=pubmed_cache)
@@ -0,0 +1,35 @@
+"""Lazily loaded resources shared across modules.
+
+GARD, the HPO ontology and the pybtex plugins take seconds and a lot of memory to load, so they are only
+loaded on first use instead of at import time.
+"""
+from functools import cache
+
+
+@cache
+def get_gard():
+    from gard import GARD
+
+    return GARD()
+
+
+@cache
+def get_ontology():
+    from pyhpo import Ontology
+
+    Ontology()
+    return Ontology
+
+
+@cache
+def get_apa_style():
+    from pybtex.plugin import find_plugin
+
+    return find_plugin("pybtex.style.formatting", "apa")()
+
+
+@cache
+def get_text_backend():
+    from pybtex.plugin import find_plugin
+
+    return find_plugin("pybtex.backends", "text")()
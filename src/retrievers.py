@@ -3,16 +3,50 @@ import re
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import faiss
-from llama_index.core import BasePromptTemplate, QueryBundle, ServiceContext, Settings, StorageContext, VectorStoreIndex
+import numpy as np
+from llama_index.core import BasePromptTemplate, QueryBundle, ServiceContext, Settings, StorageContext
 from llama_index.core.callbacks import CallbackManager
 from llama_index.core.indices.knowledge_graph.retrievers import REL_TEXT_LIMIT
 from llama_index.core.llms.llm import LLM
 from llama_index.core.retrievers import KnowledgeGraphRAGRetriever
 from llama_index.core.schema import NodeWithScore, TextNode
-from llama_index.vector_stores.faiss import FaissVectorStore
+
+from textualize import KnowledgeTriple
 
 logger = logging.getLogger(__name__)
 
+METADATA_KEYS = ["subject", "predicate", "object", "citation"]
+
+
+def similarity_search(texts: List[str], query_bundle: QueryBundle, similarity_top_k: int) -> List[Tuple[int, float]]:
+    """Return the indices and L2 distances of the texts closest to the query."""
+    embed_model = Settings.embed_model
+    if query_bundle.embedding is None:
+        query_bundle.embedding = embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+    embeddings = np.array(embed_model.get_text_embedding_batch(texts), dtype=np.float32)
+    faiss_index = faiss.IndexFlatL2(embeddings.shape[1])
+    faiss_index.add(embeddings)
+    query_embedding = np.array([query_bundle.embedding], dtype=np.float32)
+    distances, indices = faiss_index.search(query_embedding, min(similarity_top_k, len(texts)))
+    return [(int(index), float(distance)) for index, distance in zip(indices[0], distances[0]) if index >= 0]
+
+
+def triple_to_node(triple: KnowledgeTriple, score: float | None = None) -> NodeWithScore:
+    return NodeWithScore(
+        node=TextNode(
+            text=" ".join(triple[:3]),
+            metadata={
+                "subject": triple.subject,
+                "predicate": triple.predicate,
+                "object": triple.object,
+                "citation": triple.citation.split("|") if triple.citation else [],
+            },
+            excluded_embed_metadata_keys=METADATA_KEYS,
+            excluded_llm_metadata_keys=METADATA_KEYS,
+        ),
+        score=score,
+    )
+
 
 class KG_RAG_KnowledgeGraphRAGRetriever(KnowledgeGraphRAGRetriever):
     def __init__(
@@ -63,38 +97,20 @@ class KG_RAG_KnowledgeGraphRAGRetriever(KnowledgeGraphRAGRetriever):
         self._verbose = verbose
 
     def _build_nodes(
-        self, knowledge_sequence: List[str], rel_map: Optional[Dict[Any, Any]] = None, query_bundle: QueryBundle = None
+        self,
+        knowledge_sequence: List[KnowledgeTriple],
+        rel_map: Optional[Dict[Any, Any]] = None,
+        query_bundle: QueryBundle = None,
     ) -> List[NodeWithScore]:
-        """Build nodes from knowledge sequence."""
+        """Build nodes for the top k triples of the knowledge sequence."""
         if len(knowledge_sequence) == 0:
             logger.info("> No knowledge sequence extracted from entities.")
             return []
 
-        metadata_keys = ["subject", "predicate", "object", "citation"]
-
-        nodes = [
-            TextNode(
-                text=" ".join(knowledge[:3]),
-                metadata={
-                    "subject": knowledge[0],
-                    "predicate": knowledge[1],
-                    "object": knowledge[2],
-                    "citation": knowledge[3].split("|") if knowledge[3] else [],
-                },
-                excluded_embed_metadata_keys=metadata_keys,
-                excluded_llm_metadata_keys=metadata_keys,
-            )
-            for knowledge in knowledge_sequence
-        ]
-
-        faiss_index = faiss.IndexFlatL2(Settings.num_output)
-        vector_store = FaissVectorStore(faiss_index)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        index = VectorStoreIndex(nodes=nodes, storage_context=storage_context)
-        retriever = index.as_retriever(similarity_top_k=self._similarity_top_k)
-        nodes = retriever.retrieve(query_bundle)
-
-        return nodes
+        # only the top k triples are turned into nodes
+        texts = [" ".join(triple[:3]) for triple in knowledge_sequence]
+        results = similarity_search(texts, query_bundle, self._similarity_top_k)
+        return [triple_to_node(knowledge_sequence[index], score) for index, score in results]
 
     def _process_entities(
         self,
@@ -196,7 +212,7 @@ class KG_RAG_KnowledgeGraphRAGRetriever(KnowledgeGraphRAGRetriever):
 
     def _get_knowledge_sequence(
         self, entities: List[str], query_bundle: QueryBundle
-    ) -> Tuple[List[List[str]], Optional[Dict[Any, Any]]]:
+    ) -> Tuple[List[KnowledgeTriple], Optional[Dict[Any, Any]]]:
         """Get knowledge sequence from entities."""
         # Get SubGraph from Graph Store as Knowledge Sequence
         rel_map: Optional[Dict] = self._graph_store.get_rel_map(
@@ -214,7 +230,9 @@ class KG_RAG_KnowledgeGraphRAGRetriever(KnowledgeGraphRAGRetriever):
                 else:
                     subj = self._get_best_rel_item(rel_key, query_bundle, entities)
                     memo[rel_key] = subj
-                for rel, obj, citation in rel_values:
+                for triple in rel_values:
+                    rel = triple.predicate
+                    obj = triple.object
                     if rel in memo:
                         rel = memo[rel]
                     else:
@@ -224,7 +242,7 @@ class KG_RAG_KnowledgeGraphRAGRetriever(KnowledgeGraphRAGRetriever):
                         obj = memo[obj]
                     else:
                         obj = self._get_best_rel_item(obj, query_bundle, entities)
-                    knowledge_sequence.append((subj, rel, obj, citation))
+                    knowledge_sequence.append(KnowledgeTriple(subj, rel, obj, triple.citation))
         else:
             logger.info("> No knowledge sequence extracted from entities.")
             return [], None
@@ -233,7 +251,7 @@ class KG_RAG_KnowledgeGraphRAGRetriever(KnowledgeGraphRAGRetriever):
 
     async def _aget_knowledge_sequence(
         self, entities: List[str], query_bundle: QueryBundle
-    ) -> Tuple[List[str], Optional[Dict[Any, Any]]]:
+    ) -> Tuple[List[KnowledgeTriple], Optional[Dict[Any, Any]]]:
         return self._get_knowledge_sequence(entities, query_bundle)
 
     def _get_best_rel_item(self, rel_items: str, query_bundle: QueryBundle, entities: List[str] | None = None) -> str:
@@ -254,12 +272,5 @@ class KG_RAG_KnowledgeGraphRAGRetriever(KnowledgeGraphRAGRetriever):
         if len(rel_items) == 1:
             return rel_items[0]
 
-        nodes = [TextNode(text=rel_item) for rel_item in rel_items]
-
-        faiss_index = faiss.IndexFlatL2(Settings.num_output)
-        vector_store = FaissVectorStore(faiss_index)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        index = VectorStoreIndex(nodes=nodes, storage_context=storage_context, callback_manager=CallbackManager())
-        retriever = index.as_retriever(similarity_top_k=1)
-        nodes = retriever.retrieve(query_bundle)
-        return nodes[0].text
+        index, _ = similarity_search(rel_items, query_bundle, 1)[0]
+        return rel_items[index]
@@ -0,0 +1,117 @@
+"""Rendering of the graph of source triples cited in an answer.
+
+Rendering shells out to Graphviz, so graphs are rendered on a small worker pool instead of the caller's thread.
+Rendered files are named by a hash of the edge set and format, so the same sources are only rendered once, and
+the directory is kept under a size limit by evicting the least recently used files.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOURCE_GRAPH_DIR = ".files/source_graphs"
+DEFAULT_SOURCE_GRAPH_MAX_BYTES = 256 * 1024 * 1024
+SOURCE_GRAPH_FORMATS = ("png", "svg")
+SOURCE_GRAPH_WORKERS = 2
+
+# (subject, predicate, object)
+Edge = Tuple[str, str, str]
+
+
+def get_edge_key(edges: Iterable[Edge], format: str) -> str:
+    edges = sorted(set(edges))
+    return hashlib.sha256(json.dumps([format, edges]).encode()).hexdigest()
+
+
+def render_source_graph(edges: Iterable[Edge], path: str | Path, format: str) -> None:
+    import pydot
+
+    graph = pydot.Dot("source_graph", graph_type="digraph")
+    for subj, predicate, obj in edges:
+        graph.add_edge(pydot.Edge(subj, obj, label=predicate))
+    graph.write(str(path), format=format)
+
+
+class SourceGraphStore:
+    def __init__(
+        self,
+        directory: str | Path = DEFAULT_SOURCE_GRAPH_DIR,
+        max_bytes: int = DEFAULT_SOURCE_GRAPH_MAX_BYTES,
+        workers: int = SOURCE_GRAPH_WORKERS,
+        render: Callable[[Iterable[Edge], Path, str], None] = render_source_graph,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._render = render
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="source_graph")
+        self._lock = threading.Lock()
+        # renders in progress, so that concurrent requests for the same graph share one render
+        self._pending: Dict[str, Future] = {}
+
+    def submit(self, edges: Iterable[Edge], format: str = "png") -> Future:
+        """Render the graph of edges in the background, returning a future of the file path."""
+        if format not in SOURCE_GRAPH_FORMATS:
+            raise ValueError(f"Unsupported source graph format {format!r}, expected one of {SOURCE_GRAPH_FORMATS}")
+        edges = sorted(set(edges))
+        key = get_edge_key(edges, format)
+        path = self.directory / f"{key}.{format}"
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            if path.exists():
+                # the modification time orders files for eviction
+                os.utime(path)
+                future = Future()
+                future.set_result(str(path))
+                return future
+            future = self._executor.submit(self._render_file, edges, path, format)
+            self._pending[key] = future
+        future.add_done_callback(lambda _: self._pop_pending(key))
+        return future
+
+    def _pop_pending(self, key: str) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _render_file(self, edges: Iterable[Edge], path: Path, format: str) -> str:
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        self._render(edges, tmp_path, format)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return str(path)
+
+    def evict(self, keep: Path | None = None) -> None:
+        """Delete the least recently used files, except keep, until the directory is under max_bytes."""
+        files = []
+        for path in self.directory.iterdir():
+            if path.suffix.removeprefix(".") in SOURCE_GRAPH_FORMATS:
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.debug(f"Evicted source graph {path}")
+
+
+@cache
+def get_source_graph_store() -> SourceGraphStore:
+    return SourceGraphStore(
+        os.environ.get("SOURCE_GRAPH_DIR", DEFAULT_SOURCE_GRAPH_DIR),
+        int(os.environ.get("SOURCE_GRAPH_MAX_BYTES", DEFAULT_SOURCE_GRAPH_MAX_BYTES)),
+    )
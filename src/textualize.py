@@ -1,23 +1,87 @@
 import logging
-from typing import Dict, List
+from functools import cache
+from typing import Dict, List, NamedTuple
 
-from gard import GARD
-from pyhpo import Ontology
-
-Ontology()
-gard = GARD()
+from resources import get_gard, get_ontology
 
 logger = logging.getLogger(__name__)
 
 
+class KnowledgeTriple(NamedTuple):
+    """A (subject, predicate, object) triple from the graph, with its citations separated by "|"."""
+
+    subject: str
+    predicate: str
+    object: str
+    citation: str
+
+
+HPO_FREQUENCY = 40279
+HPO_ONSET = 3674
+
+# Names of the HPO frequency (HP:0040279) and onset (HP:0003674) terms, which are the only terms used in
+# r_Frequency and r_Onset, so that phenotypes can be textualized without querying the ontology.
+# Kept in sync with the ontology by build_hpo_name_table (see tests/texualize_test.py).
+HPO_NAMES: Dict[int, str] = {
+    40279: "Frequency",
+    40280: "Obligate",
+    40281: "Very frequent",
+    40282: "Frequent",
+    40283: "Occasional",
+    40284: "Very rare",
+    40285: "Excluded",
+    3674: "Onset",
+    30674: "Antenatal onset",
+    11460: "Embryonal onset",
+    11461: "Fetal onset",
+    34199: "Late first trimester onset",
+    34198: "Second trimester onset",
+    34197: "Third trimester onset",
+    3577: "Congenital onset",
+    3623: "Neonatal onset",
+    410280: "Pediatric onset",
+    3593: "Infantile onset",
+    11463: "Childhood onset",
+    3621: "Juvenile onset",
+    3581: "Adult onset",
+    11462: "Young adult onset",
+    25708: "Early young adult onset",
+    25709: "Intermediate young adult onset",
+    25710: "Late young adult onset",
+    3596: "Middle age onset",
+    3584: "Late onset",
+    4000040: "Puerpural onset",
+    6000314: "Perimenopausal onset",
+    6000315: "Postmenopausal onset",
+}
+
+
+def build_hpo_name_table(*root_ids: int) -> Dict[int, str]:
+    """Build a HPO ID to name table of the given terms and all their descendants from the ontology."""
+    table = {}
+    ontology = get_ontology()
+    terms = [ontology[root_id] for root_id in root_ids]
+    while terms:
+        term = terms.pop()
+        table[int(term.id.split(":")[-1])] = term.name
+        terms.extend(term.children)
+    return table
+
+
+@cache
+def _lookup_hpo_name_ontology(hpo_id: int):
+    return get_ontology()[hpo_id].name
+
+
 def lookup_hpo_name(hpo_id: int | str):
     if isinstance(hpo_id, str):
         if hpo_id.startswith("HP:"):
             hpo_id = int(hpo_id.split(":")[-1])
         else:
             return hpo_id
-    hpo_term = Ontology[hpo_id]
-    return hpo_term.name
+    if hpo_id in HPO_NAMES:
+        return HPO_NAMES[hpo_id]
+    return _lookup_hpo_name_ontology(hpo_id)
 
 
 def lookup_hpo_names(hpo_ids: List[int | str] | int | str):
@@ -40,6 +104,17 @@ def textualize_phenotype(phenotype: dict):
     return "\n".join(phenotype_description)
 
 
+def get_precomputed(record: dict):
+    """Get the text and citation written to the relationship by precompute_textualization.py.
+
+    Returns None if the record has not been precomputed, in which case the record is textualized in Python.
+    """
+    text = record.get("r__Text")
+    if text is None:
+        return None
+    return text, record.get("r__Citation") or ""
+
+
 def get_list(text: str | list[str]):
     if not text:
         return []
@@ -55,17 +130,26 @@ def get_list(text: str | list[str]):
     return citations
 
 
+def cite_phenotype(phenotype: dict):
+    return "|".join(get_list(phenotype["r_Reference"]))
+
+
 def textualize_phenotypes(phenotypes: list[dict]):
-    rel_map: Dict[str, List[List[str]]] = {}
+    rel_map: Dict[str, List[KnowledgeTriple]] = {}
 
     for phenotype in phenotypes:
         if phenotype["n__N_Name"] not in rel_map:
             rel_map[phenotype["n__N_Name"]] = []
-        phenotype_description = textualize_phenotype(phenotype)
+        if precomputed := get_precomputed(phenotype):
+            phenotype_description, citation = precomputed
+        else:
+            phenotype_description = textualize_phenotype(phenotype)
+            citation = cite_phenotype(phenotype) if phenotype_description else ""
         if not phenotype_description:
             continue
-        citations = get_list(phenotype["r_Reference"])
-        rel_map[phenotype["n__N_Name"]].append(("has phenotype", phenotype_description, "|".join(citations)))
+        rel_map[phenotype["n__N_Name"]].append(
+            KnowledgeTriple(phenotype["n__N_Name"], "has phenotype", phenotype_description, citation)
+        )
     return rel_map
 
 
@@ -85,20 +169,28 @@ def textualize_prevalence(prevalence: dict):
     return "\n".join(prevalence_description)
 
 
+def cite_prevalence(prevalence: dict):
+    return "|".join(get_list(prevalence["n_Source"]))
+
+
 def textualize_prevelances(prevalences: list[dict]):
-    rel_map: Dict[str, List[List[str]]] = {}
+    rel_map: Dict[str, List[KnowledgeTriple]] = {}
     for prevalence in prevalences:
         if prevalence["m__N_Name"] not in rel_map:
             rel_map[prevalence["m__N_Name"]] = []
-        prevalence_description = textualize_prevalence(prevalence)
+        if precomputed := get_precomputed(prevalence):
+            prevalence_description, citation = precomputed
+        else:
+            prevalence_description = textualize_prevalence(prevalence)
+            citation = cite_prevalence(prevalence) if prevalence_description else ""
         if not prevalence_description:
             continue
-        citations = get_list(prevalence["n_Source"])
         rel_map[prevalence["m__N_Name"]].append(
-            (
+            KnowledgeTriple(
+                prevalence["m__N_Name"],
                 "has prevalence",
                 prevalence_description,
-                "|".join(citations),
+                citation,
             )
         )
     return rel_map
@@ -141,21 +233,26 @@ def cite_organization(organization: dict):
         for i_code in organization["m__I_CODE"].split("|"):
             if i_code.startswith("GARD:"):
                 gard_id = i_code.split(":")[-1]
-                gard_url = gard.get_url(gard_id) + "#:~:text=our%20About%20page.-,Patient%20Organizations,-Filter%3A"
+                gard_url = get_gard().get_url(gard_id) + "#:~:text=our%20About%20page.-,Patient%20Organizations,-Filter%3A"
                 gard_urls.append(gard_url)
     return "|".join(gard_urls)
 
 
 def textualize_organizations(organizations: list[dict]):
-    rel_map: Dict[str, List[List[str]]] = {}
+    rel_map: Dict[str, List[KnowledgeTriple]] = {}
     for organization in organizations:
         if organization["m__N_Name"] not in rel_map:
             rel_map[organization["m__N_Name"]] = []
-        organization_description = textualize_organization(organization)
+        if precomputed := get_precomputed(organization):
+            organization_description, citation = precomputed
+        else:
+            organization_description = textualize_organization(organization)
+            citation = cite_organization(organization) if organization_description else ""
         if not organization_description:
             continue
-        citation = cite_organization(organization)
-        rel_map[organization["m__N_Name"]].append(("has organization", organization_description, citation))
+        rel_map[organization["m__N_Name"]].append(
+            KnowledgeTriple(organization["m__N_Name"], "has organization", organization_description, citation)
+        )
     return rel_map
 
 
@@ -176,26 +273,33 @@ def textualize_rel(rel: dict):
     return "\n".join(rel_description)
 
 
+def cite_rel(rel: dict):
+    return "|".join(get_list(rel["r_citations"]) + get_list(rel["r_value"]))
+
+
 def textualize_rels(rels: list[dict]):
-    rel_map: Dict[str, List[List[str]]] = {}
+    rel_map: Dict[str, List[KnowledgeTriple]] = {}
     for rel in rels:
         subj = rel["n__N_Name"] or rel["n__I_GENE"]
         if subj not in rel_map:
             rel_map[subj] = []
-        obj = textualize_rel(rel)
+        if precomputed := get_precomputed(rel):
+            obj, citation = precomputed
+        else:
+            obj = textualize_rel(rel)
+            citation = cite_rel(rel) if obj else ""
         if not obj:
             continue
         relationships = rel["r_name"]
         if isinstance(relationships, list):
             relationships = "|".join(relationships)
         relationships = relationships.replace("_", " ")
-        citations = get_list(rel["r_citations"]) + get_list(rel["r_value"])
-        rel_map[subj].append((relationships, obj, "|".join(citations)))
+        rel_map[subj].append(KnowledgeTriple(subj, relationships, obj, citation))
     return rel_map
 
 
 def textualize_pubtator3s(rels: list[dict]):
-    rel_map: Dict[str, List[List[str]]] = {}
+    rel_map: Dict[str, List[KnowledgeTriple]] = {}
     for rel in rels:
         subj = rel["n_Mentions"].removeprefix("|")
         if not subj:
@@ -209,5 +313,5 @@ def textualize_pubtator3s(rels: list[dict]):
         citations = rel["r_PMID"].split("|")
         citations = [f"PMID:{citation}" for citation in citations]
         citation = "|".join(citations)
-        rel_map[subj].append((pred, obj, citation))
+        rel_map[subj].append(KnowledgeTriple(subj, pred, obj, citation))
     return rel_map
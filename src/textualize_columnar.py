@@ -0,0 +1,158 @@
+"""Columnar versions of the textualize_* functions.
+
+These take the Neo4j results as a pandas DataFrame (see CustomNeo4jGraphStore(columnar=True)) and build the
+descriptions with vectorized string operations instead of looping over records. They return the same rel maps
+as their row-wise counterparts in textualize.py.
+"""
+from typing import Dict, List
+
+import pandas as pd
+
+from textualize import KnowledgeTriple, cite_organization, get_list, lookup_hpo_names
+
+
+def is_present(values: pd.Series) -> pd.Series:
+    """Vectorized truthiness check, matching `if record[key]` in the row-wise functions."""
+    return values.notna() & values.map(bool, na_action="ignore").fillna(False).astype(bool)
+
+
+def optional_line(values: pd.Series, prefix: str = "") -> pd.Series:
+    """Return "\\n{prefix}{value}" where the value is present, and "" otherwise."""
+    return ("\n" + prefix + values.astype(str)).where(is_present(values), "")
+
+
+def cite_column(values: pd.Series) -> pd.Series:
+    """Vectorized "|".join(get_list(value))."""
+    is_str = values.map(lambda value: isinstance(value, str))
+    citations = values.where(is_present(values), "")
+    strings = citations[is_str].astype(str)
+    strings = (
+        strings.str.removeprefix("[")
+        .str.removesuffix("]")
+        .str.replace(r"(^|,)Orphanet", r"\1ORPHA", regex=True)
+        .str.replace(",", "|", regex=False)
+    )
+    others = citations[~is_str].map(lambda value: "|".join(get_list(value)))
+    return pd.concat([strings, others]).reindex(values.index).fillna("")
+
+
+def join_columns(left: pd.Series, right: pd.Series, sep: str = "|") -> pd.Series:
+    """Join two string columns with sep, skipping empty values."""
+    both = (left != "") & (right != "")
+    return left + pd.Series(sep, index=left.index).where(both, "") + right
+
+
+def apply_precomputed(df: pd.DataFrame, text: pd.Series, citation: pd.Series):
+    """Use the text and citation written by precompute_textualization.py where present."""
+    if "r__Text" not in df:
+        return text, citation
+    precomputed = df["r__Text"].notna()
+    text = df["r__Text"].where(precomputed, text)
+    citation = df["r__Citation"].where(df["r__Citation"].notna(), "").where(precomputed, citation)
+    return text, citation
+
+
+def to_rel_map(
+    subjects: pd.Series, predicates: pd.Series | str, objects: pd.Series, citations: pd.Series
+) -> Dict[str, List[KnowledgeTriple]]:
+    # every subject gets an entry, even if none of its rows have a description
+    rel_map: Dict[str, List[KnowledgeTriple]] = {subject: [] for subject in subjects}
+    if isinstance(predicates, str):
+        predicates = pd.Series(predicates, index=subjects.index)
+    keep = objects.astype(bool)
+    for subject, predicate, obj, citation in zip(subjects[keep], predicates[keep], objects[keep], citations[keep]):
+        rel_map[subject].append(KnowledgeTriple(subject, predicate, obj, citation))
+    return rel_map
+
+
+def format_hpo_names(values: pd.Series) -> pd.Series:
+    # there are only a few distinct frequency and onset values, so look up each one once
+    names = {}
+    for value in values[is_present(values)]:
+        key = tuple(value) if isinstance(value, list) else value
+        if key not in names:
+            names[key] = ",".join(lookup_hpo_names(value))
+    return values.map(
+        lambda value: names[tuple(value) if isinstance(value, list) else value] if value else "", na_action="ignore"
+    ).fillna("")
+
+
+def textualize_phenotypes_df(phenotypes: pd.DataFrame) -> Dict[str, List[KnowledgeTriple]]:
+    name = phenotypes["m__N_Name"]
+    has_name = is_present(name)
+    text = (
+        name.astype(str)
+        + optional_line(format_hpo_names(phenotypes["r_Frequency"]), "Frequency: ")
+        + optional_line(format_hpo_names(phenotypes["r_Onset"]), "Onset: ")
+    ).where(has_name, "")
+    citation = cite_column(phenotypes["r_Reference"]).where(has_name, "")
+    text, citation = apply_precomputed(phenotypes, text, citation)
+    return to_rel_map(phenotypes["n__N_Name"], "has phenotype", text, citation)
+
+
+def textualize_prevalences_df(prevalences: pd.DataFrame) -> Dict[str, List[KnowledgeTriple]]:
+    prevalence_class = prevalences["n_PrevalenceClass"]
+    has_class = is_present(prevalence_class)
+    text = (
+        "PrevalenceClass: "
+        + prevalence_class.astype(str)
+        + optional_line(prevalences["n_PrevalenceGeographic"], "PrevalenceGeographic: ")
+        + optional_line(prevalences["n_PrevalenceQualification"], "PrevalenceQualification: ")
+        + optional_line(prevalences["n_PrevalenceValidationStatus"], "PrevalenceValidationStatus: ")
+        + optional_line(prevalences["n_ValMoy"], "ValMoy: ")
+    ).where(has_class, "")
+    citation = cite_column(prevalences["n_Source"]).where(has_class, "")
+    text, citation = apply_precomputed(prevalences, text, citation)
+    return to_rel_map(prevalences["m__N_Name"], "has prevalence", text, citation)
+
+
+def textualize_organizations_df(organizations: pd.DataFrame) -> Dict[str, List[KnowledgeTriple]]:
+    name = organizations["n_Name"]
+    has_name = is_present(name)
+    has_address = is_present(organizations["n_Address1"]) | is_present(organizations["n_Address2"])
+    zip_code = organizations["n_ZipCode"].where(is_present(organizations["n_ZipCode"]))
+    text = (
+        name.astype(str)
+        + pd.Series("\nAddress: ", index=organizations.index).where(has_address, "")
+        + optional_line(organizations["n_Address1"])
+        + optional_line(organizations["n_Address2"])
+        + optional_line(organizations["n_City"], "City: ")
+        + optional_line(organizations["n_Country"], "Country: ")
+        + optional_line(organizations["n_Email"], "Email: ")
+        + optional_line(organizations["n_Fax"], "Fax: ")
+        + optional_line(organizations["n_Phone"], "Phone: ")
+        + optional_line(organizations["n_State"], "State: ")
+        + optional_line(organizations["n_TollFree"], "TollFree: ")
+        + optional_line(organizations["n_URL"], "URL: ")
+        + ("\nZipCode: " + zip_code.astype(str).str.strip()).where(zip_code.notna(), "")
+    ).where(has_name, "")
+    # the citation only depends on the disease, so cite each distinct disease once
+    codes = organizations["m__I_CODE"]
+    gard_urls = {code: cite_organization({"m__I_CODE": code}) for code in set(codes)}
+    citation = pd.Series([gard_urls[code] for code in codes], index=organizations.index, dtype=object)
+    citation = citation.where(has_name, "")
+    text, citation = apply_precomputed(organizations, text, citation)
+    return to_rel_map(organizations["m__N_Name"], "has organization", text, citation)
+
+
+def textualize_rels_df(rels: pd.DataFrame) -> Dict[str, List[KnowledgeTriple]]:
+    name = rels["m__N_Name"].where(is_present(rels["m__N_Name"]), "").astype(str)
+    gene = rels["m__I_GENE"].where(is_present(rels["m__I_GENE"]), "").astype(str)
+    has_obj = (name != "") | (gene != "")
+    text = (join_columns(name, gene) + optional_line(rels["r_interpretation"], "Interpretation: ")).where(has_obj, "")
+    citation = join_columns(cite_column(rels["r_citations"]), cite_column(rels["r_value"])).where(has_obj, "")
+    text, citation = apply_precomputed(rels, text, citation)
+    subjects = rels["n__N_Name"].where(is_present(rels["n__N_Name"]), rels["n__I_GENE"])
+    predicates = rels["r_name"].map(lambda name: "|".join(name) if isinstance(name, list) else name)
+    predicates = predicates.str.replace("_", " ", regex=False)
+    return to_rel_map(subjects, predicates, text, citation)
+
+
+def textualize_pubtator3s_df(rels: pd.DataFrame) -> Dict[str, List[KnowledgeTriple]]:
+    subjects = rels["n_Mentions"].str.removeprefix("|")
+    rels = rels[subjects != ""]
+    subjects = subjects[subjects != ""]
+    objects = rels["m_Mentions"].str.removeprefix("|")
+    predicates = rels["r_type"].str.removesuffix("_PubTator3")
+    citations = "PMID:" + rels["r_PMID"].str.replace("|", "|PMID:", regex=False)
+    return to_rel_map(subjects, predicates, objects, citations)
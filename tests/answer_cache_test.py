@@ -0,0 +1,80 @@
+import time
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from src.answer_cache import AnswerCache, AnswerCacheKey, get_answer_cache, get_source_fingerprint
+from src.citation import SOURCE_NUMBER_KEY
+
+
+def get_key(embedding, source_fingerprint="sources", question="What causes Marfan syndrome?"):
+    return AnswerCacheKey(question, embedding, source_fingerprint)
+
+
+def get_node(text, source_number):
+    metadata = {"citation": ["PMID:1"], SOURCE_NUMBER_KEY: source_number}
+    return NodeWithScore(node=TextNode(text=f"Source {source_number}: {text}", metadata=metadata), score=1.0)
+
+
+class TestAnswerCache:
+    def test_get_put(self, tmp_path):
+        cache = AnswerCache(tmp_path / "answer_cache.sqlite", similarity_threshold=0.9)
+        assert cache.get(get_key([1.0, 0.0])) is None
+        cache.put(get_key([1.0, 0.0]), "FBN1 [Source 3].", "FBN1 [1].", "\n\nReferences:\n[1] a")
+        # the similarity of the questions is their cosine similarity
+        cached_answer = cache.get(get_key([2.0, 0.2], question="What is the cause of Marfan syndrome?"))
+        assert cached_answer.question == "What causes Marfan syndrome?"
+        assert (cached_answer.answer, cached_answer.content) == ("FBN1 [Source 3].", "FBN1 [1].")
+        assert cached_answer.bibliography == "\n\nReferences:\n[1] a"
+        assert cached_answer.similarity > 0.99
+        assert cache.get(get_key([1.0, 1.0])) is None
+        assert cache.stats.as_dict() == {"hits": 1, "misses": 2, "hit_rate": 0.333, "expired": 0, "evicted": 0}
+
+    def test_language_and_sources(self, tmp_path):
+        cache = AnswerCache(tmp_path / "answer_cache.sqlite")
+        cache.put(get_key([1.0, 0.0]), "FBN1 [1].", "FBN1 [1].", None)
+        cache.put(get_key([1.0, 0.0]), "FBN1 [1].", "FBN1 [1] (fr).", None, language="fr")
+        assert cache.get(get_key([1.0, 0.0])).content == "FBN1 [1]."
+        assert cache.get(get_key([1.0, 0.0]), language="fr").content == "FBN1 [1] (fr)."
+        assert cache.get(get_key([1.0, 0.0]), language="de") is None
+        assert cache.get(get_key([1.0, 0.0], source_fingerprint="other sources")) is None
+
+    def test_ttl(self, tmp_path):
+        cache = AnswerCache(tmp_path / "answer_cache.sqlite", ttl=0.1)
+        cache.put(get_key([1.0, 0.0]), "FBN1 [1].", "FBN1 [1].", None)
+        time.sleep(0.2)
+        assert cache.get(get_key([1.0, 0.0])) is None
+        assert len(cache) == 0
+        assert cache.stats.expired == 1
+
+    def test_lru_eviction(self, tmp_path):
+        cache = AnswerCache(tmp_path / "answer_cache.sqlite", max_entries=2)
+        for i in range(2):
+            cache.put(get_key([1.0, float(i)], source_fingerprint=str(i)), str(i), str(i), None)
+        # the first entry is used, so the second is the least recently used
+        assert cache.get(get_key([1.0, 0.0], source_fingerprint="0")).content == "0"
+        cache.put(get_key([1.0, 2.0], source_fingerprint="2"), "2", "2", None)
+        assert len(cache) == 2
+        assert cache.get(get_key([1.0, 1.0], source_fingerprint="1")) is None
+        assert cache.get(get_key([1.0, 0.0], source_fingerprint="0")).content == "0"
+        assert cache.stats.evicted == 1
+
+    def test_persistent(self, tmp_path):
+        AnswerCache(tmp_path / "answer_cache.sqlite").put(get_key([1.0, 0.0]), "FBN1 [1].", "FBN1 [1].", None)
+        assert AnswerCache(tmp_path / "answer_cache.sqlite").get(get_key([1.0, 0.0])).content == "FBN1 [1]."
+
+    def test_source_fingerprint(self):
+        nodes = [get_node("Marfan syndrome has phenotype Arachnodactyly", 1), get_node("FBN1 causes Marfan", 2)]
+        # the same sources, numbered in another turn
+        renumbered = [get_node("FBN1 causes Marfan", 7), get_node("Marfan syndrome has phenotype Arachnodactyly", 8)]
+        assert get_source_fingerprint(nodes) == get_source_fingerprint(renumbered)
+        assert get_source_fingerprint(nodes) != get_source_fingerprint(nodes[:1])
+
+    def test_get_answer_cache_unavailable(self, tmp_path, monkeypatch):
+        # a file where the cache directory should be, so that it cannot be created
+        (tmp_path / "file").touch()
+        monkeypatch.setenv("ANSWER_CACHE_PATH", str(tmp_path / "file" / "answer_cache.sqlite"))
+        get_answer_cache.cache_clear()
+        try:
+            assert get_answer_cache() is None
+        finally:
+            get_answer_cache.cache_clear()
@@ -0,0 +1,37 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from src.apa import format_article, format_name
+
+# hand-written records with made-up PMIDs, for edge cases (particles, accents, missing fields, LaTeX markup),
+# and the citations rendered for them by citation.bib_to_apa7_html (pybtex)
+GOLDEN = json.loads((Path(__file__).parent / "data" / "apa_citations.json").read_text())
+# records with LaTeX markup, which are left to pybtex
+LATEX_PMIDS = {"100005", "100008"}
+# real records and their pybtex citations: PMID 37768006 and the journal articles it cites, from the reference list
+# of data/PMC10620460.xml, which has no PMIDs, so 0 stands for them. benchmarks/apa.py --sample replaces them by
+# records sampled from the citation store.
+SAMPLED = json.loads((Path(__file__).parent / "data" / "apa_citations_sampled.json").read_text())
+
+
+class TestApa:
+    def test_format_name(self):
+        assert format_name("Jakobs, P M") == "Jakobs, P. M."
+        assert format_name("Saint-Pierre, Jean-Luc") == "Saint-Pierre, J.-L."
+        assert format_name("Anonymous") == "Anonymous"
+        assert format_name("Consortium, Genome, Aggregation") is None
+
+    @pytest.mark.parametrize("pmid", [pmid for pmid in GOLDEN if pmid not in LATEX_PMIDS])
+    def test_format_article_golden(self, pmid):
+        assert format_article(int(pmid), GOLDEN[pmid]["record"]) == GOLDEN[pmid]["citation"]
+
+    @pytest.mark.parametrize("sample", SAMPLED, ids=[sample["source"] for sample in SAMPLED])
+    def test_format_article_sampled(self, sample):
+        citation = format_article(sample["pmid"] or 0, sample["record"])
+        assert citation == (sample["citation"] if sample["direct"] else None)
+
+    def test_format_article_latex_fallback(self):
+        for pmid in LATEX_PMIDS:
+            assert format_article(int(pmid), GOLDEN[pmid]["record"]) is None
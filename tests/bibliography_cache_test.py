@@ -0,0 +1,29 @@
+from src.bibliography_cache import BibliographyCache, get_bibliography_cache
+
+
+class TestBibliographyCache:
+    def test_get_put(self, tmp_path):
+        cache = BibliographyCache(tmp_path / "bibliography_cache.sqlite")
+        assert cache.get("11561226") is None
+        cache.put("11561226", "Jakobs, P. M. (2001 , Sep).")
+        assert cache.get(11561226) == "Jakobs, P. M. (2001 , Sep)."
+        assert len(cache) == 1
+
+    def test_get_many(self, tmp_path):
+        cache = BibliographyCache(tmp_path / "bibliography_cache.sqlite")
+        cache.put_many([(1, "a"), ("2", "b")])
+        assert cache.get_many(["1", 2, 3]) == {1: "a", 2: "b"}
+
+    def test_persistent(self, tmp_path):
+        BibliographyCache(tmp_path / "bibliography_cache.sqlite").put(1, "a")
+        assert BibliographyCache(tmp_path / "bibliography_cache.sqlite").get(1) == "a"
+
+    def test_get_bibliography_cache_unavailable(self, tmp_path, monkeypatch):
+        # a file where the cache directory should be, so that it cannot be created
+        (tmp_path / "file").touch()
+        monkeypatch.setenv("BIBLIOGRAPHY_CACHE_PATH", str(tmp_path / "file" / "bibliography_cache.sqlite"))
+        get_bibliography_cache.cache_clear()
+        try:
+            assert get_bibliography_cache() is None
+        finally:
+            get_bibliography_cache.cache_clear()
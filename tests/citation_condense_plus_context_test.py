@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+from typing import Any
+
+from llama_index.core import Settings
+from llama_index.core.base.llms.types import CompletionResponse, CompletionResponseGen, LLMMetadata
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import CustomLLM
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from src.answer_cache import AnswerCache
+from src.chat_engine.citation_condense_plus_context import HISTORY_WRITER_WORKERS, CitationCondensePlusContextChatEngine
+
+TOKENS = ["Marfan", " syndrome", " causes", " arachnodactyly", " [1]."]
+
+
+class FakeLLM(CustomLLM):
+    """Streams a fixed answer, a token every millisecond."""
+
+    calls: int = 0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=4096, num_output=256)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self.calls += 1
+        return CompletionResponse(text="".join(TOKENS))
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        self.calls += 1
+        text = ""
+        for token in TOKENS:
+            time.sleep(0.001)
+            text += token
+            yield CompletionResponse(text=text, delta=token)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        async def gen():
+            text = ""
+            for token in TOKENS:
+                await asyncio.sleep(0.001)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+
+class FakeRetriever(BaseRetriever):
+    def _retrieve(self, query_bundle) -> list[NodeWithScore]:
+        metadata = {"subject": "Marfan syndrome", "predicate": "has phenotype", "object": "Arachnodactyly",
+                    "citation": ["PMID:1"]}
+        node = TextNode(text="Marfan syndrome has phenotype Arachnodactyly", metadata=metadata,
+                        excluded_llm_metadata_keys=list(metadata), excluded_embed_metadata_keys=list(metadata))
+        return [NodeWithScore(node=node, score=1.0)]
+
+
+def get_chat_engine(**kwargs):
+    return CitationCondensePlusContextChatEngine.from_defaults(retriever=FakeRetriever(), llm=FakeLLM(), **kwargs)
+
+
+class TestCitationCondensePlusContextChatEngine:
+    def test_astream_chat_threads(self):
+        """History writers of concurrent streams run on the event loop, without starting threads."""
+        threads = threading.active_count()
+        peak = threads
+
+        async def stream(chat_engine):
+            nonlocal peak
+            response = await chat_engine.astream_chat("What are the symptoms of Marfan syndrome?")
+            text = ""
+            async for token in response.async_response_gen():
+                text += token
+                peak = max(peak, threading.active_count())
+            await response.history_written
+            return text, chat_engine.chat_history
+
+        async def main():
+            return await asyncio.gather(*(stream(get_chat_engine()) for _ in range(100)))
+
+        for text, chat_history in asyncio.run(main()):
+            assert text == "".join(TOKENS)
+            assert [message.content for message in chat_history] == [
+                "What are the symptoms of Marfan syndrome?", "".join(TOKENS)
+            ]
+        assert peak == threads
+
+    def test_stream_chat_threads(self):
+        """History writers of stream_chat share a bounded pool of threads."""
+        threads = threading.active_count()
+        responses = [get_chat_engine().stream_chat("What causes Marfan syndrome?") for _ in range(100)]
+        assert threading.active_count() <= threads + HISTORY_WRITER_WORKERS
+        for response in responses:
+            assert "".join(response.response_gen) == "".join(TOKENS)
+            response.history_written.result(timeout=10)
+            assert str(response) == "".join(TOKENS)
+        assert threading.active_count() <= threads + HISTORY_WRITER_WORKERS
+
+    def test_answer_cache(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=8))
+        answer_cache = AnswerCache(tmp_path / "answer_cache.sqlite")
+        chat_engine = get_chat_engine(answer_cache=answer_cache)
+        response = chat_engine.chat("What are the symptoms of Marfan syndrome?")
+        assert response.cached_answer is None
+        chat_engine.cache_answer(response, "Marfan syndrome causes arachnodactyly [1].", "\n\nReferences:\n[1] a")
+
+        # another session, whose sources are numbered from 1 as well
+        chat_engine = get_chat_engine(answer_cache=answer_cache)
+        response = chat_engine.stream_chat("What are the symptoms of Marfan syndrome?")
+        assert chat_engine._llm.calls == 0
+        assert response.cached_answer.content == "Marfan syndrome causes arachnodactyly [1]."
+        assert response.cached_answer.bibliography == "\n\nReferences:\n[1] a"
+        response.history_written.result(timeout=10)
+        # the citations of the cached answer refer to the sources of the session it was cached in
+        assert chat_engine.chat_history[-1].content == "Marfan syndrome causes arachnodactyly ."
+
+        response = chat_engine.chat("What are the symptoms of Marfan syndrome?", language="fr")
+        assert response.cached_answer is None
+        assert chat_engine._llm.calls == 1
+        assert answer_cache.stats.as_dict()["hits"] == 1
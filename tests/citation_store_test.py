@@ -0,0 +1,52 @@
+import gzip
+
+import pytest
+
+from src.citation_store import CitationStore, build_citation_store, parse_file
+
+ARTICLE = """<PubmedArticle>
+<MedlineCitation><PMID>{pmid}</PMID>
+<Article><Journal><Title>Journal of {pmid}</Title><JournalIssue><PubDate><Year>2001</Year><Month>Sep</Month></PubDate></JournalIssue></Journal>
+<ArticleTitle>Title {pmid}</ArticleTitle>
+<AuthorList><Author><LastName>Jakobs</LastName><ForeName>Petra</ForeName></Author></AuthorList>
+</Article></MedlineCitation>
+<PubmedData><ArticleIdList><ArticleId IdType="doi">10.1/{pmid}</ArticleId></ArticleIdList></PubmedData>
+</PubmedArticle>"""
+
+
+def write_archive(archive_dir, pmids):
+    for pmid in pmids:
+        path = archive_dir / f"{pmid % 100:02d}" / f"{pmid}.xml.gz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(path, "wt") as f:
+            f.write(ARTICLE.format(pmid=pmid))
+
+
+class TestCitationStore:
+    def test_parse_file(self, tmp_path):
+        write_archive(tmp_path, [11561226])
+        [(pmid, record)] = parse_file(str(tmp_path / "26" / "11561226.xml.gz"))
+        assert pmid == 11561226
+        assert record == {
+            "author": "Jakobs, Petra",
+            "title": "Title 11561226",
+            "journal": "Journal of 11561226",
+            "year": "2001",
+            "month": "Sep",
+            "doi": "10.1/11561226",
+        }
+
+    def test_build_and_get(self, tmp_path):
+        pytest.importorskip("tqdm")
+        pmids = [11561226, 5, 38000000, 1234567]
+        write_archive(tmp_path / "archive", pmids)
+        count = build_citation_store(tmp_path / "archive", tmp_path / "citation_store.bin", processes=2)
+        assert count == len(pmids)
+
+        store = CitationStore(tmp_path / "citation_store.bin")
+        assert len(store) == len(pmids)
+        for pmid in pmids:
+            assert pmid in store
+            assert store.get(str(pmid))["title"] == f"Title {pmid}"
+        assert 6 not in store
+        assert store.get(6) is None
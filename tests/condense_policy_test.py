@@ -0,0 +1,53 @@
+import pytest
+
+from src.chat_engine.condense_policy import CondensePolicy, is_standalone_question
+
+HISTORY = "user: What causes cystic fibrosis?\nassistant: Mutations in the CFTR gene [1]."
+
+
+class TestCondensePolicy:
+    @pytest.mark.parametrize(
+        "message, standalone",
+        [
+            ("What are the symptoms of Marfan syndrome?", True),
+            ("How is Duchenne muscular dystrophy inherited?", True),
+            ("Which diseases are caused by mutations in COL4A5?", True),
+            # names without a capitalized word or a digit are left to the LLM, which is only slower
+            ("What causes cystic fibrosis?", False),
+            ("Is ALS inherited?", False),
+            ("What is the prognosis?", False),
+            ("How is the diagnosis made?", False),
+            ("What is the MRI finding?", False),
+            ("Is genetic testing available in the US?", False),
+            ("Is there a cancer risk?", False),
+            ("What causes the fever?", False),
+            ("Which disease causes arachnodactyly?", False),
+            ("What are its symptoms?", False),
+            ("How about in children?", False),
+            ("What genes are associated with the disease?", False),
+            ("What treatments exist?", False),
+            ("and CF?", False),
+        ],
+    )
+    def test_is_standalone_question(self, message, standalone):
+        assert is_standalone_question(message) == standalone
+
+    def test_condense(self):
+        policy = CondensePolicy()
+        assert policy.condense("", "What are its symptoms?") == "What are its symptoms?"
+        assert policy.condense(HISTORY, "What are the symptoms of Marfan syndrome?") == (
+            "What are the symptoms of Marfan syndrome?"
+        )
+        assert policy.condense(HISTORY, "What are its symptoms?") is None
+        policy.put(HISTORY, "What are its symptoms?", "What are the symptoms of cystic fibrosis?")
+        assert policy.condense(HISTORY, "What are its symptoms?") == "What are the symptoms of cystic fibrosis?"
+        # the cache is keyed by the history, as the same message may refer to something else
+        assert policy.condense(HISTORY + "\nuser: And Marfan syndrome?", "What are its symptoms?") is None
+        assert policy.stats.as_dict() == {"no_history": 1, "standalone": 1, "cached": 1, "llm_calls": 2, "saved": 3}
+
+    def test_cache_size(self):
+        policy = CondensePolicy(is_standalone=None, cache_size=2)
+        for i in range(3):
+            policy.put(HISTORY, f"Question {i}?", f"Condensed {i}?")
+        assert policy.condense(HISTORY, "Question 0?") is None
+        assert policy.condense(HISTORY, "Question 2?") == "Condensed 2?"
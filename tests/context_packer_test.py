@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+from src.chat_engine.context_packer import ContextPacker, dedup_nodes
+
+
+def make_node(subject, predicate, obj, citation):
+    metadata = {"subject": subject, "predicate": predicate, "object": obj, "citation": citation}
+    return SimpleNamespace(node=SimpleNamespace(metadata=metadata), score=None)
+
+
+def number_nodes(nodes):
+    for i, node in enumerate(nodes):
+        node.node.metadata["source_number"] = i + 1
+    return nodes
+
+
+def count_words(text):
+    return len(text.split())
+
+
+NODES = [
+    ("Marfan syndrome", "has phenotype", "Arachnodactyly", ["PMID:1"]),
+    ("Marfan syndrome", "has phenotype", "Ectopia lentis", ["PMID:2"]),
+    ("Homocystinuria", "has phenotype", "Ectopia lentis", ["PMID:3"]),
+    ("Marfan syndrome", "has phenotype", "arachnodactyly.", ["PMID:4", "PMID:1"]),
+]
+
+
+class TestContextPacker:
+    def test_dedup_nodes(self):
+        nodes = dedup_nodes([make_node(*node) for node in NODES])
+        objects = [node.node.metadata["object"] for node in nodes]
+        assert objects == ["Arachnodactyly", "Ectopia lentis", "Ectopia lentis"]
+        assert nodes[0].node.metadata["citation"] == ["PMID:1", "PMID:4"]
+
+    def test_pack(self):
+        nodes = [make_node(*node) for node in NODES]
+        lines = ContextPacker(format="lines")
+        assert lines.pack(number_nodes(lines.select(nodes))) == (
+            "Source 1: Marfan syndrome has phenotype Arachnodactyly\n\n"
+            "Source 2: Marfan syndrome has phenotype Ectopia lentis\n\n"
+            "Source 3: Homocystinuria has phenotype Ectopia lentis"
+        )
+        packer = ContextPacker(format="subject")
+        assert packer.pack(number_nodes(packer.select(nodes))) == (
+            "Marfan syndrome:\n"
+            "Source 1: has phenotype Arachnodactyly\n"
+            "Source 2: has phenotype Ectopia lentis\n\n"
+            "Homocystinuria:\n"
+            "Source 3: has phenotype Ectopia lentis"
+        )
+        packer = ContextPacker(format="predicate")
+        assert packer.pack(number_nodes(packer.select(nodes))) == (
+            "Marfan syndrome has phenotype:\n"
+            "Source 1: Arachnodactyly\n"
+            "Source 2: Ectopia lentis\n\n"
+            "Homocystinuria has phenotype:\n"
+            "Source 3: Ectopia lentis"
+        )
+
+    def test_token_budget(self):
+        nodes = [make_node(*node) for node in NODES]
+        nodes.insert(1, make_node("Marfan syndrome", "has organization", "The Marfan Foundation " * 10, []))
+        # 6 words for the first subject and line, then 5 words per line of the same subject
+        packer = ContextPacker(token_budget=15, count_tokens=count_words)
+        selected = packer.select(nodes)
+        assert [node.node.metadata["object"] for node in selected] == ["Arachnodactyly", "Ectopia lentis"]
+        assert count_words(packer.pack(number_nodes(selected))) <= 15
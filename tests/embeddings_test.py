@@ -0,0 +1,161 @@
+import pytest
+import torch
+
+from src.embeddings import (
+    EmbeddingCache,
+    SentenceTransformerEmbeddings,
+    assign_shared_weights,
+    check_shared_weights_dtype,
+    empty_parameters,
+    get_length_buckets,
+    load_shared_weights,
+    save_shared_weights
+)
+
+
+class FakeSentenceTransformer:
+    """Embeds a text as its number of words, with one token per word."""
+
+    max_seq_length = 512
+    device = torch.device("cpu")
+
+    def __init__(self, *args, **kwargs):
+        self.batch_sizes = []
+
+    def eval(self):
+        return self
+
+    def tokenizer(self, texts, **kwargs):
+        return {"input_ids": [text.split() for text in texts]}
+
+    def encode(self, texts, **kwargs):
+        self.batch_sizes.append(len(texts))
+        return torch.tensor([[float(len(text.split()))] for text in texts])
+
+
+class PositionModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.linear = torch.nn.Linear(4, 2)
+        self.register_buffer("position_ids", torch.arange(4), persistent=False)
+
+
+class FakeCudaSentenceTransformer(PositionModel):
+    """Pretends to run on the device it is given, as the tests have no GPU."""
+
+    max_seq_length = 512
+
+    def __init__(self, model_name_or_path, device=None, **kwargs):
+        super().__init__()
+        self.device = torch.device(device)
+
+    def to(self, target):
+        if isinstance(target, torch.dtype):
+            return super().to(target)
+        self.device = torch.device(target)
+        return self
+
+
+class TestGetLengthBuckets:
+    def test_get_length_buckets_sorted(self):
+        buckets = get_length_buckets([50, 3, 20, 4], token_budget=1000)
+        assert buckets == [[1, 3, 2, 0]]
+
+    def test_get_length_buckets_budget(self):
+        buckets = get_length_buckets([512, 8, 8, 8, 512], token_budget=1024)
+        assert buckets == [[1, 2, 3], [0, 4]]
+
+    def test_get_length_buckets_covers_all_indices(self):
+        lengths = [7, 300, 12, 12, 64, 5, 512, 33]
+        buckets = get_length_buckets(lengths, token_budget=600)
+        assert sorted(i for bucket in buckets for i in bucket) == list(range(len(lengths)))
+        for bucket in buckets:
+            assert len(bucket) == 1 or len(bucket) * max(lengths[i] for i in bucket) <= 600
+
+    def test_get_length_buckets_empty(self):
+        assert get_length_buckets([], token_budget=100) == []
+
+
+class TestEmbeddingCache:
+    def test_namespaces(self):
+        cache = EmbeddingCache()
+        cache.put("query", "DMD", [1.0])
+        assert cache.get("query", "DMD") == [1.0]
+        assert cache.get("text", "DMD") is None
+
+    def test_lru_eviction(self):
+        cache = EmbeddingCache(max_size=2)
+        cache.put("text", "a", [1.0])
+        cache.put("text", "b", [2.0])
+        cache.get("text", "a")
+        cache.put("text", "c", [3.0])
+        assert cache.get("text", "a") == [1.0]
+        assert cache.get("text", "b") is None
+        assert cache.get("text", "c") == [3.0]
+
+
+class TestSharedWeights:
+    def test_save_load_shared_weights(self, tmp_path):
+        model = torch.nn.Linear(4, 2).to(torch.bfloat16)
+        path = tmp_path / "weights.safetensors"
+        save_shared_weights(model, path)
+        state_dict = load_shared_weights(path)
+        assert state_dict.keys() == model.state_dict().keys()
+        for key, tensor in model.state_dict().items():
+            assert state_dict[key].dtype == torch.bfloat16
+            assert torch.equal(state_dict[key], tensor)
+
+    def test_assign_shared_weights(self, tmp_path):
+        model = PositionModel()
+        path = tmp_path / "weights.safetensors"
+        save_shared_weights(model, path)
+        with empty_parameters():
+            empty_model = PositionModel()
+        assert empty_model.linear.weight.is_meta
+        assign_shared_weights(empty_model, load_shared_weights(path))
+        # the non-persistent buffer is not in the state dict, but is saved with the weights
+        assert torch.equal(empty_model.position_ids, model.position_ids)
+        x = torch.ones(2, 4)
+        assert torch.equal(empty_model.linear(x), model.linear(x))
+
+    def test_check_shared_weights_dtype(self, tmp_path):
+        path = tmp_path / "weights.safetensors"
+        save_shared_weights(PositionModel().to(torch.bfloat16), path)
+        check_shared_weights_dtype(load_shared_weights(path), torch.bfloat16)
+        with pytest.raises(ValueError, match="bfloat16 instead of torch.float32"):
+            check_shared_weights_dtype(load_shared_weights(path), torch.float32)
+
+
+class TestSentenceTransformerEmbeddings:
+    def test_shared_weights_on_cuda(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("src.embeddings.SentenceTransformer", FakeCudaSentenceTransformer)
+        path = tmp_path / "weights.safetensors"
+        # float16 is kept on CUDA, it is only replaced by bfloat16 on CPU
+        for _ in range(2):
+            embed_model = SentenceTransformerEmbeddings(
+                torch_dtype="float16", shared_weights_path=str(path), device="cuda"
+            )
+            assert embed_model._model.device.type == "cuda"
+            assert embed_model._model.linear.weight.dtype == torch.float16
+        assert {tensor.dtype for tensor in load_shared_weights(path).values() if tensor.is_floating_point()} == {
+            torch.float16
+        }
+
+    def test_batch_reaches_bucketing(self, monkeypatch):
+        monkeypatch.setattr("src.embeddings.SentenceTransformer", FakeSentenceTransformer)
+        calls = []
+        get_text_embeddings = SentenceTransformerEmbeddings._get_text_embeddings
+
+        def spy(self, texts):
+            calls.append(len(texts))
+            return get_text_embeddings(self, texts)
+
+        monkeypatch.setattr(SentenceTransformerEmbeddings, "_get_text_embeddings", spy)
+        embed_model = SentenceTransformerEmbeddings(embed_batch_size=100, embed_token_budget=1024, cache_size=0)
+        texts = [" ".join(["word"] * (1 + i % 7 * 40)) for i in range(100)]
+        embeddings = embed_model.get_text_embedding_batch(texts)
+        # the whole batch is bucketed at once, instead of chunks of BaseEmbedding's default batch size
+        assert calls == [100]
+        assert embeddings == [[float(len(text.split()))] for text in texts]
+        assert sum(embed_model._model.batch_sizes) == 100
+        assert len(embed_model._model.batch_sizes) < 100
@@ -24,12 +24,12 @@ class TestCustomNeo4jGraphStore:
     def test_get_rel_map_organization(self, graph_store: CustomNeo4jGraphStore):
         rel_map = graph_store.get_rel_map_organization(["CAT EYE SYNDROME"], limit=2)
         rels = rel_map["CAT EYE SYNDROME|CES|CHROMOSOME 22 PARTIAL TETRASOMY|INV DUP(22)(Q11)|SCHMID-FRACCARO SYNDROME"]
-        assert rels[0] == (
+        assert rels[0][1:] == (
             "has organization",
             "Chromosome 22 Central - US Office\nAddress: \n7108 Partinwood Drive\nCity: Fuquay-Varina\nCountry: United States\nEmail: usinfo@c22c.org\nPhone: 919-567-8167\nState: NC\nURL: http://www.c22c.org\nZipCode: 27526",
             "https://rarediseases.info.nih.gov/diseases/26/cat-eye-syndrome#:~:text=our%20About%20page.-,Patient%20Organizations,-Filter%3A",
         )
-        assert rels[1] == (
+        assert rels[1][1:] == (
             "has organization",
             "Unique – Rare Chromosome Disorder Support Group\nAddress: \nG1, The Stables\nStation Road West\nCountry: United Kingdom\nEmail: info@rarechromo.org\nPhone: +44 (0)1883 723356\nURL: https://www.rarechromo.org/",
             "https://rarediseases.info.nih.gov/diseases/26/cat-eye-syndrome#:~:text=our%20About%20page.-,Patient%20Organizations,-Filter%3A",
@@ -40,12 +40,12 @@ class TestCustomNeo4jGraphStore:
         rels = rel_map[
             "GRACILE SYNDROME|FELLMAN DISEASE|FELLMAN SYNDROME|FINNISH LACTIC ACIDOSIS WITH HEPATIC HEMOSIDEROSIS|FINNISH LETHAL NEONATAL METABOLIC SYNDROME|FLNMS|GROWTH DELAY-AMINOACIDURIA-CHOLESTASIS-IRON OVERLOAD-LACTIC ACIDOSIS-EARLY DEATH SYNDROME|GROWTH RESTRICTION-AMINOACIDURIA-CHOLESTASIS-IRON OVERLOAD-LACTIC ACIDOSIS-EARLY DEATH SYNDROME|GROWTH RETARDATION, AMINOACIDURIA, CHOLESTASIS, IRON OVERLOAD, LACTIC ACIDOSIS AND EARLY DEATH"
         ]
-        assert rels[0] == (
+        assert rels[0][1:] == (
             "has phenotype",
             "DEATH IN EARLY ADULTHOOD\nFrequency: Frequent",
             "ORPHA:53693",
         )
-        assert rels[1] == (
+        assert rels[1][1:] == (
             "has phenotype",
             "INCREASED SERUM PYRUVIC ACID|INCREASED SERUM PYRUVATE\nOnset: Neonatal onset",
             "PMID:12215968",
@@ -54,12 +54,12 @@ class TestCustomNeo4jGraphStore:
     def test_get_rel_map_prevalence(self, graph_store: CustomNeo4jGraphStore):
         rel_map = graph_store.get_rel_map_prevalence(["GRACILE SYNDROME"], limit=2)
         rels = rel_map["GRACILE SYNDROME"]
-        assert rels[0] == (
+        assert rels[0][1:] == (
             "has prevalence",
             "PrevalenceClass: 1-9 / 100 000\nPrevalenceGeographic: Finland\nPrevalenceQualification: Value and class\nPrevalenceValidationStatus: Validated\nValMoy: 2.0",
             "PMID:22970607",
         )
-        assert rels[1] == (
+        assert rels[1][1:] == (
             "has prevalence",
             "PrevalenceClass: <1 / 1 000 000\nPrevalenceGeographic: Finland\nPrevalenceQualification: Class only\nPrevalenceValidationStatus: Not yet validated",
             "PMID:22970607",
@@ -68,12 +68,12 @@ class TestCustomNeo4jGraphStore:
     def test_get_rel_map_rel(self, graph_store: CustomNeo4jGraphStore):
         rel_map = graph_store.get_rel_map(["GRACILE SYNDROME"], limit=1)
         rels = rel_map["GRACILE SYNDROME"]
-        assert rels[0] == (
+        assert rels[0][1:] == (
             "has allelic variant",
             "BCS1L|GENE:617|HGNC:1020|OMIM:603647\nInterpretation: Conflicting interpretations of pathogenicity",
             "PMID:17403714|UMLS:C1864002",
         )
-        assert rels[1] == (
+        assert rels[1][1:] == (
             "mapped to",
             "MITOCHONDRIAL METABOLISM DISEASE",
             "UMLS:C1864002",
@@ -82,7 +82,7 @@ class TestCustomNeo4jGraphStore:
     def test_get_rel_map_pubtator3(self, graph_store: CustomNeo4jGraphStore):
         rel_map = graph_store.get_rel_map_pubtator3(["GRACILE SYNDROME"], limit=1)
         rels = rel_map['Fellman disease|Fellman syndrome|GAD|GRACILE|GRACILE Syndrome|GRACILE syndrome|GRACILE-like|GRACILE-like condition|GRACILE-like disorder|GRACILE-like syndrome|Gracile axonal dystrophy|Gracile syndrome|and early death (GRACILE) syndrome|atrophy of gracile and cuneate nuclei|degeneration of the gracile nucleus and|gad|gracile|gracile axonal dystrophy|gracile fasciculi|gracile fasciculus|gracile syndrome|spinal gracile axonal dystrophy|tuberculum gracile']
-        assert rels[0] == (
+        assert rels[0][1:] == (
             "associate",
             "protein gene product 9.5",
             "PMID:14648596",
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from src.pubmed import AsyncPubMedClient, FileBackend, PubMedBackend, PubMedCache, TokenBucket, parse_summary
+
+ARTICLE = """<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID>
+<Article>
+<Journal><Title>Journal of cardiac failure</Title><JournalIssue><PubDate><Year>2001</Year></PubDate></JournalIssue></Journal>
+<ArticleTitle>Title {pmid}</ArticleTitle>
+<AuthorList><Author><LastName>Jakobs</LastName><ForeName>P M</ForeName><Initials>PM</Initials></Author></AuthorList>
+</Article>
+<MedlineJournalInfo><MedlineTA>J Card Fail</MedlineTA></MedlineJournalInfo>
+</MedlineCitation></PubmedArticle>"""
+
+
+class CountingBackend(FileBackend):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.requests = []
+
+    async def fetch(self, pmids):
+        self.requests.append(pmids)
+        await asyncio.sleep(0.01)
+        return await super().fetch(pmids)
+
+
+def write_articles(directory, pmids):
+    for pmid in pmids:
+        (directory / f"{pmid}.xml").write_text(ARTICLE.format(pmid=pmid))
+
+
+class TestPubMed:
+    def test_parse_summary(self):
+        assert parse_summary(ARTICLE.format(pmid=11561226)) == {
+            "title": "Title 11561226",
+            "journal": "J Card Fail",
+            "year": "2001",
+            "authors": ["Jakobs PM"],
+        }
+
+    def test_fetch_articles(self, tmp_path):
+        write_articles(tmp_path, [1, 2])
+        client = AsyncPubMedClient(FileBackend(tmp_path))
+        articles = asyncio.run(client.fetch_articles(["1", 2, 3]))
+        assert sorted(articles) == [1, 2]
+        assert parse_summary(articles[2])["title"] == "Title 2"
+
+    def test_coalesce_requests(self, tmp_path):
+        write_articles(tmp_path, [1, 2])
+        backend = CountingBackend(tmp_path)
+        client = AsyncPubMedClient(backend)
+
+        async def fetch():
+            return await asyncio.gather(*(client.fetch_article(pmid) for pmid in [1, 1, 2, 1]))
+
+        articles = asyncio.run(fetch())
+        assert [parse_summary(article)["title"] for article in articles] == ["Title 1", "Title 1", "Title 2", "Title 1"]
+        assert sorted(pmid for request in backend.requests for pmid in request) == [1, 2]
+
+    def test_cache(self, tmp_path):
+        write_articles(tmp_path, [1])
+        backend = CountingBackend(tmp_path)
+        cache = PubMedCache(tmp_path / "pubmed_cache.sqlite")
+        asyncio.run(AsyncPubMedClient(backend, cache=cache).fetch_article(1))
+        # a new process, with the same cache file
+        cache = PubMedCache(tmp_path / "pubmed_cache.sqlite")
+        article = asyncio.run(AsyncPubMedClient(backend, cache=cache).fetch_article(1))
+        assert parse_summary(article)["title"] == "Title 1"
+        assert backend.requests == [[1]]
+        assert len(cache) == 1
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=50)
+
+        async def acquire():
+            for _ in range(6):
+                await bucket.acquire()
+
+        start = time.monotonic()
+        asyncio.run(acquire())
+        # the first token is available immediately, the other 5 take 1 / 50 s each
+        assert time.monotonic() - start >= 0.09
+
+    def test_rate_limit(self, tmp_path):
+        class RateLimitedBackend(CountingBackend):
+            requests_per_second = 50
+            batch_size = 1
+
+        write_articles(tmp_path, [1, 2, 3])
+        client = AsyncPubMedClient(RateLimitedBackend(tmp_path))
+        start = time.monotonic()
+        assert len(asyncio.run(client.fetch_articles([1, 2, 3]))) == 3
+        assert time.monotonic() - start >= 0.04
+        assert isinstance(client.backend, PubMedBackend)
@@ -4,6 +4,8 @@ import pytest
 from conftest import GITHUB_ACTIONS
 
 from pipelines import get_retriever_pipeline
+from retrievers import triple_to_node
+from textualize import KnowledgeTriple
 
 
 @pytest.fixture
@@ -11,6 +13,19 @@ def retriever():
     return get_retriever_pipeline()
 
 
+class TestTripleToNode:
+    def test_triple_to_node(self):
+        triple = KnowledgeTriple("GRACILE SYNDROME", "has phenotype", "DEATH IN EARLY ADULTHOOD", "ORPHA:53693|PMID:1")
+        node = triple_to_node(triple, score=0.5)
+        assert node.text == "GRACILE SYNDROME has phenotype DEATH IN EARLY ADULTHOOD"
+        assert node.score == 0.5
+        assert node.metadata["citation"] == ["ORPHA:53693", "PMID:1"]
+
+    def test_triple_to_node_no_citation(self):
+        node = triple_to_node(KnowledgeTriple("PKU", "treat", "Sapropterin", ""))
+        assert node.metadata["citation"] == []
+
+
 @pytest.mark.skipif(GITHUB_ACTIONS, reason="This test won't run in Github Actions")
 class TestKG_RAG_KnowledgeGraphRAGRetriever:
     def test_organizations(self, retriever):
@@ -0,0 +1,58 @@
+import os
+import threading
+
+import pytest
+
+from src.source_graph import SourceGraphStore
+
+EDGES = [("Duchenne muscular dystrophy", "has phenotype", "Muscle weakness")]
+
+
+class FakeRenderer:
+    """Writes the edges as text instead of calling Graphviz."""
+
+    def __init__(self, size=100):
+        self.size = size
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, edges, path, format):
+        self.calls += 1
+        self.release.wait()
+        path.write_text(repr(edges).ljust(self.size))
+
+
+class TestSourceGraphStore:
+    def test_cache(self, tmp_path):
+        render = FakeRenderer()
+        store = SourceGraphStore(tmp_path, render=render)
+        path = store.submit(EDGES).result()
+        assert path.endswith(".png") and os.path.exists(path)
+        # the same edge set, in a different order and with duplicates, is not rendered again
+        assert store.submit(EDGES + EDGES[::-1]).result() == path
+        assert render.calls == 1
+        assert store.submit(EDGES, format="svg").result().endswith(".svg")
+        assert render.calls == 2
+
+    def test_coalesce(self, tmp_path):
+        render = FakeRenderer()
+        render.release.clear()
+        store = SourceGraphStore(tmp_path, render=render)
+        futures = [store.submit(EDGES) for _ in range(3)]
+        render.release.set()
+        assert len({future.result() for future in futures}) == 1
+        assert render.calls == 1
+
+    def test_evict(self, tmp_path):
+        store = SourceGraphStore(tmp_path, max_bytes=250, render=FakeRenderer(size=100))
+        paths = [store.submit([(f"disease {i}", "has phenotype", "phenotype")]).result() for i in range(2)]
+        # make the second graph the least recently used, and use the first one again
+        os.utime(paths[1], (0, 0))
+        store.submit([("disease 0", "has phenotype", "phenotype")]).result()
+        newest = store.submit([("disease 2", "has phenotype", "phenotype")]).result()
+        assert sorted(tmp_path.iterdir()) == sorted(map(type(tmp_path), [paths[0], newest]))
+
+    def test_unsupported_format(self, tmp_path):
+        with pytest.raises(ValueError):
+            SourceGraphStore(tmp_path, render=FakeRenderer()).submit(EDGES, format="jpg")
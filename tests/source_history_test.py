@@ -0,0 +1,36 @@
+from src.chat_engine.source_history import SourceHistory
+
+
+def add_turn(history, size):
+    window = [f"Source {history.next_source_number()}" for _ in range(size)]
+    history.add_window(window)
+    return window
+
+
+class TestSourceHistory:
+    def test_max_turns(self):
+        history = SourceHistory(max_turns=2, max_nodes=None)
+        first = add_turn(history, 2)
+        second = add_turn(history, 2)
+        assert history.nodes == first + second
+        third = add_turn(history, 1)
+        # numbering continues after the sources that were dropped
+        assert history.nodes == second + third == ["Source 3", "Source 4", "Source 5"]
+
+    def test_max_nodes(self):
+        history = SourceHistory(max_turns=None, max_nodes=3)
+        add_turn(history, 2)
+        second = add_turn(history, 1)
+        assert len(history.nodes) == 3
+        third = add_turn(history, 2)
+        assert history.nodes == second + third
+        # the current turn is kept even if it is above the limit
+        fourth = add_turn(history, 5)
+        assert history.nodes == fourth
+
+    def test_reset(self):
+        history = SourceHistory()
+        add_turn(history, 2)
+        history.reset()
+        assert history.nodes == []
+        assert add_turn(history, 1) == ["Source 1"]
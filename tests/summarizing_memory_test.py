@@ -0,0 +1,57 @@
+import asyncio
+
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.llms import MockLLM
+
+from src.chat_engine.summarizing_memory import SUMMARY_ACKNOWLEDGEMENT, SUMMARY_MESSAGE_PREFIX, SummarizingChatMemory
+
+
+def add_turns(memory, start, stop):
+    for i in range(start, stop):
+        memory.put(ChatMessage(role=MessageRole.USER, content=f"question {i}"))
+        memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=f"answer {i}"))
+
+
+class TestSummarizingChatMemory:
+    def test_summarize(self):
+        memory = SummarizingChatMemory.from_defaults(llm=MockLLM(max_tokens=2), verbatim_turns=2)
+        add_turns(memory, 0, 2)
+        memory.summarize()
+        assert memory.summary == "" and len(memory.get()) == 4
+
+        add_turns(memory, 2, 5)
+        memory.summarize()
+        messages = memory.get()
+        assert messages[0].content == SUMMARY_MESSAGE_PREFIX + "text text"
+        assert messages[1].content == SUMMARY_ACKNOWLEDGEMENT
+        assert [message.content for message in messages[2:]] == ["question 3", "answer 3", "question 4", "answer 4"]
+        # after the system message of the chat engine, chat templates expect alternating user and assistant messages
+        assert [message.role for message in messages] == [MessageRole.USER, MessageRole.ASSISTANT] * 3
+        # the whole history is kept
+        assert len(memory.get_all()) == 10
+
+    def test_schedule_summary(self):
+        memory = SummarizingChatMemory.from_defaults(llm=MockLLM(max_tokens=2), verbatim_turns=1)
+
+        async def chat():
+            add_turns(memory, 0, 2)
+            # the summary is not ready until the task has run, until then the history is given verbatim
+            task = memory.schedule_summary()
+            assert len(memory.get()) == 4
+            await task
+            return memory.get()
+
+        messages = asyncio.run(chat())
+        assert [message.content for message in messages[2:]] == ["question 1", "answer 1"]
+        assert memory.summarized_count == 2
+        # without a running event loop, the summary is updated on a worker thread
+        add_turns(memory, 2, 3)
+        memory.schedule_summary().result()
+        assert memory.summarized_count == 4
+
+    def test_reset(self):
+        memory = SummarizingChatMemory.from_defaults(llm=MockLLM(max_tokens=2), verbatim_turns=1)
+        add_turns(memory, 0, 3)
+        memory.summarize()
+        memory.reset()
+        assert memory.get() == [] and memory.summary == ""
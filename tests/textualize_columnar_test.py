@@ -0,0 +1,42 @@
+import pandas as pd
+
+from src.textualize import textualize_organizations, textualize_phenotypes, textualize_prevelances, textualize_rels
+from src.textualize_columnar import (
+    textualize_organizations_df,
+    textualize_phenotypes_df,
+    textualize_prevalences_df,
+    textualize_rels_df
+)
+
+
+class TestTextualizeColumnar:
+    def test_textualize_phenotypes_df(self):
+        phenotypes = [
+            {"n__N_Name": "GRACILE SYNDROME", "m__N_Name": "DEATH IN EARLY ADULTHOOD", "r_Frequency": "HP:0040282", "r_Onset": None, "r_Reference": "[ORPHA:53693]"},
+            {"n__N_Name": "GRACILE SYNDROME", "m__N_Name": "INCREASED SERUM PYRUVATE", "r_Frequency": "", "r_Onset": [3623], "r_Reference": "[PMID:12215968,Orphanet:53693]"},
+            {"n__N_Name": "FLNMS", "m__N_Name": "", "r_Frequency": "", "r_Onset": "", "r_Reference": ""},
+        ]
+        assert textualize_phenotypes_df(pd.DataFrame(phenotypes, dtype=object)) == textualize_phenotypes(phenotypes)
+
+    def test_textualize_prevalences_df(self):
+        prevalences = [
+            {"m__N_Name": "GRACILE SYNDROME", "n_PrevalenceClass": "1-9 / 100 000", "n_PrevalenceGeographic": "Finland", "n_PrevalenceQualification": "Value and class", "n_PrevalenceValidationStatus": "Validated", "n_Source": "22970607[PMID]", "n_ValMoy": 2.0},
+            {"m__N_Name": "GRACILE SYNDROME", "n_PrevalenceClass": "<1 / 1 000 000", "n_PrevalenceGeographic": None, "n_PrevalenceQualification": "", "n_PrevalenceValidationStatus": "", "n_Source": None, "n_ValMoy": 0.0},
+            {"m__N_Name": "GRACILE SYNDROME", "n_PrevalenceClass": None, "n_PrevalenceGeographic": "", "n_PrevalenceQualification": "", "n_PrevalenceValidationStatus": "", "n_Source": "", "n_ValMoy": None},
+        ]
+        assert textualize_prevalences_df(pd.DataFrame(prevalences, dtype=object)) == textualize_prevelances(prevalences)
+
+    def test_textualize_organizations_df(self):
+        organizations = [
+            {"m__N_Name": "CAT EYE SYNDROME|CES", "m__I_CODE": "OMIM:115470|ORPHA:195", "n_Address1": "7108 Partinwood Drive", "n_Address2": "", "n_City": "Fuquay-Varina", "n_Country": "United States", "n_Email": "usinfo@c22c.org", "n_Fax": "", "n_Name": "Chromosome 22 Central - US Office", "n_Phone": "919-567-8167", "n_State": "NC", "n_TollFree": None, "n_URL": "http://www.c22c.org", "n_ZipCode": "27526  "},
+            {"m__N_Name": "CAT EYE SYNDROME|CES", "m__I_CODE": "OMIM:115470|ORPHA:195", "n_Address1": "", "n_Address2": "", "n_City": "", "n_Country": "", "n_Email": "", "n_Fax": "", "n_Name": "", "n_Phone": "", "n_State": "", "n_TollFree": "", "n_URL": "", "n_ZipCode": ""},
+        ]
+        assert textualize_organizations_df(pd.DataFrame(organizations, dtype=object)) == textualize_organizations(organizations)
+
+    def test_textualize_rels_df(self):
+        rels = [
+            {"n__N_Name": "GRACILE SYNDROME", "n__I_GENE": None, "m__N_Name": "BCS1L", "m__I_GENE": "GENE:617|HGNC:1020", "r_citations": "[PMID:17403714]", "r_interpretation": "Pathogenic", "r_name": "has_allelic_variant", "r_value": "UMLS:C1864002"},
+            {"n__N_Name": None, "n__I_GENE": "BCS1L", "m__N_Name": "MITOCHONDRIAL METABOLISM DISEASE", "m__I_GENE": None, "r_citations": None, "r_interpretation": None, "r_name": ["mapped_to", "is_a"], "r_value": "UMLS:C1864002"},
+            {"n__N_Name": "GRACILE SYNDROME", "n__I_GENE": None, "m__N_Name": "", "m__I_GENE": "", "r_citations": "", "r_interpretation": "", "r_name": "mapped_to", "r_value": ""},
+        ]
+        assert textualize_rels_df(pd.DataFrame(rels, dtype=object)) == textualize_rels(rels)
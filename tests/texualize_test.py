@@ -1,10 +1,15 @@
 from src.textualize import (
+    HPO_FREQUENCY,
+    HPO_NAMES,
+    HPO_ONSET,
+    build_hpo_name_table,
     cite_organization,
     get_list,
     lookup_hpo_name,
     lookup_hpo_names,
     textualize_organization,
     textualize_phenotype,
+    textualize_phenotypes,
     textualize_prevalence
 )
 
@@ -22,6 +27,13 @@ class TestTextualize:
         name = lookup_hpo_name("31/56")
         assert name == "31/56"
 
+    def test_lookup_hpo_name_not_in_table(self):
+        name = lookup_hpo_name("HP:0001250")
+        assert name == "Seizure"
+
+    def test_hpo_names_table(self):
+        assert HPO_NAMES == build_hpo_name_table(HPO_FREQUENCY, HPO_ONSET)
+
     def test_lookup_hpo_names(self):
         names = lookup_hpo_names([40281, "HP:0040281"])
         assert names == ["Very frequent", "Very frequent"]
@@ -163,3 +175,30 @@ class TestTextualize:
     def test_get_list_multiple(self):
         citations = get_list("[PMID:12215968,ORPHA:53693]")
         assert citations == ["PMID:12215968", "ORPHA:53693"]
+
+    def test_textualize_phenotypes_precomputed(self):
+        phenotypes = [
+            {
+                "n__N_Name": "GRACILE SYNDROME",
+                "m__N_Name": "ELEVATED SERUM FERRITIN",
+                "r_Frequency": "HP:0040281",
+                "r_Onset": "",
+                "r_Reference": "[ORPHA:53693]",
+                "r__Text": "ELEVATED SERUM FERRITIN\nFrequency: Very frequent",
+                "r__Citation": "ORPHA:53693",
+            },
+            {
+                "n__N_Name": "GRACILE SYNDROME",
+                "m__N_Name": "DEATH IN EARLY ADULTHOOD",
+                "r_Frequency": "",
+                "r_Onset": "",
+                "r_Reference": "[ORPHA:53693]",
+                "r__Text": None,
+                "r__Citation": None,
+            },
+        ]
+        rel_map = textualize_phenotypes(phenotypes)
+        assert rel_map["GRACILE SYNDROME"] == [
+            ("GRACILE SYNDROME", "has phenotype", "ELEVATED SERUM FERRITIN\nFrequency: Very frequent", "ORPHA:53693"),
+            ("GRACILE SYNDROME", "has phenotype", "DEATH IN EARLY ADULTHOOD", "ORPHA:53693"),
+        ]